@@ -0,0 +1,55 @@
+"""Times loading large scripts with a cold and a warm .scbc cache
+
+    python benchmarks/bench_bytecache.py --size 100000 --size 1000000
+
+Cold loads find no cache file, so they lex, parse, compile and write one;
+warm loads read the program back from it. Also reports the sizes of the
+source and of its cache file.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from corpus import generate_source
+from scarab.program import cache_path, load_file
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, action="append", help="source size in characters")
+    parser.add_argument("--optimize", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'source kB':>10} {'cache kB':>10} {'cold ms':>10} {'warm ms':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.size or [100_000, 1_000_000]:
+            path = os.path.join(directory, f"script{size}.scarab")
+            with open(path, "w") as file:
+                file.write(generate_source(size))
+            cached = cache_path(path, args.optimize)
+
+            def cold():
+                if os.path.exists(cached):
+                    os.remove(cached)
+                load_file(path, args.optimize)
+
+            cold_time = best_time(cold, args.repeat)
+            warm_time = best_time(lambda: load_file(path, args.optimize), args.repeat)
+            print(f"{os.path.getsize(path) / 1e3:10.1f} {os.path.getsize(cached) / 1e3:10.1f}"
+                  f" {cold_time * 1e3:10.3f} {warm_time * 1e3:10.3f} {cold_time / warm_time:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
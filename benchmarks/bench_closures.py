@@ -0,0 +1,46 @@
+"""Compares the closure engine against VM.run on corpus.PROGRAMS
+
+    python benchmarks/bench_closures.py --optimize 3
+
+Reports the time to compile each program into closures, the best time to
+run them and the best time of VM.run with the default engine.
+"""
+
+import argparse
+import time
+
+from corpus import PROGRAMS
+from scarab import Parser, Compiler, VM
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--optimize", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'program':>10} {'blocks':>8} {'compile ms':>11} {'closure ms':>11} {'run ms':>10} {'speedup':>8}")
+    for name, source in PROGRAMS.items():
+        compiler = Compiler(Parser(source), optimize=args.optimize)
+        compiler.compile()
+        code, constants = compiler.code, compiler.constants
+
+        blocks = len(VM(code, constants, capture=True).compile_closures(list()))
+        compiling = best_time(lambda: VM(code, constants, capture=True).compile_closures(list()), args.repeat)
+        closures = best_time(lambda: VM(code, constants, capture=True, engine="closure").run(), args.repeat)
+        run = best_time(lambda: VM(code, constants, capture=True).run(), args.repeat)
+        print(f"{name:>10} {blocks:>8} {compiling * 1e3:11.3f} {closures * 1e3:11.3f} {run * 1e3:10.3f}"
+              f" {run / closures:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
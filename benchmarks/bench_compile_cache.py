@@ -0,0 +1,64 @@
+"""Times compiling small snippets that repeat, with and without a CompileCache
+
+    python benchmarks/bench_compile_cache.py --calls 20000 --distinct 50 --threads 4
+
+Each call compiles one of --distinct snippets, picked at random, and runs it
+on a new VM; --threads threads make the calls together, sharing one cache.
+"""
+
+import argparse
+import random
+import threading
+import time
+
+from scarab.program import Program, CompileCache
+
+SNIPPETS = [
+    'x := {n} print x * 2 + 1',
+    'print "item " + "{n}"',
+    'if {n} > 10 print "big" else print "small"',
+    'do i := 0 t := 0 while i < 5 do t = t + i * {n} i = i + 1 end print t end',
+]
+
+
+def elapsed(calls, threads: int) -> float:
+    """Seconds to make calls spread over threads"""
+    workers = [threading.Thread(target=lambda part=part: [call() for call in part])
+               for part in (calls[i::threads] for i in range(threads))]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=10_000)
+    parser.add_argument("--distinct", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--optimize", type=int, default=2)
+    parser.add_argument("--max-bytes", type=int, default=2 ** 20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    sources = [SNIPPETS[n % len(SNIPPETS)].format(n=n) for n in range(args.distinct)]
+    picks = [rng.choice(sources) for _ in range(args.calls)]
+    cache = CompileCache(args.max_bytes)
+
+    def uncached(source):
+        return lambda: Program.compile(source, args.optimize).vm(capture=True).run()
+
+    def cached(source):
+        return lambda: cache.compile(source, args.optimize).vm(capture=True).run()
+
+    uncached_time = elapsed([uncached(source) for source in picks], args.threads)
+    cached_time = elapsed([cached(source) for source in picks], args.threads)
+    print(f"{'calls':>8} {'uncached ms':>12} {'cached ms':>10} {'speedup':>8}")
+    print(f"{args.calls:>8} {uncached_time * 1e3:12.1f} {cached_time * 1e3:10.1f} {uncached_time / cached_time:7.1f}x")
+    print(cache.stats)
+
+
+if __name__ == '__main__':
+    main()
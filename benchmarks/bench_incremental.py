@@ -0,0 +1,55 @@
+"""Compares recompiling from scratch against IncrementalCompiler.edit for growing sources
+
+    python benchmarks/bench_incremental.py --sizes 10000,100000,1000000
+
+Each edit rewrites one integer literal in the middle of the source; its
+latency should stay flat while the full compile grows with the source.
+"""
+
+import argparse
+import re
+import time
+
+from corpus import generate_source
+from scarab import Lexer, Compiler, IncrementalCompiler
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def full_compile(source: str):
+    compiler = Compiler(Lexer(source))
+    compiler.compile()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated source sizes in characters")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'chars':>10} {'full ms':>10} {'edit ms':>10}")
+    for size in map(int, args.sizes.split(",")):
+        source = generate_source(size)
+        full = best_time(lambda: full_compile(source), args.repeat)
+
+        incremental = IncrementalCompiler(source)
+        literal = re.compile(r"\d+").search(source, len(source) // 2)
+        offset = literal.start()
+        digits = iter("123456789" * args.repeat)
+
+        def edit():
+            incremental.edit(offset, 1, next(digits))
+
+        latency = best_time(edit, args.repeat)
+        print(f"{len(source):>10} {full * 1e3:10.3f} {latency * 1e3:10.3f}")
+
+
+if __name__ == '__main__':
+    main()
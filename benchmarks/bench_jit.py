@@ -0,0 +1,54 @@
+"""Times the tracing engine with and without compiling hot loops on corpus.PROGRAMS
+
+    python benchmarks/bench_jit.py --threshold 50
+
+Reports the best time with the JIT off and on, how much of the latter was
+spent in compiled loops and compiling them, and how often a compiled loop
+was entered and refused by its guards.
+"""
+
+import argparse
+import time
+
+from corpus import PROGRAMS
+from scarab import Parser, Compiler, VM
+from scarab.vm import JIT_THRESHOLD
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--optimize", type=int, default=2)
+    parser.add_argument("--threshold", type=int, default=JIT_THRESHOLD)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'program':>10} {'off ms':>10} {'on ms':>10} {'in loops ms':>12} {'compile ms':>11}"
+          f" {'entered':>8} {'refused':>8}")
+    for name, source in PROGRAMS.items():
+        compiler = Compiler(Parser(source), optimize=args.optimize)
+        compiler.compile()
+
+        def run(jit):
+            vm = VM(compiler.code, compiler.constants, capture=True, engine="tracing", jit=jit,
+                    jit_threshold=args.threshold)
+            vm.run()
+            return vm
+
+        off = best_time(lambda: run(False), args.repeat)
+        on = best_time(lambda: run(True), args.repeat)
+        stats = run(True).jit_stats
+        print(f"{name:>10} {off * 1e3:10.3f} {on * 1e3:10.3f} {stats['seconds'] * 1e3:12.3f}"
+              f" {stats['compile_seconds'] * 1e3:11.3f} {stats['entered']:>8} {stats['guard_failures']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Measures lexer throughput in MB/s for each lexer engine
+
+    python benchmarks/bench_lexer.py --size 4000000
+
+The "-file" engines read the source back from a temporary file in chunks and
+also report the peak memory traced while lexing it.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from corpus import generate_source
+from scarab import Parser, Lexer
+
+ENGINES = {
+    "parser": lambda source, path: Parser(source),
+    "lexer": lambda source, path: Lexer(source),
+    "parser-file": lambda source, path: Parser.from_file(path),
+    "lexer-file": lambda source, path: Lexer.from_file(path),
+}
+
+
+def measure(engine, source: str, path: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in engine(source, path):
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(engine, source: str, path: str) -> int:
+    tracemalloc.start()
+    try:
+        for _ in engine(source, path):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000, help="source size in characters")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", choices=ENGINES, action="append")
+    args = parser.parse_args()
+
+    source = generate_source(args.size)
+    megabytes = len(source.encode()) / 1e6
+    with tempfile.NamedTemporaryFile("w", suffix=".scarab", delete=False) as file:
+        file.write(source)
+    try:
+        for name in args.engine or ENGINES:
+            engine = ENGINES[name]
+            seconds = measure(engine, source, file.name, args.repeat)
+            line = f"{name:<12} {megabytes:8.2f} MB {seconds:8.3f} s {megabytes / seconds:8.2f} MB/s"
+            if name.endswith("-file"):
+                line += f" {peak_memory(engine, source, file.name) / 1e6:8.2f} MB peak"
+            print(line)
+    finally:
+        os.unlink(file.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Times compiling deeply nested programs with many locals in scope
+
+    python benchmarks/bench_locals.py --shapes 4x64,16x64,64x64,8x1000
+
+Each shape is depthxwidth: blocks nested depth deep that each declare width
+locals. Resolving a name should cost the same however many locals are in
+scope, so the time per local should stay flat.
+"""
+
+import argparse
+import time
+
+from corpus import nested_source
+from scarab import Lexer, Compiler
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compile_source(source: str):
+    compiler = Compiler(Lexer(source))
+    compiler.compile()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", default="4x64,16x64,64x64,8x1000", help="comma separated depthxwidth")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'shape':>10} {'locals':>8} {'compile ms':>12} {'us/local':>10}")
+    for shape in args.shapes.split(","):
+        depth, width = map(int, shape.split("x"))
+        source = nested_source(depth, width)
+        elapsed = best_time(lambda: compile_source(source), args.repeat)
+        count = depth * width
+        print(f"{shape:>10} {count:>8} {elapsed * 1e3:12.3f} {elapsed * 1e6 / count:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Measures the speedup of lex_parallel over serial lexing for each process count
+
+    python benchmarks/bench_parallel.py --size 16000000
+
+Pools are started and warmed up before timing, so the numbers show the cost
+of lexing and shipping columns back, not of spawning processes.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from corpus import generate_source
+from scarab import TokenBuffer, lex_parallel
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=4_000_000, help="source size in characters")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    source = generate_source(args.size)
+    megabytes = len(source.encode()) / 1e6
+    serial = best_time(lambda: TokenBuffer(source), args.repeat)
+    print(f"{'serial':<12} {serial:8.3f} s {megabytes / serial:8.2f} MB/s")
+
+    processes = 1
+    while processes <= args.max_processes:
+        chunk_size = max(len(source) // (processes * 4), 1)
+        with ProcessPoolExecutor(processes) as pool:
+            list(pool.map(abs, range(processes)))
+            seconds = best_time(lambda: lex_parallel(source, chunk_size=chunk_size, executor=pool), args.repeat)
+        print(f"{processes:>3} process  {seconds:8.3f} s {megabytes / seconds:8.2f} MB/s {serial / seconds:6.2f}x")
+        processes *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Compares bytecode size and run time with and without the peephole pass
+
+    python benchmarks/bench_peephole.py --size 100000
+
+Counts instructions at optimize=1 and optimize=2 for a generated source and
+for each program in corpus.PROGRAMS, and times running the programs.
+"""
+
+import argparse
+import time
+
+from corpus import generate_source, PROGRAMS
+from scarab import Parser, Compiler, VM
+from scarab.compiler import instructions
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compile_source(source: str, optimize: int) -> Compiler:
+    compiler = Compiler(Parser(source), optimize=optimize)
+    compiler.compile()
+    return compiler
+
+
+def run(compiler: Compiler):
+    VM(compiler.code, compiler.constants, capture=True).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100_000, help="characters of generated source")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'program':>10} {'before':>8} {'after':>8} {'run ms':>10} {'opt ms':>10}")
+    sources = {"generated": generate_source(args.size), **PROGRAMS}
+    for name, source in sources.items():
+        before = compile_source(source, optimize=1)
+        after = compile_source(source, optimize=2)
+        counts = [sum(1 for _ in instructions(compiler.code)) for compiler in (before, after)]
+        if name == "generated":
+            print(f"{name:>10} {counts[0]:>8} {counts[1]:>8}")
+            continue
+        times = [best_time(lambda: run(compiler), args.repeat) for compiler in (before, after)]
+        print(f"{name:>10} {counts[0]:>8} {counts[1]:>8} {times[0] * 1e3:10.3f} {times[1] * 1e3:10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Profiles VM.run per op on corpus.PROGRAMS and reports the profiler's overhead
+
+    python benchmarks/bench_profile.py --sample 20 --json profile.json --collapsed profile.folded
+
+Prints the ops that took the most time over all programs, then the time of
+each program on run_table, profiled exactly and profiled by sampling. With
+--lines, the source lines of the last program that took the most time follow.
+The JSON and collapsed stack files hold the profile of the last program.
+"""
+
+import argparse
+import time
+from collections import Counter
+
+from corpus import PROGRAMS
+from scarab import Parser, Compiler, VM
+from scarab.profiler import Profiler
+
+
+def elapsed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--optimize", type=int, default=2)
+    parser.add_argument("--sample", type=int, default=20)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--lines", action="store_true", help="print the slowest lines of the last program")
+    parser.add_argument("--json", help="file to write the JSON profile to")
+    parser.add_argument("--collapsed", help="file to write the collapsed stacks to")
+    args = parser.parse_args()
+
+    seconds = Counter()
+    counts = Counter()
+    rows = list()
+    for name, source in PROGRAMS.items():
+        compiler = Compiler(Parser(source), optimize=args.optimize)
+        compiler.compile()
+
+        def vm():
+            return VM(compiler.code, compiler.constants, capture=True, engine="table")
+
+        exact = Profiler()
+        sampled = Profiler(args.sample)
+        rows.append((name, elapsed(lambda: vm().run()), elapsed(lambda: exact.run(vm())),
+                     elapsed(lambda: sampled.run(vm()))))
+        for op, entry in exact.by_op().items():
+            seconds[op] += entry["seconds"]
+            counts[op] += entry["count"]
+
+    print(f"{'op':>24} {'count':>10} {'ms':>10}")
+    for op, total in seconds.most_common(args.top):
+        print(f"{op:>24} {counts[op]:>10} {total * 1e3:10.3f}")
+    print()
+    print(f"{'program':>10} {'table ms':>10} {'exact ms':>10} {'sampled ms':>11}")
+    for name, plain, exact_time, sampled_time in rows:
+        print(f"{name:>10} {plain * 1e3:10.3f} {exact_time * 1e3:10.3f} {sampled_time * 1e3:11.3f}")
+
+    if args.lines:
+        print()
+        print(f"{'line':>6} {'count':>10} {'ms':>10}  {name}")
+        source_lines = source.splitlines()
+        slowest = sorted(exact.by_line(compiler.line_table), key=lambda entry: -entry["seconds"])
+        for entry in slowest[:args.top]:
+            text = source_lines[entry["line"] - 1].strip() if entry["line"] else ""
+            print(f"{entry['line']:>6} {entry['count']:>10} {entry['seconds'] * 1e3:10.3f}  {text}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            file.write(exact.to_json(compiler.line_table, indent=2))
+    if args.collapsed:
+        with open(args.collapsed, "w") as file:
+            file.write(exact.collapsed())
+
+
+if __name__ == '__main__':
+    main()
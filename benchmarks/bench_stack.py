@@ -0,0 +1,62 @@
+"""Times VM.run on programs that mostly push and pop expression operands
+
+    python benchmarks/bench_stack.py --repeat 5
+
+Reports the stack depth the Compiler computed for each program, the time to
+construct a VM and the best time to run it, also with the code marked as
+verified by scarab.verifier.verify, which runs it on an UncheckedStack.
+"""
+
+import argparse
+import time
+
+from scarab import Parser, Compiler, VM
+from scarab.verifier import verify
+
+
+def nested(depth: int) -> str:
+    """An expression whose operands all stay on the stack until its innermost one is pushed"""
+    return "(1 + " * depth + "1" + ")" * depth
+
+
+# Expression statements run from a loop, so the stack is filled and emptied again each iteration
+PROGRAMS = {
+    "flat": 'i := 0\nwhile i < 2000 do\n  print 1 + 2 * 3 - 4 + 5 * 6 - 7 + 8 * 9\n  i = i + 1\nend\n',
+    "nested": f'i := 0\nwhile i < 2000 do\n  print {nested(30)}\n  i = i + 1\nend\n',
+    "locals": (
+        'do\n  i := 0\n  a := 1\n  b := 2\n'
+        '  while i < 2000 do\n    print (a + b) * (a - b) + (b * b - a * a)\n    i = i + 1\n  end\nend\n'
+    ),
+    "strings": 'i := 0\nwhile i < 2000 do\n  print "a" + ("b" + ("c" + ("d" + "e")))\n  i = i + 1\nend\n',
+}
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'program':>10} {'max stack':>10} {'vm us':>8} {'run ms':>10} {'verify ms':>10} {'verified ms':>12}")
+    for name, source in PROGRAMS.items():
+        compiler = Compiler(Parser(source))
+        compiler.compile()
+        code, constants, max_stack = compiler.code, compiler.constants, compiler.max_stack
+        construct = best_time(lambda: VM(code, constants, capture=True, max_stack=max_stack), args.repeat)
+        run = best_time(lambda: VM(code, constants, capture=True, max_stack=max_stack).run(), args.repeat)
+        checking = best_time(lambda: verify(code, constants), args.repeat)
+        verified = best_time(lambda: VM(code, constants, capture=True, verified=True).run(), args.repeat)
+        print(f"{name:>10} {max_stack:>10} {construct * 1e6:8.1f} {run * 1e3:10.3f} {checking * 1e3:10.3f}"
+              f" {verified * 1e3:12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Times Parser, Compiler.compile and VM.run on representative programs and tracks regressions
+
+    python benchmarks/bench_suite.py --save baseline.json
+    python benchmarks/bench_suite.py --baseline baseline.json --tolerance 0.15
+
+Each phase of each workload runs --warmup times untimed, then --repeat times
+timed: parse lexes and parses the whole source, compile compiles the tokens
+parse produced and run runs the compiled code on a fresh VM. The statistics
+of every phase are printed and, with --save, written as JSON.
+
+With --baseline, the --stat of every phase is compared with the same phase in
+a file written by --save; the script exits with status 1 if any phase got
+slower than the baseline by more than --tolerance.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from corpus import PROGRAMS, generate_source, nested_source
+from scarab import Parser, Compiler, VM
+from scarab.vm import ENGINES
+
+
+def global_source(count: int, iterations: int) -> str:
+    """A loop that reads and writes count globals on every iteration"""
+    names = [f"g{i}" for i in range(count)]
+    lines = [f"{name} := {i}" for i, name in enumerate(names)]
+    lines.append("i := 0")
+    lines.append(f"while i < {iterations} do")
+    lines.extend(f"  {name} = {name} + {names[i - 1]}" for i, name in enumerate(names))
+    lines.append("  i = i + 1")
+    lines.append("end")
+    lines.append(f"print {names[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def nested_loop_source(depth: int, width: int, iterations: int) -> str:
+    """Runs the blocks of corpus.nested_source, which open and close a scope per level, from a loop"""
+    body = "".join(f"  {line}\n" for line in nested_source(depth, width).splitlines())
+    return f"i := 0\nwhile i < {iterations} do\n{body}  i = i + 1\nend\n"
+
+
+WORKLOADS = {
+    "counter": PROGRAMS["count"],
+    "strings": PROGRAMS["strings"],
+    "nested": nested_loop_source(20, 3, 200),
+    "globals": global_source(20, 1000),
+    # Snippets of the generated source may use total and name before declaring them
+    "generated": 'total := 0\nname := ""\n' + generate_source(200_000),
+}
+
+PHASES = ("parse", "compile", "run")
+
+
+def measure(function, warmup: int, repeat: int) -> dict:
+    """Statistics, in seconds, of repeat timed calls of function after warmup untimed ones"""
+    for _ in range(warmup):
+        function()
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "repeat": repeat,
+    }
+
+
+def run_workload(source: str, optimize: int, engine: str, warmup: int, repeat: int) -> dict:
+    tokens = list(Parser(source))
+
+    def compile_tokens():
+        compiler = Compiler(tokens, optimize=optimize)
+        compiler.compile()
+        return compiler
+
+    compiler = compile_tokens()
+    return {
+        "parse": measure(lambda: list(Parser(source)), warmup, repeat),
+        "compile": measure(compile_tokens, warmup, repeat),
+        "run": measure(lambda: VM(compiler.code, compiler.constants, capture=True, engine=engine).run(),
+                       warmup, repeat),
+    }
+
+
+def compare(results: dict, baseline: dict, stat: str, tolerance: float) -> list[str]:
+    """Prints each phase against the baseline and returns the ones slower by more than tolerance"""
+    regressions = list()
+    print(f"{'workload':>10} {'phase':>8} {'baseline ms':>12} {'now ms':>10} {'ratio':>7}")
+    for name, phases in results.items():
+        for phase, stats in phases.items():
+            before = baseline.get(name, {}).get(phase)
+            if before is None:
+                continue
+            ratio = stats[stat] / before[stat]
+            regressed = ratio > 1 + tolerance
+            if regressed:
+                regressions.append(f"{name} {phase}")
+            print(f"{name:>10} {phase:>8} {before[stat] * 1e3:12.3f} {stats[stat] * 1e3:10.3f} {ratio:7.2f}"
+                  f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--optimize", type=int, default=2)
+    parser.add_argument("--engine", choices=ENGINES, default="match")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workload", choices=WORKLOADS, action="append")
+    parser.add_argument("--save", help="file to write the results to as JSON")
+    parser.add_argument("--baseline", help="JSON file written by --save to compare against")
+    parser.add_argument("--stat", choices=("min", "median", "mean"), default="min")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="slowdown allowed before failing")
+    args = parser.parse_args()
+
+    results = dict()
+    print(f"{'workload':>10} {'phase':>8} {'min ms':>10} {'median ms':>10} {'mean ms':>10} {'stdev ms':>10}")
+    for name in args.workload or WORKLOADS:
+        results[name] = run_workload(WORKLOADS[name], args.optimize, args.engine, args.warmup, args.repeat)
+        for phase in PHASES:
+            stats = results[name][phase]
+            print(f"{name:>10} {phase:>8} {stats['min'] * 1e3:10.3f} {stats['median'] * 1e3:10.3f}"
+                  f" {stats['mean'] * 1e3:10.3f} {stats['stdev'] * 1e3:10.3f}")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "optimize": args.optimize,
+                "engine": args.engine,
+                "results": results,
+            }, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if (baseline["optimize"], baseline["engine"]) != (args.optimize, args.engine):
+            print(f"Baseline was measured with optimize={baseline['optimize']} and engine={baseline['engine']}",
+                  file=sys.stderr)
+        print()
+        regressions = compare(results, baseline["results"], args.stat, args.tolerance)
+        if regressions:
+            sys.exit(f"{len(regressions)} regressions over {args.tolerance:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == '__main__':
+    main()
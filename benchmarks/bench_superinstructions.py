@@ -0,0 +1,68 @@
+"""Profiles the instruction sequences the VM dispatches and measures superinstructions
+
+    python benchmarks/bench_superinstructions.py --top 10
+
+Lists the most frequently dispatched pairs and triples of ops over
+corpus.PROGRAMS at optimize=2, which is how the superinstructions were
+chosen, then compares dispatch counts and run time at optimize=2 and 3.
+"""
+
+import argparse
+import time
+from collections import Counter
+
+from corpus import PROGRAMS
+from scarab import Parser, Compiler, VM
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compile_source(source: str, optimize: int) -> Compiler:
+    compiler = Compiler(Parser(source), optimize=optimize)
+    compiler.compile()
+    return compiler
+
+
+def dispatched_ops(compiler: Compiler) -> list[str]:
+    """Names of the ops the VM dispatches, in order, read from its trace"""
+    lines = list()
+    VM(compiler.code, compiler.constants, trace=lines.append, capture=True).run()
+    return [line.split(" ", 1)[0] for line in lines]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sequences = Counter()
+    for source in PROGRAMS.values():
+        ops = dispatched_ops(compile_source(source, optimize=2))
+        for length in (2, 3):
+            sequences.update(zip(*(ops[i:] for i in range(length))))
+
+    print(f"{'count':>10}  sequence")
+    for sequence, count in sequences.most_common(args.top):
+        print(f"{count:>10}  {' '.join(sequence)}")
+    print()
+
+    print(f"{'program':>10} {'dispatches':>12} {'fused':>12} {'run ms':>10} {'fused ms':>10}")
+    for name, source in PROGRAMS.items():
+        plain = compile_source(source, optimize=2)
+        fused = compile_source(source, optimize=3)
+        counts = [len(dispatched_ops(compiler)) for compiler in (plain, fused)]
+        times = [best_time(lambda: VM(compiler.code, compiler.constants, capture=True).run(), args.repeat)
+                 for compiler in (plain, fused)]
+        print(f"{name:>10} {counts[0]:>12} {counts[1]:>12} {times[0] * 1e3:10.3f} {times[1] * 1e3:10.3f}")
+
+
+if __name__ == '__main__':
+    main()
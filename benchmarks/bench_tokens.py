@@ -0,0 +1,76 @@
+"""Compares the memory and speed of a Token list against a TokenBuffer
+
+    python benchmarks/bench_tokens.py --size 4000000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from corpus import generate_source
+from scarab import Lexer, TokenBuffer, Compiler
+
+
+def token_list(source: str):
+    return list(Lexer(source))
+
+
+def token_buffer(source: str):
+    return TokenBuffer(source)
+
+
+STREAMS = {
+    "list": token_list,
+    "buffer": token_buffer,
+}
+
+
+def peak_memory(build, source: str) -> int:
+    tracemalloc.start()
+    try:
+        tokens = build(source)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del tokens
+    return peak
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compile_tokens(tokens):
+    compiler = Compiler(tokens)
+    compiler.compile()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000, help="source size in characters")
+    parser.add_argument("--compile-size", type=int, default=100_000, help="source size for the compile timings")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    source = generate_source(args.size)
+    small = generate_source(args.compile_size)
+    megabytes = len(source.encode()) / 1e6
+    print(f"source   {megabytes:8.2f} MB")
+    print(f"{'stream':<8} {'peak MB':>10} {'build s':>10} {'iterate s':>10} {'compile ms':>10}")
+    for name, build in STREAMS.items():
+        peak = peak_memory(build, source)
+        tokens = build(source)
+        build_seconds = best_time(lambda: build(source), args.repeat)
+        iterate_seconds = best_time(lambda: all(True for _ in tokens), args.repeat)
+        small_tokens = build(small)
+        compile_seconds = best_time(lambda: compile_tokens(small_tokens), args.repeat)
+        print(f"{name:<8} {peak / 1e6:10.2f} {build_seconds:10.3f} {iterate_seconds:10.3f} {compile_seconds * 1e3:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
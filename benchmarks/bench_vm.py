@@ -0,0 +1,52 @@
+"""Times VM.run on the loop-heavy programs in corpus.PROGRAMS
+
+    python benchmarks/bench_vm.py --optimize 2 --engines match,table
+
+Reports how many instructions the VM dispatched to run each program and the
+best wall-clock time of each engine.
+"""
+
+import argparse
+import time
+
+from corpus import PROGRAMS
+from scarab import Parser, Compiler, VM
+from scarab.vm import ENGINES
+
+
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def dispatches(compiler: Compiler) -> int:
+    """Number of instructions executed, counted from the VM's trace"""
+    lines = list()
+    VM(compiler.code, compiler.constants, trace=lines.append, capture=True).run()
+    return len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--optimize", type=int, default=2)
+    parser.add_argument("--engines", default=",".join(ENGINES), help="comma separated VM engines")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    engines = args.engines.split(",")
+
+    print(f"{'program':>10} {'dispatches':>12}" + "".join(f" {engine + ' ms':>10}" for engine in engines))
+    for name, source in PROGRAMS.items():
+        compiler = Compiler(Parser(source), optimize=args.optimize)
+        compiler.compile()
+        times = [best_time(lambda: VM(compiler.code, compiler.constants, capture=True, engine=engine).run(),
+                           args.repeat)
+                 for engine in engines]
+        print(f"{name:>10} {dispatches(compiler):>12}" + "".join(f" {elapsed * 1e3:10.3f}" for elapsed in times))
+
+
+if __name__ == '__main__':
+    main()
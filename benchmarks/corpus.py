@@ -0,0 +1,84 @@
+"""Generators for the Scarab programs used by the benchmarks"""
+
+import random
+
+SNIPPETS = [
+    'total := 0\n',
+    'name := "scarab"\n',
+    'total = total + 1 * 2 - 3\n',
+    'print name + " and friends"\n',
+    'if total >= 10 print "big" else print "small"\n',
+    'do\n  x := total\n  y := x * x\n  print x + y\nend\n',
+    'i := 0\nwhile i < 3 do\n  i = i + 1\nend\n',
+    'print (total + 1) * (total - 1) / 2\n',
+    'flag := total == 0 or total != 1 and not 0\n',
+    'message := "a somewhat longer string literal that goes on for a while"\n',
+]
+
+
+def generate_source(size: int, seed=0) -> str:
+    """Returns a well-formed Scarab program of roughly size characters"""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        snippet = rng.choice(SNIPPETS)
+        parts.append(snippet)
+        length += len(snippet)
+    return "".join(parts)
+
+
+# Small programs whose run time is dominated by the VM loop, keyed by name
+PROGRAMS = {
+    "count": 'i := 0\nwhile i < 20000 do\n  i = i + 1\nend\nprint i\n',
+    "branches": (
+        'i := 0\nodd := 0\n'
+        'while i < 10000 do\n'
+        '  if i - i / 2 * 2 == 0 or i == 1 odd = odd + 1\n'
+        '  i = i + 1\n'
+        'end\n'
+        'print odd\n'
+    ),
+    "locals": (
+        'do\n'
+        '  i := 0\n  total := 0\n'
+        '  while i < 10000 do\n'
+        '    total = total + i * 2\n'
+        '    i = i + 1\n'
+        '  end\n'
+        '  print total\n'
+        'end\n'
+    ),
+    "bounded": (
+        'do\n'
+        '  i := 0\n  n := 20000\n'
+        '  while i < n do\n'
+        '    i = i + 1\n'
+        '  end\n'
+        '  print i\n'
+        'end\n'
+    ),
+    "strings": (
+        'text := ""\ni := 0\n'
+        'while i < 2000 do\n'
+        '  text = text + "ab"\n'
+        '  i = i + 1\n'
+        'end\n'
+        'print text == ""\n'
+    ),
+}
+
+
+def nested_source(depth: int, width: int) -> str:
+    """Returns blocks nested depth deep that each declare width locals and use
+    the locals of every enclosing block"""
+    lines = []
+    for level in range(depth):
+        indent = "  " * level
+        lines.append(f"{indent}do")
+        for i in range(width):
+            lines.append(f"{indent}  v{level}x{i} := v{level - 1}x{i} + 1" if level else f"{indent}  v0x{i} := {i}")
+        lines.append(f"{indent}  print v0x0 + v{level}x{width - 1}")
+    for level in reversed(range(depth)):
+        lines.append("  " * level + "end")
+    return "\n".join(lines) + "\n"
@@ -5,6 +5,9 @@ Scarab is an object-oriented, procedural, and functional programming language.
 __version__ = "0.1"
 
 from .compiler import *
+from .incremental import *
+from .lexer import *
 from .parser import *
+from .program import *
 from .value import *
 from .vm import *
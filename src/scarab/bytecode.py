@@ -0,0 +1,254 @@
+from dataclasses import dataclass
+from enum import IntEnum, auto
+
+
+class Op(IntEnum):
+    CONSTANT = auto()
+    TRUE = auto()
+    FALSE = auto()
+    PRINT = auto()
+    POP = auto()
+    ADD = auto()
+    SUB = auto()
+    MUL = auto()
+    DIV = auto()
+    NOT = auto()
+    EQUAL = auto()
+    NOT_EQUAL = auto()
+    LESS = auto()
+    LESS_EQUAL = auto()
+    GREATER = auto()
+    GREATER_EQUAL = auto()
+    DEFINE_GLOBAL = auto()
+    SET_GLOBAL = auto()
+    GET_GLOBAL = auto()
+    SET_LOCAL = auto()
+    GET_LOCAL = auto()
+    JUMP_IF_FALSE = auto()
+    JUMP = auto()
+    LOOP = auto()
+    CONSTANT_LONG = auto()
+    DEFINE_GLOBAL_LONG = auto()
+    SET_GLOBAL_LONG = auto()
+    GET_GLOBAL_LONG = auto()
+    JUMP_IF_TRUE = auto()
+    POP_JUMP_IF_FALSE = auto()
+    POP_JUMP_IF_TRUE = auto()
+    JUMP_IF_FALSE_OR_POP = auto()
+    JUMP_IF_TRUE_OR_POP = auto()
+    ADD_LOCAL_CONST = auto()
+    INC_LOCAL = auto()
+    LESS_LOCAL_LOCAL_JUMP_IF_FALSE = auto()
+    LESS_LOCAL_CONST_JUMP_IF_FALSE = auto()
+    GET_LOCAL_LONG = auto()
+    SET_LOCAL_LONG = auto()
+    # Specialized forms the adaptive engine rewrites ops to at run time;
+    # compilers never emit them
+    ADD_INT_INT = auto()
+    ADD_STR_STR = auto()
+    SUB_INT_INT = auto()
+    MUL_INT_INT = auto()
+    LESS_INT_INT = auto()
+    LESS_EQUAL_INT_INT = auto()
+    GREATER_INT_INT = auto()
+    GREATER_EQUAL_INT_INT = auto()
+
+
+# Variants of ops that take a two-byte constant index or variable slot
+WIDE_OPS = {
+    Op.CONSTANT: Op.CONSTANT_LONG,
+    Op.DEFINE_GLOBAL: Op.DEFINE_GLOBAL_LONG,
+    Op.SET_GLOBAL: Op.SET_GLOBAL_LONG,
+    Op.GET_GLOBAL: Op.GET_GLOBAL_LONG,
+    Op.GET_LOCAL: Op.GET_LOCAL_LONG,
+    Op.SET_LOCAL: Op.SET_LOCAL_LONG,
+}
+
+# The one-byte op each wide op stands for, for code that decodes operands whatever their width
+NARROW_OPS = {wide: op for op, wide in WIDE_OPS.items()}
+
+# Number of operand bytes that follow each op; ops not listed take none
+OPERAND_BYTES = {
+    Op.CONSTANT: 1,
+    Op.DEFINE_GLOBAL: 1,
+    Op.SET_GLOBAL: 1,
+    Op.GET_GLOBAL: 1,
+    Op.SET_LOCAL: 1,
+    Op.GET_LOCAL: 1,
+    Op.JUMP_IF_FALSE: 2,
+    Op.JUMP: 2,
+    Op.LOOP: 2,
+    Op.JUMP_IF_TRUE: 2,
+    Op.POP_JUMP_IF_FALSE: 2,
+    Op.POP_JUMP_IF_TRUE: 2,
+    Op.JUMP_IF_FALSE_OR_POP: 2,
+    Op.JUMP_IF_TRUE_OR_POP: 2,
+    Op.ADD_LOCAL_CONST: 2,
+    Op.INC_LOCAL: 1,
+    Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE: 4,
+    Op.LESS_LOCAL_CONST_JUMP_IF_FALSE: 4,
+    Op.GET_LOCAL_LONG: 2,
+    Op.SET_LOCAL_LONG: 2,
+    Op.CONSTANT_LONG: 2,
+    Op.DEFINE_GLOBAL_LONG: 2,
+    Op.SET_GLOBAL_LONG: 2,
+    Op.GET_GLOBAL_LONG: 2,
+}
+
+# Conditional jumps, as (the truth value they jump on, whether they pop the
+# condition when they jump, whether they pop it when they fall through)
+BRANCHES = {
+    Op.JUMP_IF_FALSE: (False, False, False),
+    Op.JUMP_IF_TRUE: (True, False, False),
+    Op.POP_JUMP_IF_FALSE: (False, True, True),
+    Op.POP_JUMP_IF_TRUE: (True, True, True),
+    Op.JUMP_IF_FALSE_OR_POP: (False, False, True),
+    Op.JUMP_IF_TRUE_OR_POP: (True, False, True),
+}
+
+# Superinstructions that compare two operands and jump if the comparison is
+# false, without touching the stack; their jump offset is the last two operand bytes
+COMPARE_JUMPS = {Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE, Op.LESS_LOCAL_CONST_JUMP_IF_FALSE}
+
+JUMP_OPS = {Op.JUMP, Op.LOOP, *BRANCHES, *COMPARE_JUMPS}
+
+# How many values each op leaves on the stack minus how many it takes; ops
+# not listed leave it as it is. Conditional jumps pop as BRANCHES says, and
+# SET_LOCAL pushes when its slot is the one above the top (x := y := 1).
+STACK_EFFECTS = {
+    Op.CONSTANT: 1,
+    Op.CONSTANT_LONG: 1,
+    Op.TRUE: 1,
+    Op.FALSE: 1,
+    Op.GET_GLOBAL: 1,
+    Op.GET_GLOBAL_LONG: 1,
+    Op.GET_LOCAL: 1,
+    Op.GET_LOCAL_LONG: 1,
+    Op.ADD_LOCAL_CONST: 1,
+    Op.PRINT: -1,
+    Op.POP: -1,
+    **{op: -1 for op in (Op.ADD, Op.SUB, Op.MUL, Op.DIV, Op.EQUAL, Op.NOT_EQUAL, Op.LESS, Op.LESS_EQUAL,
+                         Op.GREATER, Op.GREATER_EQUAL, Op.ADD_INT_INT, Op.ADD_STR_STR, Op.SUB_INT_INT,
+                         Op.MUL_INT_INT, Op.LESS_INT_INT, Op.LESS_EQUAL_INT_INT, Op.GREATER_INT_INT,
+                         Op.GREATER_EQUAL_INT_INT)},
+}
+
+
+def instructions(code, start=0, end=None):
+    """Yields (offset, op) for each instruction in code[start:end]"""
+    if end is None:
+        end = len(code)
+    offset = start
+    while offset < end:
+        op = code[offset]
+        yield offset, op
+        offset += 1 + OPERAND_BYTES.get(op, 0)
+
+
+def successors(code, offset: int, depth: int) -> list[tuple[int, int]]:
+    """The offsets that can run after the instruction at offset, each with the stack depth it leaves there"""
+    op = code[offset]
+    after = offset + 1 + OPERAND_BYTES.get(op, 0)
+    if op in JUMP_OPS:
+        jump = (code[after - 2] << 8) | code[after - 1]
+        target = after - jump if op == Op.LOOP else after + jump
+        if op in (Op.JUMP, Op.LOOP):
+            return [(target, depth)]
+        if op in BRANCHES:
+            _, pops_on_jump, pops_on_fall = BRANCHES[op]
+            return [(after, depth - pops_on_fall), (target, depth - pops_on_jump)]
+        return [(after, depth), (target, depth)]
+    if op in (Op.SET_LOCAL, Op.SET_LOCAL_LONG):
+        if int.from_bytes(code[offset + 1:after], "big") >= depth:
+            depth += 1
+        return [(after, depth)]
+    return [(after, depth + STACK_EFFECTS.get(op, 0))]
+
+
+def stack_depths(code) -> dict[int, int]:
+    """The stack depth before each instruction that can run, and at len(code) if the code can get there
+
+    Where paths with different depths meet, the first one found wins.
+    """
+    depths = dict()
+    pending = [(0, 0)]
+    while pending:
+        offset, depth = pending.pop()
+        if offset in depths:
+            continue
+        depths[offset] = depth
+        if offset < len(code):
+            pending.extend(successors(code, offset, depth))
+    return depths
+
+
+def max_stack_depth(code) -> int:
+    """The most values the stack holds at any point while code runs"""
+    return max(stack_depths(code).values(), default=0)
+
+
+def write_varint(data: bytearray, value: int):
+    """Appends value, which must not be negative, seven bits a byte, low bits first"""
+    while value > 0x7f:
+        data.append(0x80 | (value & 0x7f))
+        value >>= 7
+    data.append(value)
+
+
+def read_varint(data, at: int) -> tuple[int, int]:
+    """Reads the varint write_varint wrote at offset at; returns it and the offset after it
+
+    Raises IndexError if data ends inside it.
+    """
+    value = shift = 0
+    while True:
+        byte = data[at]
+        at += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, at
+        shift += 7
+
+
+@dataclass(frozen=True)
+class LineTable:
+    """Which source line the code at each offset was compiled from
+
+    The code is split into runs compiled from one line each, and data holds
+    for each run the distance in bytes from the start of the previous run and
+    the difference in lines to it, as varints; line differences are zigzag
+    encoded since lines can go back. Nothing reads the table while code runs.
+    """
+    data: bytes = b""
+
+    @classmethod
+    def from_runs(cls, runs) -> "LineTable":
+        """Encodes (start offset, line) pairs given in offset order"""
+        data = bytearray()
+        offset = line = 0
+        for start, start_line in runs:
+            delta = start_line - line
+            write_varint(data, start - offset)
+            write_varint(data, delta * 2 if delta >= 0 else -delta * 2 - 1)
+            offset, line = start, start_line
+        return cls(bytes(data))
+
+    def runs(self):
+        """Yields the (start offset, line) of each run"""
+        data = self.data
+        at = offset = line = 0
+        while at < len(data):
+            delta, at = read_varint(data, at)
+            zigzag, at = read_varint(data, at)
+            offset += delta
+            line += zigzag // 2 if zigzag % 2 == 0 else -(zigzag + 1) // 2
+            yield offset, line
+
+    def line_at(self, offset: int) -> int | None:
+        """The line of the code at offset, None before the first run"""
+        found = None
+        for start, line in self.runs():
+            if start > offset:
+                break
+            found = line
+        return found
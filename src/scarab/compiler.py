@@ -1,36 +1,12 @@
+import operator
 from dataclasses import dataclass
 from enum import IntEnum, auto
-from typing import TypeVar, Type
-
-from .parser import Token, TInt, TStr, TError, TKeyword, Keyword, TIdent, TOp, TSym
-from .value import Int, String
-
-
-class Op(IntEnum):
-    CONSTANT = auto()
-    TRUE = auto()
-    FALSE = auto()
-    PRINT = auto()
-    POP = auto()
-    ADD = auto()
-    SUB = auto()
-    MUL = auto()
-    DIV = auto()
-    NOT = auto()
-    EQUAL = auto()
-    NOT_EQUAL = auto()
-    LESS = auto()
-    LESS_EQUAL = auto()
-    GREATER = auto()
-    GREATER_EQUAL = auto()
-    DEFINE_GLOBAL = auto()
-    SET_GLOBAL = auto()
-    GET_GLOBAL = auto()
-    SET_LOCAL = auto()
-    GET_LOCAL = auto()
-    JUMP_IF_FALSE = auto()
-    JUMP = auto()
-    LOOP = auto()
+
+from . import peephole
+from .bytecode import Op, OPERAND_BYTES, JUMP_OPS, WIDE_OPS, LineTable, instructions, max_stack_depth
+from .lexer import Kind, TokenBuffer, TOKEN_KINDS
+from .parser import Keyword
+from .value import Int, String, Bool
 
 
 BUILTIN_SYMBOLS = {
@@ -46,6 +22,39 @@ BUILTIN_SYMBOLS = {
     ">=": Op.GREATER_EQUAL,
 }
 
+# How the VM evaluates each binary op, used to fold constant operands
+FOLDS = {
+    Op.ADD: operator.add,
+    Op.SUB: operator.sub,
+    Op.MUL: operator.mul,
+    Op.DIV: operator.truediv,
+    Op.EQUAL: lambda a, b: Bool(a == b),
+    Op.NOT_EQUAL: lambda a, b: Bool(a != b),
+    Op.LESS: lambda a, b: Bool(a < b),
+    Op.LESS_EQUAL: lambda a, b: Bool(a <= b),
+    Op.GREATER: lambda a, b: Bool(a > b),
+    Op.GREATER_EQUAL: lambda a, b: Bool(a >= b),
+}
+
+# Ops that leave an Int on the stack whenever they succeed
+INT_RESULT_OPS = {Op.SUB, Op.MUL, Op.DIV}
+
+# Constants that leave an Int unchanged, as x op constant and as constant op x
+RIGHT_IDENTITIES = {(Op.ADD, Int(0)), (Op.SUB, Int(0)), (Op.MUL, Int(1))}
+LEFT_IDENTITIES = {(Op.ADD, Int(0)), (Op.MUL, Int(1))}
+
+# Instruction sequences that optimize=3 fuses into one superinstruction, which
+# takes the operands of the whole sequence. Conditions are fused together with
+# the jump that tests them. The sequences are the hottest ones in the loops of
+# benchmarks/corpus.py, see benchmarks/bench_superinstructions.py.
+FUSED_EXPRESSIONS = {
+    (Op.GET_LOCAL, Op.CONSTANT, Op.ADD): Op.ADD_LOCAL_CONST,
+}
+FUSED_CONDITIONS = {
+    (Op.GET_LOCAL, Op.GET_LOCAL, Op.LESS): Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE,
+    (Op.GET_LOCAL, Op.CONSTANT, Op.LESS): Op.LESS_LOCAL_CONST_JUMP_IF_FALSE,
+}
+
 
 class Precedence(IntEnum):
     NONE = auto()
@@ -78,13 +87,13 @@ class Precedence(IntEnum):
         }.get(op, cls.NONE)
 
     @classmethod
-    def get(cls, token: Token):
-        match token:
-            case TOp(op):
+    def get(cls, kind: Kind, value):
+        match kind, value:
+            case Kind.OP, op:
                 return cls.get_op(op)
-            case TKeyword(Keyword.OR):
+            case Kind.KEYWORD, Keyword.OR:
                 return cls.OR
-            case TKeyword(Keyword.AND):
+            case Kind.KEYWORD, Keyword.AND:
                 return cls.AND
             case _:
                 return cls.NONE
@@ -96,53 +105,101 @@ class Local:
     depth: int
 
 
-T = TypeVar('T')
+class Compiler:
+    """Compiles tokens into bytecode
+
+    With optimize=1, expressions on constants are folded, Int identities such
+    as x * 1 are dropped and branches on constant conditions are pruned.
+    optimize=2 also runs the peephole pass over the finished code, and
+    optimize=3 fuses common sequences on locals into superinstructions.
 
+    line_table maps the finished code back to the source lines it came from.
 
-class Compiler:
-    """Compiles tokens into bytecode"""
+    The tokens are read from a TokenBuffer column by column, with current and
+    previous holding token indices, and the value of a token is only decoded
+    when the parser asks for it. Any other iterable of Tokens is read token
+    by token, with current and previous holding the Tokens.
+    """
 
-    def __init__(self, parser):
-        self.parser = iter(parser)
+    def __init__(self, parser, optimize=0):
+        if isinstance(parser, TokenBuffer):
+            self.buffer = parser
+            self.parser = None
+        else:
+            self.buffer = None
+            self.parser = iter(parser)
+        self.position = 0
+        self.optimize = optimize
         self.previous = None
         self.current = None
+        self.previous_kind = None
+        self.current_kind = None
         self.exhausted = False
         self.code = bytearray()
+        # (offset, line) where the code of each source line starts, in offset order
+        self.lines: list[tuple[int, int]] = list()
         self.constants = list()
+        self.constant_indices = dict()
+        self.global_slots: dict[str, int] = dict()
         self.can_assign = True
         self.skip_pop = False
 
-        # Local variables & Scoping
+        # Local variables & Scoping. locals is indexed by stack slot; slots
+        # maps each name to the slots declared with it, innermost last
         self.locals: list[Local] = list()
+        self.slots: dict[str, list[int]] = dict()
         self.depth = 0
 
     def advance(self):
         self.previous = self.current
+        self.previous_kind = self.current_kind
+
+        if self.buffer is not None:
+            if self.position < len(self.buffer.kinds):
+                self.current = self.position
+                self.current_kind = self.buffer.kinds[self.position]
+                self.position += 1
+            else:
+                self.current = self.current_kind = None
+        else:
+            self.current = next(self.parser, None)
+            self.current_kind = None if self.current is None else TOKEN_KINDS[type(self.current)]
 
-        self.current = next(self.parser, None)
-        if isinstance(self.current, TError):
+        if self.current_kind == Kind.ERROR:
             self.exhausted = True
-            raise SyntaxError(self.current.text)
+            raise SyntaxError(self.text(self.current))
         if self.current is None:
             self.exhausted = True
 
-    def check(self, t: Type[T], value=None):
-        if not isinstance(self.current, t):
+    def value(self, token):
+        """The value of current or previous, as the Token dataclass holds it"""
+        if token is None:
+            return None
+        return token.value if self.buffer is None else self.buffer.value(token)
+
+    def text(self, token) -> str:
+        return token.text if self.buffer is None else self.buffer.text(token)
+
+    def line(self, token) -> int:
+        return token.line if self.buffer is None else self.buffer.lines[token]
+
+    def check(self, kind: Kind, value=None):
+        if self.current_kind != kind:
             return False
 
-        if value is not None and self.current.value != value:
+        if value is not None and self.value(self.current) != value:
             return False
 
         return True
 
-    def consume(self, t: Type[T], value=None, msg=None):
-        if self.check(t, value):
+    def consume(self, kind: Kind, value=None, msg=None):
+        if self.check(kind, value):
             self.advance()
             return
         raise SyntaxError(msg)
 
-    def match(self, t: Type[T], value=None):
-        if not self.check(t, value):
+    def match(self, kind: Kind, value=None):
+        if not self.check(kind, value):
             return False
         self.advance()
         return True
@@ -151,31 +208,178 @@ class Compiler:
     def in_local_scope(self):
         return self.depth > 0
 
+    def mark_line(self, line: int):
+        """Attributes the code emitted from here on to line
+
+        Marks at or past the end of the code are dropped first, as the code
+        they pointed at was removed again or nothing was emitted after them.
+        """
+        while self.lines and self.lines[-1][0] >= len(self.code):
+            self.lines.pop()
+        if not self.lines or self.lines[-1][1] != line:
+            self.lines.append((len(self.code), line))
+
     def emit_bytes(self, *b):
         self.code += b
 
+    def emit_indexed(self, op, index):
+        """Emits op with a one-byte operand, or its wide variant if index needs two"""
+        if index <= 0xff:
+            self.code.append(op)
+            self.code.append(index)
+            return
+
+        if op not in WIDE_OPS:
+            raise Exception(f"Too many operands for {op.name}")
+        self.code.append(WIDE_OPS[op])
+        self.code.append((index >> 8) & 0xff)
+        self.code.append(index & 0xff)
+
     def make_constant(self, constant):
+        index = self.constant_indices.get(constant)
+        if index is not None:
+            return index
+
         index = len(self.constants)
+        if index > (2 ** 16 - 1):
+            raise Exception("Too many constants")
+
         self.constants.append(constant)
+        self.constant_indices[constant] = index
         return index
 
+    def emit_constant(self, value):
+        if isinstance(value, Bool):
+            self.code.append(Op.TRUE if value else Op.FALSE)
+        else:
+            self.emit_indexed(Op.CONSTANT, self.make_constant(value))
+
+    def constant_value(self, start, end=None):
+        """Returns the value code[start:end] pushes if it is a single constant load, else None"""
+        if end is None:
+            end = len(self.code)
+        match end - start, self.code[start] if end > start else None:
+            case 1, Op.TRUE:
+                return Bool(True)
+            case 1, Op.FALSE:
+                return Bool(False)
+            case 2, Op.CONSTANT:
+                return self.constants[self.code[start + 1]]
+            case 3, Op.CONSTANT_LONG:
+                return self.constants[(self.code[start + 1] << 8) | self.code[start + 2]]
+        return None
+
+    def pushes_int(self, start, end=None):
+        """True if code[start:end] is straight-line code ending in an op that yields an Int"""
+        last = None
+        for _, op in instructions(self.code, start, end):
+            if op in JUMP_OPS:
+                return False
+            last = op
+        return last in INT_RESULT_OPS
+
+    def discard(self, parse, *args):
+        """Parses with parse(*args), then drops the code and locals it produced"""
+        code_length = len(self.code)
+        locals_length = len(self.locals)
+        parse(*args)
+        del self.code[code_length:]
+        while len(self.locals) > locals_length:
+            self.pop_local()
+
+    def fold_binary(self, op, start, right):
+        """Replaces code[start:] with fewer instructions if both operands are
+        constants or one of them is an identity for op; returns True if it did
+
+        Nothing is folded that would raise at run time or whose result the
+        language cannot write as a literal, so errors still happen in the VM.
+        """
+        a = self.constant_value(start, right)
+        b = self.constant_value(right)
+
+        if a is not None and b is not None:
+            try:
+                result = FOLDS[op](a, b)
+            except (TypeError, ArithmeticError):
+                return False
+            if isinstance(result, Int) and not isinstance(result.value, int):
+                return False
+            del self.code[start:]
+            self.emit_constant(result)
+            return True
+
+        if b is not None and (op, b) in RIGHT_IDENTITIES and self.pushes_int(start, right):
+            del self.code[right:]
+            return True
+
+        if a is not None and (op, a) in LEFT_IDENTITIES and self.pushes_int(right):
+            del self.code[start:right]
+            return True
+
+        return False
+
+    def fuse(self, start, patterns):
+        """Replaces code[start:] with a superinstruction if its ops are a key of patterns; returns True if it did"""
+        ops = list()
+        operands = bytearray()
+        for offset, op in instructions(self.code, start):
+            if len(ops) == 3:
+                return False
+            ops.append(op)
+            operands += self.code[offset + 1:offset + 1 + OPERAND_BYTES.get(op, 0)]
+
+        fused = patterns.get(tuple(ops))
+        if fused is None:
+            return False
+        del self.code[start:]
+        self.code.append(fused)
+        self.code += operands
+        return True
+
+    def global_slot(self, name):
+        """Returns the slot of the global name, giving it the next free one on first use"""
+        slot = self.global_slots.get(name)
+        if slot is not None:
+            return slot
+
+        slot = len(self.global_slots)
+        if slot > (2 ** 16 - 1):
+            raise Exception("Too many global variables")
+
+        self.global_slots[name] = slot
+        return slot
+
     def make_local(self, name, depth):
         index = len(self.locals)
+        if index > (2 ** 16 - 1):
+            raise Exception("Too many local variables")
+
         self.locals.append(Local(name, depth))
+        self.slots.setdefault(name, list()).append(index)
         return index
 
-    def binary(self, op):
+    def pop_local(self):
+        local = self.locals.pop()
+        slots = self.slots[local.name]
+        slots.pop()
+        if not slots:
+            del self.slots[local.name]
+
+    def binary(self, op, start):
+        right = len(self.code)
         self.parse_precedence(Precedence.get_op(op) + 1)
         if op in BUILTIN_SYMBOLS:
+            if self.optimize and self.fold_binary(BUILTIN_SYMBOLS[op], start, right):
+                return
             self.code.append(BUILTIN_SYMBOLS[op])
+            if self.optimize >= 3:
+                self.fuse(start, FUSED_EXPRESSIONS)
             return
         raise SyntaxError(op)
 
     def local(self, name):
-        for i, local in reversed(list(enumerate(self.locals))):
-            if name == local.name:
-                return i
-        return None
+        slots = self.slots.get(name)
+        return slots[-1] if slots else None
 
     def declaration(self, name):
         if self.in_local_scope:
@@ -183,101 +387,110 @@ class Compiler:
             self.skip_pop = True
             return
 
-        self.assignment_deferred(Op.DEFINE_GLOBAL, self.make_constant, String(name))
+        self.assignment_deferred(Op.DEFINE_GLOBAL, self.global_slot, name)
 
     def assignment(self, op, arg):
         self.expression()
-        self.code.append(op)
-        self.code.append(arg)
+        self.emit_indexed(op, arg)
 
     def assignment_deferred(self, op, deferred, *args):
         self.expression()
         arg = deferred(*args)
-        self.code.append(op)
-        self.code.append(arg)
+        self.emit_indexed(op, arg)
 
     def variable(self, name):
-        if self.can_assign and self.match(TOp, ":="):
+        if self.can_assign and self.match(Kind.OP, ":="):
             self.declaration(name)
             return
 
         idx_of_local = self.local(name)
 
-        if self.can_assign and self.match(TOp, "="):
+        if self.can_assign and self.match(Kind.OP, "="):
             if idx_of_local is not None:
                 return self.assignment(Op.SET_LOCAL, idx_of_local)
-            idx_of_global = self.make_constant(String(name))
-            self.assignment(Op.SET_GLOBAL, idx_of_global)
+            self.assignment(Op.SET_GLOBAL, self.global_slot(name))
         else:
             if idx_of_local is not None:
-                self.code.append(Op.GET_LOCAL)
-                self.code.append(idx_of_local)
+                self.emit_indexed(Op.GET_LOCAL, idx_of_local)
                 return
-            idx_of_global = self.make_constant(String(name))
-            self.code.append(Op.GET_GLOBAL)
-            self.code.append(idx_of_global)
+            self.emit_indexed(Op.GET_GLOBAL, self.global_slot(name))
 
     def call_arguments(self):
         arity = 0
-        while self.match(TSym, ","):
+        while self.match(Kind.SYM, ","):
             self.expression()
             arity += 1
         return arity
 
     def parse_precedence(self, precedence: int):
         self.advance()
+        self.can_assign = precedence <= Precedence.ASSIGNMENT
+        start = len(self.code)
 
-        match self.previous:
-            case TInt(x):
+        match self.previous_kind, self.value(self.previous):
+            case Kind.INT, x:
                 constant = self.make_constant(Int(x))
-                self.code.append(Op.CONSTANT)
-                self.code.append(constant)
-            case TStr(s):
+                self.emit_indexed(Op.CONSTANT, constant)
+            case Kind.STR, s:
                 constant = self.make_constant(String(s))
-                self.code.append(Op.CONSTANT)
-                self.code.append(constant)
-            case TSym("("):
+                self.emit_indexed(Op.CONSTANT, constant)
+            case Kind.SYM, "(":
                 self.expression()
-                self.consume(TSym, ")")
-            case TIdent(name):
-                if self.match(TOp, "!"):
+                self.consume(Kind.SYM, ")")
+            case Kind.IDENT, name:
+                if self.match(Kind.OP, "!"):
                     raise NotImplementedError("function calls")
                     # self.expression()
                     # arity = self.call_arguments() + 1
                     # self.code.append(Op.CALL)
                 else:
                     self.variable(name)
-            case TKeyword(Keyword.NOT):
+            case Kind.KEYWORD, Keyword.NOT:
                 self.parse_precedence(Precedence.UNARY)
-                self.code.append(Op.NOT)
-            case TOp(op):
+                value = self.constant_value(start) if self.optimize else None
+                if value is not None:
+                    del self.code[start:]
+                    self.emit_constant(Bool(not value))
+                else:
+                    self.code.append(Op.NOT)
+            case Kind.OP, op:
                 # TODO: add unary operators
                 raise SyntaxError(op)
 
-        self.can_assign = precedence <= Precedence.ASSIGNMENT
-
-        while precedence <= Precedence.get(self.current):
+        while precedence <= self.current_precedence():
             self.advance()
-            match self.previous:
-                case TKeyword(Keyword.AND):
-                    end_jump = self.emit_jump(Op.JUMP_IF_FALSE)
-                    self.code.append(Op.POP)
-
+            left = self.constant_value(start) if self.optimize else None
+            match self.previous_kind, self.value(self.previous):
+                case Kind.KEYWORD, Keyword.AND if left is not None:
+                    if left:
+                        del self.code[start:]
+                        self.parse_precedence(Precedence.AND)
+                    else:
+                        self.discard(self.parse_precedence, Precedence.AND)
+                case Kind.KEYWORD, Keyword.OR if left is not None:
+                    if left:
+                        self.discard(self.parse_precedence, Precedence.OR)
+                    else:
+                        del self.code[start:]
+                        self.parse_precedence(Precedence.OR)
+                case Kind.KEYWORD, Keyword.AND:
+                    end_jump = self.emit_jump(Op.JUMP_IF_FALSE_OR_POP)
                     self.parse_precedence(Precedence.AND)
                     self.patch_jump(end_jump)
-                case TKeyword(Keyword.OR):
-                    else_jump = self.emit_jump(Op.JUMP_IF_FALSE)
-                    end_jump = self.emit_jump(Op.JUMP)
-
-                    self.patch_jump(else_jump)
-                    self.code.append(Op.POP)
-
+                case Kind.KEYWORD, Keyword.OR:
+                    end_jump = self.emit_jump(Op.JUMP_IF_TRUE_OR_POP)
                     self.parse_precedence(Precedence.OR)
                     self.patch_jump(end_jump)
-                case TOp(value=op):
-                    self.binary(op)
-                case default:
-                    raise SyntaxError(default)
+                case Kind.OP, op:
+                    self.binary(op, start)
+                case _, value:
+                    raise SyntaxError(value)
+
+    def current_precedence(self):
+        """The Precedence of current as an infix operator, decoding only operators and keywords"""
+        if self.current_kind == Kind.OP or self.current_kind == Kind.KEYWORD:
+            return Precedence.get(self.current_kind, self.value(self.current))
+        return Precedence.NONE
 
     def expression(self):
         self.parse_precedence(Precedence.ASSIGNMENT)
@@ -299,6 +512,14 @@ class Compiler:
         self.code[offset] = (jump >> 8) & 0xff
         self.code[offset + 1] = jump & 0xff
 
+    def emit_condition_jump(self, start):
+        """Emits the jump taken when the condition compiled at start is false and returns its offset for patch_jump"""
+        if self.optimize >= 3 and self.fuse(start, FUSED_CONDITIONS):
+            self.code.append(0xff)
+            self.code.append(0xff)
+            return len(self.code) - 2
+        return self.emit_jump(Op.POP_JUMP_IF_FALSE)
+
     def emit_loop(self, loop_start):
         self.code.append(Op.LOOP)
 
@@ -315,61 +536,98 @@ class Compiler:
         self.code.append(Op.PRINT)
 
     def if_statement(self):
+        start = len(self.code)
         self.expression()
 
-        then_jump = self.emit_jump(Op.JUMP_IF_FALSE)
-        self.code.append(Op.POP)
-        self.statement()
-
-        else_jump = self.emit_jump(Op.JUMP)
+        condition = self.constant_value(start) if self.optimize else None
+        if condition is not None:
+            # Only the branch that can run is kept
+            del self.code[start:]
+            if condition:
+                self.statement()
+                if self.match(Kind.KEYWORD, Keyword.ELSE):
+                    self.discard(self.statement)
+            else:
+                self.discard(self.statement)
+                if self.match(Kind.KEYWORD, Keyword.ELSE):
+                    self.statement()
+            return
 
-        self.patch_jump(then_jump)
-        self.code.append(Op.POP)
+        then_jump = self.emit_condition_jump(start)
+        self.statement()
 
-        if self.match(TKeyword, Keyword.ELSE):
+        if self.match(Kind.KEYWORD, Keyword.ELSE):
+            else_jump = self.emit_jump(Op.JUMP)
+            self.patch_jump(then_jump)
             self.statement()
-        self.patch_jump(else_jump)
+            self.patch_jump(else_jump)
+        else:
+            self.patch_jump(then_jump)
 
     def while_statement(self):
+        line = self.line(self.previous)
         loop_start = len(self.code)
 
         self.expression()
 
-        exit_jump = self.emit_jump(Op.JUMP_IF_FALSE)
-        self.code.append(Op.POP)
+        condition = self.constant_value(loop_start) if self.optimize else None
+        if condition is not None:
+            del self.code[loop_start:]
+            if condition:
+                self.statement()
+                self.mark_line(line)
+                self.emit_loop(loop_start)
+            else:
+                self.discard(self.statement)
+            return
+
+        exit_jump = self.emit_condition_jump(loop_start)
         self.statement()
+        # The jump back belongs to the loop, not to the last line of its body
+        self.mark_line(line)
         self.emit_loop(loop_start)
-
         self.patch_jump(exit_jump)
-        self.code.append(Op.POP)
 
     def block_statement(self):
         self.depth += 1
-        while not self.exhausted and not self.match(TKeyword, Keyword.END):
+        while not self.exhausted and not self.match(Kind.KEYWORD, Keyword.END):
             self.statement()
         self.depth -= 1
 
+        self.mark_line(self.line(self.previous))
         while len(self.locals) > 0 and self.locals[-1].depth > self.depth:
             # Pop the local from the VM's stack
             self.code.append(Op.POP)
-            self.locals.pop()
+            self.pop_local()
 
     def expression_statement(self):
         self.skip_pop = False
+        start = len(self.code)
         self.expression()
 
+        if self.optimize >= 3 and not self.skip_pop and len(self.code) - start == 5:
+            # x = x + 1 as a statement
+            op, slot, constant, set_op, set_slot = self.code[start:]
+            if (op, set_op, slot) == (Op.ADD_LOCAL_CONST, Op.SET_LOCAL, set_slot) and self.constants[constant] == Int(1):
+                del self.code[start:]
+                self.code.append(Op.INC_LOCAL)
+                self.code.append(slot)
+                return
+
         if not self.skip_pop:
             self.code.append(Op.POP)
 
     def statement(self) -> bool:
         """Compiles the next statement and returns True if it was pure"""
-        if self.match(TKeyword, Keyword.PRINT):
+        if self.current is not None:
+            self.mark_line(self.line(self.current))
+        if self.match(Kind.KEYWORD, Keyword.PRINT):
             self.print_statement()
-        elif self.match(TKeyword, Keyword.IF):
+        elif self.match(Kind.KEYWORD, Keyword.IF):
             self.if_statement()
-        elif self.match(TKeyword, Keyword.WHILE):
+        elif self.match(Kind.KEYWORD, Keyword.WHILE):
             self.while_statement()
-        elif self.match(TKeyword, Keyword.DO):
+        elif self.match(Kind.KEYWORD, Keyword.DO):
             self.block_statement()
         else:
             self.expression_statement()
@@ -381,6 +639,17 @@ class Compiler:
             self.advance()
             while not self.exhausted:
                 self.statement()
+            if self.optimize >= 2:
+                self.code = peephole.optimize(self.code, self.lines)
+
+    @property
+    def line_table(self) -> LineTable:
+        return LineTable.from_runs(mark for mark in self.lines if mark[0] < len(self.code))
+
+    @property
+    def max_stack(self):
+        """The most values the stack holds while the code runs, which is what the VM allocates"""
+        return max_stack_depth(self.code)
 
     def __iter__(self):
         self.compile()
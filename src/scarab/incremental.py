@@ -0,0 +1,146 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from itertools import accumulate
+
+from . import peephole
+from .compiler import Compiler
+from .lexer import TokenBuffer, scan, make_token
+
+
+@dataclass
+class Statement:
+    """A compiled top-level statement, the unit of incremental recompilation
+
+    The text of a statement runs from the end of the previous statement to the
+    end of its own last token, so it carries its leading whitespace. Token
+    offsets and lines are relative to that text.
+    """
+    tokens: TokenBuffer
+    code: bytes
+
+    @property
+    def text(self):
+        return self.tokens.source
+
+
+class IncrementalCompiler:
+    """Keeps a source compiled while it is edited
+
+    An edit re-lexes and recompiles from the start of the top-level statement
+    before the first one it touches and stops at the first statement that ends where an
+    old statement ended, past the edit: from there on the source, and so the
+    tokens and bytecode, are unchanged. Top-level statements compile to
+    position-independent code (jumps are relative and locals only live inside
+    blocks), so the bytecode of the program is the statements' code joined.
+
+    All statements share one constant pool and one set of global slots,
+    which only grow.
+
+    After an edit that does not compile, stale is True and code and tokens
+    still hold the last source that compiled.
+    """
+
+    def __init__(self, source: str, optimize=0):
+        self.source = source
+        self.optimize = optimize
+        self.constants = list()
+        self.constant_indices = dict()
+        self.global_slots = dict()
+        self.statements: list[Statement] = list()
+        self.lengths: list[int] = list()
+        self.stale = False
+        self.recompile(0, 0, len(source), 0)
+
+    @property
+    def code(self):
+        return bytearray().join(statement.code for statement in self.statements)
+
+    @property
+    def tokens(self) -> TokenBuffer:
+        """The tokens of the whole source, with offsets and lines from its start"""
+        source = "".join(statement.text for statement in self.statements) if self.stale else self.source
+        buffer = TokenBuffer(source, spans=())
+        offset = line = 0
+        for statement in self.statements:
+            spans = ((kind, start, start + length, line + token_line)
+                     for kind, start, length, token_line in zip(*statement.tokens.columns))
+            buffer.extend(spans, offset)
+            offset += len(statement.text)
+            line += statement.text.count("\n")
+        return buffer
+
+    def edit(self, offset: int, removed: int, inserted: str):
+        """Replaces removed characters at offset with inserted and recompiles
+
+        Raises SyntaxError if the edited source does not compile; the edit is
+        kept but not compiled, and the next edit recompiles the whole source.
+        """
+        self.source = self.source[:offset] + inserted + self.source[offset + removed:]
+
+        if self.stale:
+            self.recompile(0, 0, len(self.source), 0)
+            return
+
+        # Where a statement ends depends on the token after it, so the one
+        # before the statement holding the edit is recompiled as well
+        ends = list(accumulate(self.lengths))
+        first = max(bisect_left(ends, offset) - 1, 0)
+        start = ends[first - 1] if first else 0
+        self.recompile(first, start, offset + removed, len(inserted) - removed, ends)
+
+    def recompile(self, first: int, start: int, edit_end: int, delta: int, ends=()):
+        """Recompiles statements from index first, which begins at offset start
+
+        Statements ending past edit_end (in old offsets) are compared against
+        the old statement ends to find where to stop.
+        """
+        source = self.source
+        spans = list()
+
+        def tokens():
+            for span in scan(source, start):
+                spans.append(span)
+                yield make_token(source, *span)
+
+        compiler = Compiler(tokens(), self.optimize)
+        compiler.constants = self.constants
+        compiler.constant_indices = self.constant_indices
+        compiler.global_slots = self.global_slots
+
+        compiled = list()
+        last = len(self.statements)
+        statement_start = start
+        newlines = 0
+        try:
+            compiler.advance()
+            while not compiler.exhausted:
+                code_start = len(compiler.code)
+                token_start = len(spans) - 1
+                compiler.statement()
+
+                token_stop = len(spans) if compiler.exhausted else len(spans) - 1
+                statement_stop = spans[token_stop - 1][2]
+                text = source[statement_start:statement_stop]
+                buffer = TokenBuffer(text, spans=())
+                buffer.extend(((kind, begin, end, line - newlines)
+                               for kind, begin, end, line in spans[token_start:token_stop]), -statement_start)
+                code = compiler.code[code_start:]
+                if self.optimize >= 2:
+                    code = peephole.optimize(code)
+                compiled.append(Statement(buffer, bytes(code)))
+                statement_start = statement_stop
+                newlines += text.count("\n")
+
+                old_stop = statement_stop - delta
+                if old_stop >= edit_end:
+                    index = bisect_left(ends, old_stop)
+                    if index < len(ends) and ends[index] == old_stop:
+                        last = index + 1
+                        break
+        except Exception:
+            self.stale = True
+            raise
+
+        self.stale = False
+        self.statements[first:last] = compiled
+        self.lengths[first:last] = [len(statement.text) for statement in compiled]
@@ -0,0 +1,285 @@
+import math
+
+from .bytecode import Op, OPERAND_BYTES, BRANCHES, COMPARE_JUMPS, NARROW_OPS
+from .value import Bool, Int, String
+
+# Value classes a trace keeps as raw Python values between its guards
+RAW_CLASSES = (Int, String, Bool)
+
+# Longest iteration, in instructions, that is recorded and translated
+JIT_MAX_TRACE = 1000
+
+ARITHMETIC = {Op.ADD: "+", Op.SUB: "-", Op.MUL: "*", Op.DIV: "/"}
+
+COMPARISONS = {Op.EQUAL: "==", Op.NOT_EQUAL: "!=", Op.LESS: "<", Op.LESS_EQUAL: "<=", Op.GREATER: ">",
+               Op.GREATER_EQUAL: ">="}
+
+# The operand classes each arithmetic op works on without raising a TypeError
+ARITHMETIC_CLASSES = {Op.ADD: (Int, String), Op.SUB: (Int,), Op.MUL: (Int,), Op.DIV: (Int,)}
+
+
+class TraceAborted(Exception):
+    """The recorded iteration does something translate does not compile"""
+
+
+class Exit:
+    """A point where a trace returns to the interpreter, rendered once the whole trace is known"""
+
+    def __init__(self, offset: int, stack: list, globals: dict):
+        self.offset = offset
+        self.stack = list(stack)
+        self.globals = dict(globals)
+
+
+def translate(code, constants, path: list[tuple[int, int]], stack_classes: list, global_classes: list) -> str:
+    """Translates one recorded iteration of a loop into the source of a Python function
+
+    path holds (offset, next offset) for each instruction the iteration ran,
+    from the loop head to the LOOP that jumps back to it. stack_classes and
+    global_classes are the classes of the stack and globals at the head.
+
+    The function, trace(stack, globals), runs the loop on raw Python values
+    held in local variables: s<k> for stack slot k and g<k> for global slot k
+    at the head, t<n> for the values the iteration computes. Operand classes
+    are worked out from the entry classes, which its first lines guard,
+    returning None when they do not hold. A branch that goes the other way
+    than it did while recording writes the values back, boxed, and returns
+    the offset the interpreter continues at. So does a DIV that raises, which
+    the interpreter then runs again, raising with the stack and globals it
+    would have had without the trace.
+
+    Raises TraceAborted for ops or operand classes a trace cannot run.
+    """
+    head = path[0][0]
+    depth = len(stack_classes)
+    stack = [(f"s{slot}", cls) for slot, cls in enumerate(stack_classes)]
+    globals = dict()
+    dirty_slots = set()
+    dirty_globals = set()
+    # The entry values the trace reads, which are guarded and unboxed before the loop
+    used = set()
+    lines = list()
+    temporaries = 0
+
+    def use(value):
+        expression, cls = value
+        if expression[0] in "sg":
+            used.add(expression)
+        return expression
+
+    def box(value):
+        return f"{value[1].__name__}({use(value)})"
+
+    def temporary(expression, cls, indent=""):
+        nonlocal temporaries
+        name = f"t{temporaries}"
+        temporaries += 1
+        lines.append(f"{indent}{name} = {expression}")
+        return name, cls
+
+    def constant(value):
+        if value.__class__ not in RAW_CLASSES or isinstance(value.value, float) and not math.isfinite(value.value):
+            raise TraceAborted(f"Cannot inline constant {value!r}")
+        return repr(value.value), value.__class__
+
+    def entry_global(slot):
+        if slot not in globals:
+            if slot >= len(global_classes) or global_classes[slot] not in RAW_CLASSES:
+                raise TraceAborted(f"Global slot {slot} holds no raw value at the head")
+            globals[slot] = (f"g{slot}", global_classes[slot])
+        return globals[slot]
+
+    def local(slot):
+        if slot >= len(stack):
+            raise TraceAborted(f"Stack slot {slot} is not live")
+        return stack[slot]
+
+    def binary(op, a, b):
+        left_cls, right_cls = a[1], b[1]
+        if op in ARITHMETIC:
+            if left_cls is not right_cls or left_cls not in ARITHMETIC_CLASSES[op]:
+                raise TraceAborted(f"{op.name} of {left_cls.__name__} and {right_cls.__name__}")
+            return temporary(f"{use(a)} {ARITHMETIC[op]} {use(b)}", left_cls)
+        if left_cls is not right_cls:
+            # Values of different classes are never equal, and are not ordered
+            if op in (Op.EQUAL, Op.NOT_EQUAL):
+                return repr(op == Op.NOT_EQUAL), Bool
+            raise TraceAborted(f"{op.name} of {left_cls.__name__} and {right_cls.__name__}")
+        return temporary(f"{use(a)} {COMPARISONS[op]} {use(b)}", Bool)
+
+    def divide(a, b, offset, exit_stack):
+        """a / b, which leaves the trace if it raises, so that the interpreter runs the DIV at offset
+        from the state before it and raises in its place"""
+        if a[1] is not Int or b[1] is not Int:
+            raise TraceAborted(f"DIV of {a[1].__name__} and {b[1].__name__}")
+        lines.append("try:")
+        quotient = temporary(f"{use(a)} / {use(b)}", Int, "    ")
+        lines.append("except ArithmeticError:")
+        lines.append(Exit(offset, exit_stack, globals))
+        return quotient
+
+    def guard(condition, exit_when, offset, exit_stack):
+        lines.append(f"if {'' if exit_when else 'not '}{condition}:")
+        lines.append(Exit(offset, exit_stack, globals))
+
+    for step, (offset, next_offset) in enumerate(path):
+        op = code[offset]
+        size = OPERAND_BYTES.get(op, 0)
+        operand = code[offset + 1:offset + 1 + size]
+        after = offset + 1 + size
+        op = Op(NARROW_OPS.get(op, op))
+
+        match op:
+            case Op.CONSTANT:
+                stack.append(constant(constants[int.from_bytes(operand, "big")]))
+            case Op.TRUE | Op.FALSE:
+                stack.append((repr(op == Op.TRUE), Bool))
+            case Op.POP:
+                stack.pop()
+            case Op.PRINT:
+                lines.append(f"output({box(stack.pop())})")
+            case Op.NOT:
+                stack.append(temporary(f"not {use(stack.pop())}", Bool))
+            case _ if op in ARITHMETIC or op in COMPARISONS:
+                b = stack.pop()
+                a = stack.pop()
+                if op == Op.DIV:
+                    stack.append(divide(a, b, offset, stack + [a, b]))
+                else:
+                    stack.append(binary(op, a, b))
+            case Op.GET_GLOBAL:
+                stack.append(entry_global(int.from_bytes(operand, "big")))
+            case Op.SET_GLOBAL | Op.DEFINE_GLOBAL:
+                slot = int.from_bytes(operand, "big")
+                entry_global(slot)
+                globals[slot] = stack[-1]
+                dirty_globals.add(slot)
+            case Op.GET_LOCAL:
+                stack.append(local(int.from_bytes(operand, "big")))
+            case Op.SET_LOCAL:
+                slot = int.from_bytes(operand, "big")
+                if slot < len(stack):
+                    stack[slot] = stack[-1]
+                elif slot == len(stack):
+                    stack.append(stack[-1])
+                else:
+                    raise TraceAborted(f"Stack slot {slot} is not live")
+                if slot < depth:
+                    dirty_slots.add(slot)
+            case Op.ADD_LOCAL_CONST:
+                stack.append(binary(Op.ADD, local(operand[0]), constant(constants[operand[1]])))
+            case Op.INC_LOCAL:
+                stack[operand[0]] = binary(Op.ADD, local(operand[0]), ("1", Int))
+                if operand[0] < depth:
+                    dirty_slots.add(operand[0])
+            case Op.JUMP:
+                pass
+            case Op.LOOP if step == len(path) - 1 and next_offset == head:
+                pass
+            case _ if op in BRANCHES:
+                target = after + ((operand[-2] << 8) | operand[-1])
+                when, pops_on_jump, pops_on_fall = BRANCHES[op]
+                if target == after:
+                    if pops_on_jump != pops_on_fall:
+                        raise TraceAborted(f"{op.name} at offset {offset} jumps to the next instruction")
+                    if pops_on_jump:
+                        stack.pop()
+                    continue
+                condition = use(stack[-1])
+                if next_offset == target:
+                    guard(condition, not when, after, stack[:-1] if pops_on_fall else stack)
+                    if pops_on_jump:
+                        stack.pop()
+                else:
+                    guard(condition, when, target, stack[:-1] if pops_on_jump else stack)
+                    if pops_on_fall:
+                        stack.pop()
+            case _ if op in COMPARE_JUMPS:
+                target = after + ((operand[-2] << 8) | operand[-1])
+                if op == Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE:
+                    right = local(operand[1])
+                else:
+                    right = constant(constants[operand[1]])
+                left = local(operand[0])
+                if left[1] is not right[1]:
+                    raise TraceAborted(f"{op.name} of {left[1].__name__} and {right[1].__name__}")
+                condition = f"{use(left)} < {use(right)}"
+                if next_offset == target:
+                    guard(condition, True, after, stack)
+                else:
+                    guard(condition, False, target, stack)
+            case _:
+                raise TraceAborted(f"{op.name} at offset {offset}")
+
+    if len(stack) != depth:
+        raise TraceAborted("The iteration does not keep the stack depth")
+
+    # The back edge carries the values of the iteration over to the head
+    carried = list()
+    for slot in sorted(dirty_slots):
+        if stack[slot][1] is not stack_classes[slot]:
+            raise TraceAborted(f"Stack slot {slot} changes class")
+        carried.append((f"s{slot}", use(stack[slot])))
+    for slot in sorted(dirty_globals):
+        if globals[slot][1] is not global_classes[slot]:
+            raise TraceAborted(f"Global slot {slot} changes class")
+        carried.append((f"g{slot}", use(globals[slot])))
+    carried = [(name, value) for name, value in carried if name != value]
+    if carried:
+        lines.append(f"{', '.join(name for name, _ in carried)} = {', '.join(value for _, value in carried)}")
+
+    def exit_statements(exit):
+        """Writes the values back into the stack and globals and returns the offset to continue at"""
+        statements = list()
+        for slot in sorted(dirty_slots):
+            if slot < len(exit.stack):
+                statements.append(f"stack[{slot}] = {box(exit.stack[slot])}")
+        if len(exit.stack) < depth:
+            statements.append(f"del stack[{len(exit.stack)}:]")
+        elif len(exit.stack) > depth:
+            statements.append(f"stack.extend(({', '.join(box(value) for value in exit.stack[depth:])},))")
+        for slot in sorted(dirty_globals):
+            value = exit.globals.get(slot, (f"g{slot}", global_classes[slot]))
+            statements.append(f"globals[{slot}] = {box(value)}")
+        statements.append(f"return {exit.offset}")
+        return statements
+
+    body = list()
+    for line in lines:
+        if isinstance(line, Exit):
+            body.extend(f"            {statement}" for statement in exit_statements(line))
+        else:
+            body.append(f"        {line}")
+
+    guards = [f"len(stack) != {depth}"]
+    loads = list()
+    global_names = [name for name in used if name[0] == "g"]
+    if global_names:
+        guards.append(f"len(globals) <= {max(int(name[1:]) for name in global_names)}")
+    for name in sorted(used, key=lambda name: (name[0], int(name[1:]))):
+        slot = int(name[1:])
+        if name[0] == "s":
+            cls, value = stack_classes[slot], f"stack[{slot}]"
+        else:
+            cls, value = global_classes[slot], f"globals[{slot}]"
+        if cls not in RAW_CLASSES:
+            raise TraceAborted(f"{value} holds no raw value at the head")
+        guards.append(f"{value}.__class__ is not {cls.__name__}")
+        loads.append(f"    {name} = {value}.value")
+
+    return "\n".join([
+        "def trace(stack, globals):",
+        f"    if {' or '.join(guards)}:",
+        "        return None",
+        *loads,
+        "    while True:",
+        *body,
+        "",
+    ])
+
+
+def compile_trace(source: str, head: int, output):
+    """Compiles a translated trace; PRINT in it goes to output"""
+    namespace = {"Int": Int, "String": String, "Bool": Bool, "output": output}
+    exec(compile(source, f"<trace at {head}>", "exec"), namespace)
+    return namespace["trace"]
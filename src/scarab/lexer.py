@@ -0,0 +1,361 @@
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from enum import IntEnum, auto
+from typing import Iterable
+
+from .parser import Parser, Token, TInt, TStr, TIdent, TSym, TOp, TKeyword, TError, KEYWORDS, CHUNK_SIZE, read_chunks
+
+
+class Kind(IntEnum):
+    INT = auto()
+    STR = auto()
+    IDENT = auto()
+    SYM = auto()
+    OP = auto()
+    KEYWORD = auto()
+    ERROR = auto()
+
+
+# The Kind of each Token dataclass
+TOKEN_KINDS = {TInt: Kind.INT, TStr: Kind.STR, TIdent: Kind.IDENT, TSym: Kind.SYM, TOp: Kind.OP,
+               TKeyword: Kind.KEYWORD, TError: Kind.ERROR}
+
+# One alternative per token class, tried in the same order as Parser.__next__.
+# The group that matched (``lastindex``) identifies the token class; trailing
+# whitespace matches the empty alternative at the end, which has no group.
+TOKEN_PATTERN = re.compile(
+    r"\s*(?:"
+    r"([" + re.escape(Parser.special_characters) + r"])"
+    r"|([" + re.escape(Parser.operator_characters) + r"]+)"
+    r"|([^\W\d_][^\W_]*)"
+    r"|(\d+)"
+    r'|("[^"]*")'
+    r'|(")'
+    r"|(\S)"
+    r"|\Z)"
+)
+
+SYM, OP, IDENT, INT, STR, UNCLOSED, ERROR = range(1, 8)
+
+# The last whitespace character that is only followed by non-whitespace
+LAST_SPACE = re.compile(r"\s(?=\S*\Z)")
+
+GROUP_KINDS = (None, Kind.SYM, Kind.OP, Kind.IDENT, Kind.INT, Kind.STR, None, Kind.ERROR)
+
+
+def scan(source: str, pos=0, endpos=None, line=1):
+    """Yields (kind, start, stop, line) for every token in source[pos:endpos]
+
+    String spans include both quotes. Nothing is copied out of the source
+    except identifiers, which are sliced once to tell keywords from names.
+    """
+    if endpos is None:
+        endpos = len(source)
+
+    count = source.count
+    kinds = GROUP_KINDS
+
+    for m in TOKEN_PATTERN.finditer(source, pos, endpos):
+        group = m.lastindex
+        if group is None:
+            return
+
+        start, stop = m.span(group)
+        if start != pos:
+            line += count("\n", pos, start)
+        pos = stop
+
+        if group == IDENT:
+            if not source[start].isalpha():
+                # \w admits numeric characters that str.isalpha rejects
+                yield Kind.ERROR, start, start + 1, line
+                yield from scan(source, start + 1, stop, line)
+                continue
+            if source[start:stop] in KEYWORDS:
+                yield Kind.KEYWORD, start, stop, line
+                continue
+        elif group == STR:
+            yield Kind.STR, start, stop, line
+            line += count("\n", start, stop)
+            continue
+        elif group == UNCLOSED:
+            raise SyntaxError("Unclosed string literal")
+
+        yield kinds[group], start, stop, line
+
+
+def make_token(source: str, kind: Kind, start: int, stop: int, line: int) -> Token:
+    """Builds the Token dataclass for a span returned by scan()"""
+    if kind == Kind.STR:
+        text = source[start + 1:stop - 1]
+        return TStr(text, line, text)
+
+    text = source[start:stop]
+    match kind:
+        case Kind.IDENT:
+            return TIdent(text, line, text)
+        case Kind.OP:
+            return TOp(text, line, text)
+        case Kind.SYM:
+            return TSym(text, line, text)
+        case Kind.INT:
+            return TInt(text, line, int(text))
+        case Kind.KEYWORD:
+            return TKeyword(text, line, KEYWORDS[text])
+        case _:
+            return TError(text, line)
+
+
+def tokenize(source: str, pos=0, endpos=None, line=1, partial=False):
+    """Yields the Token dataclasses for source[pos:endpos]
+
+    This is scan() and make_token() fused into a single loop, which avoids an
+    intermediate tuple and a second dispatch for every token.
+
+    Returns the offset and line where lexing stopped. With partial=True an
+    unclosed string stops lexing at its opening quote instead of raising, for
+    callers that expect the rest of the source to arrive later.
+    """
+    if endpos is None:
+        endpos = len(source)
+
+    count = source.count
+
+    for m in TOKEN_PATTERN.finditer(source, pos, endpos):
+        group = m.lastindex
+        if group is None:
+            return endpos, line + count("\n", pos, endpos)
+
+        start, stop = m.span(group)
+        if start != pos:
+            line += count("\n", pos, start)
+        pos = stop
+
+        if group == IDENT:
+            text = source[start:stop]
+            if text in KEYWORDS:
+                yield TKeyword(text, line, KEYWORDS[text])
+            elif text[0].isalpha():
+                yield TIdent(text, line, text)
+            else:
+                # \w admits numeric characters that str.isalpha rejects
+                yield TError(text[0], line)
+                yield from tokenize(source, start + 1, stop, line)
+        elif group == OP:
+            text = source[start:stop]
+            yield TOp(text, line, text)
+        elif group == SYM:
+            text = source[start:stop]
+            yield TSym(text, line, text)
+        elif group == INT:
+            text = source[start:stop]
+            yield TInt(text, line, int(text))
+        elif group == STR:
+            text = source[start + 1:stop - 1]
+            yield TStr(text, line, text)
+            line += count("\n", start, stop)
+        elif group == UNCLOSED:
+            if partial:
+                return start, line
+            raise SyntaxError("Unclosed string literal")
+        else:
+            yield TError(source[start:stop], line)
+
+
+def tokenize_chunks(chunks: Iterable[str], line=1):
+    """Yields the Token dataclasses for a source that arrives in pieces
+
+    Text after the last newline may hold a token that continues in the next
+    chunk, so it is carried over and lexed together with that chunk. A string
+    literal left open is carried over from its opening quote.
+    """
+    pending = ""
+    for chunk in chunks:
+        text = pending + chunk
+        cut = text.rfind("\n") + 1
+        if not cut:
+            m = LAST_SPACE.search(text)
+            cut = m.end() if m else 0
+        pos, line = yield from tokenize(text, 0, cut, line, partial=True)
+        pending = text[pos:]
+    yield from tokenize(pending, 0, None, line)
+
+
+class Lexer:
+    """Drop-in replacement for Parser that scans the source with a compiled pattern
+
+    Produces exactly the same tokens as Parser, but slices each token out of the
+    original string instead of building it one character at a time.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens = tokenize(source)
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[str]):
+        """Lexes a source that arrives in pieces without joining them first"""
+        lexer = cls("")
+        lexer.source = None
+        lexer.tokens = tokenize_chunks(chunks)
+        return lexer
+
+    @classmethod
+    def from_file(cls, path, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+        """Lexes a file while holding only about one chunk of it in memory"""
+        return cls.from_chunks(read_chunks(path, chunk_size, encoding))
+
+    def __next__(self) -> Token:
+        return next(self.tokens)
+
+    def __iter__(self):
+        return self.tokens
+
+
+class TokenBuffer:
+    """Stores a token stream as parallel arrays instead of one dataclass per token
+
+    Each token is a kind, the offset and length of its span in the source and
+    the line it starts on. Token objects are only built when a token is indexed
+    or reached during iteration; a Compiler reads the columns directly and
+    builds none.
+    """
+
+    def __init__(self, source: str, spans=None):
+        self.source = source
+        self.kinds = array("B")
+        self.starts = array("I")
+        self.lengths = array("I")
+        self.lines = array("I")
+        self.extend(scan(source) if spans is None else spans)
+
+    @property
+    def columns(self):
+        return self.kinds, self.starts, self.lengths, self.lines
+
+    def extend(self, spans, offset=0):
+        """Appends (kind, start, stop, line) spans, moving them offset characters along"""
+        kinds = self.kinds.append
+        starts = self.starts.append
+        lengths = self.lengths.append
+        lines = self.lines.append
+        for kind, start, stop, line in spans:
+            kinds(kind)
+            starts(start + offset)
+            lengths(stop - start)
+            lines(line)
+
+    def extend_columns(self, columns):
+        """Appends the columns of another buffer over the same source"""
+        for column, other in zip(self.columns, columns):
+            column.extend(other)
+
+    @property
+    def nbytes(self):
+        """Size of the token columns in bytes, not counting the source"""
+        return sum(column.itemsize * len(column) for column in self.columns)
+
+    def kind(self, index) -> Kind:
+        return Kind(self.kinds[index])
+
+    def text(self, index) -> str:
+        """Source text of a token, including the quotes around a string"""
+        start = self.starts[index]
+        return self.source[start:start + self.lengths[index]]
+
+    def value(self, index):
+        """Decodes the value of a token without building its Token"""
+        text = self.text(index)
+        match self.kinds[index]:
+            case Kind.INT:
+                return int(text)
+            case Kind.STR:
+                return text[1:-1]
+            case Kind.KEYWORD:
+                return KEYWORDS[text]
+            case Kind.ERROR:
+                return None
+            case _:
+                return text
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index) -> Token:
+        start = self.starts[index]
+        return make_token(self.source, self.kinds[index], start, start + self.lengths[index], self.lines[index])
+
+    def __iter__(self):
+        source = self.source
+        for kind, start, length, line in zip(self.kinds, self.starts, self.lengths, self.lines):
+            yield make_token(source, kind, start, start + length, line)
+
+
+def split_points(source: str, size: int) -> list[int]:
+    """Offsets that cut source into pieces of at least size characters
+
+    Every cut is just after a newline. Since no token but a string spans a
+    newline, a cut is safe when an even number of quotes comes before it.
+    """
+    points = [0]
+    counted = 0
+    quotes = 0
+    while points[-1] + size < len(source):
+        cut = source.find("\n", points[-1] + size) + 1
+        while cut:
+            quotes += source.count('"', counted, cut)
+            counted = cut
+            if quotes % 2 == 0:
+                break
+            cut = source.find("\n", cut) + 1
+        if not cut or cut == len(source):
+            break
+        points.append(cut)
+    points.append(len(source))
+    return points
+
+
+def scan_columns(source: str, offset=0, line=1):
+    """Lexes source into TokenBuffer columns, moving every span offset characters along
+
+    This is the unit of work that lex_parallel() sends to other processes;
+    the arrays pickle far more compactly than Token objects.
+    """
+    buffer = TokenBuffer(source, spans=())
+    buffer.extend(scan(source, line=line), offset)
+    return buffer.columns
+
+
+PARALLEL_CHUNK_SIZE = 1 << 20
+
+
+def lex_parallel(source: str, processes=None, chunk_size=PARALLEL_CHUNK_SIZE, executor=None) -> TokenBuffer:
+    """Lexes source in a pool of processes into the same TokenBuffer as TokenBuffer(source)
+
+    The source is cut at safe newlines into pieces of about chunk_size
+    characters, each piece is lexed starting from the line it begins on, and
+    the columns are joined in order. Pass an executor to reuse a pool across
+    calls; otherwise one with the given number of processes is created.
+    """
+    points = split_points(source, chunk_size)
+    if len(points) <= 2:
+        return TokenBuffer(source)
+
+    pieces, offsets, lines = [], [], []
+    line = 1
+    for start, stop in zip(points, points[1:]):
+        pieces.append(source[start:stop])
+        offsets.append(start)
+        lines.append(line)
+        line += source.count("\n", start, stop)
+
+    buffer = TokenBuffer(source, spans=())
+    if executor is None:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(scan_columns, pieces, offsets, lines))
+    else:
+        results = executor.map(scan_columns, pieces, offsets, lines)
+    for columns in results:
+        buffer.extend_columns(columns)
+    return buffer
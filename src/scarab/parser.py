@@ -1,6 +1,10 @@
+import codecs
+import mmap
 from collections import deque
 from dataclasses import dataclass
 from enum import Enum
+from io import IncrementalNewlineDecoder
+from itertools import chain
 from typing import Callable
 
 
@@ -59,12 +63,38 @@ class Keyword(Enum):
     FOR = "for"
 
 
+KEYWORDS = {keyword.value: keyword for keyword in Keyword}
+
+
 @dataclass(frozen=True)
 class TKeyword(Token):
     __match_args__ = ("value",)
     value: Keyword
 
 
+CHUNK_SIZE = 1 << 20
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+    """Yields the decoded text of a file in pieces of about chunk_size bytes
+
+    The file is memory-mapped when possible and decoded incrementally, so a
+    character split between two reads is decoded once both halves are in.
+    Newlines are translated as open() does in text mode.
+    """
+    decoder = IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+    with open(path, "rb") as file:
+        try:
+            reader = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and pipes cannot be mapped
+            reader = file
+        with reader:
+            while chunk := reader.read(chunk_size):
+                yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
 class PeekIterator:
     def __init__(self, iterable):
         self.iterator = iter(iterable)
@@ -95,6 +125,11 @@ class Parser:
         self.iter = PeekIterator(iter(source))
         self.line = 1
 
+    @classmethod
+    def from_file(cls, path, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+        """Lexes a file while holding only about one chunk of it in memory"""
+        return cls(chain.from_iterable(read_chunks(path, chunk_size, encoding)))
+
     def whitespace(self):
         while self.iter.peek().isspace():
             char = next(self.iter)
@@ -114,7 +149,10 @@ class Parser:
         string = ""
         try:
             while self.iter.peek() != '"':
-                string += next(self.iter)
+                char = next(self.iter)
+                if char == "\n":
+                    self.line += 1
+                string += char
             next(self.iter)
         except StopIteration:
             raise SyntaxError("Unclosed string literal")
@@ -130,16 +168,16 @@ class Parser:
                 return TOp(op, self.line, op)
             case ident if ident.isalpha():
                 ident += self.parse_while(lambda x: x.isalnum())
-                key = ident.upper()
-                if key in Keyword.__dict__:
-                    return TKeyword(ident, self.line, Keyword(ident))
+                if ident in KEYWORDS:
+                    return TKeyword(ident, self.line, KEYWORDS[ident])
                 return TIdent(ident, self.line, ident)
             case d if d.isdigit():
                 d += self.parse_while(lambda x: x.isdigit())
                 return TInt(d, self.line, int(d))
             case s if s == '"':
+                line = self.line
                 string = self.string_literal()
-                return TStr(string, self.line, string)
+                return TStr(string, line, string)
             case default:
                 return TError(default, self.line)
 
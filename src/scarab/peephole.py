@@ -0,0 +1,242 @@
+from dataclasses import dataclass
+
+from .bytecode import Op, OPERAND_BYTES, BRANCHES, JUMP_OPS, instructions
+
+# Unconditional jumps; a forward one is encoded as JUMP and a backward one as LOOP
+GOTO_OPS = {Op.JUMP, Op.LOOP}
+
+# The conditional jump for each combination of flags in BRANCHES
+BRANCH_OPS = {flags: op for op, flags in BRANCHES.items()}
+
+# Ops that push a value without side effects, so they can be dropped with the POP after them
+PURE_PUSH_OPS = {Op.CONSTANT, Op.CONSTANT_LONG, Op.TRUE, Op.FALSE, Op.GET_LOCAL, Op.GET_LOCAL_LONG}
+
+
+@dataclass(eq=False)
+class Instruction:
+    """One decoded instruction; jumps point at the instruction they land on"""
+    op: Op | None
+    operand: bytes = b""
+    target: "Instruction | None" = None
+    # The source line it was compiled from, if known
+    line: int | None = None
+
+    @property
+    def size(self):
+        if self.op is None:
+            return 0
+        return 1 + OPERAND_BYTES.get(self.op, 0)
+
+
+def decode(code) -> list[Instruction]:
+    """Splits code into Instructions, ending with an empty one that stands for the end of the code"""
+    program = list()
+    at = dict()
+    for offset, op in instructions(code):
+        instruction = Instruction(Op(op), bytes(code[offset + 1:offset + 1 + OPERAND_BYTES.get(op, 0)]))
+        program.append(instruction)
+        at[offset] = instruction
+    at[len(code)] = end = Instruction(None)
+    program.append(end)
+
+    offset = 0
+    for instruction in program:
+        if instruction.op in JUMP_OPS:
+            jump = (instruction.operand[-2] << 8) | instruction.operand[-1]
+            if instruction.op == Op.LOOP:
+                instruction.target = at[offset + instruction.size - jump]
+            else:
+                instruction.target = at[offset + instruction.size + jump]
+        offset += instruction.size
+    return program
+
+
+def encode(program: list[Instruction]) -> bytearray:
+    """Lays out the program again, recomputing every jump offset"""
+    offsets = dict()
+    offset = 0
+    for instruction in program:
+        offsets[instruction] = offset
+        offset += instruction.size
+
+    code = bytearray()
+    for instruction in program:
+        if instruction.op is None:
+            continue
+
+        if instruction.target is None:
+            code.append(instruction.op)
+            code += instruction.operand
+            continue
+
+        jump = offsets[instruction.target] - (offsets[instruction] + instruction.size)
+        op = instruction.op
+        if op in GOTO_OPS:
+            op = Op.JUMP if jump >= 0 else Op.LOOP
+        if jump < 0:
+            if op != Op.LOOP:
+                raise Exception(f"{op.name} cannot jump backwards")
+            jump = -jump
+        if jump > (2 ** 16 - 1):
+            raise Exception("Too far to jump")
+        code.append(op)
+        code += instruction.operand[:-2]
+        code.append((jump >> 8) & 0xff)
+        code.append(jump & 0xff)
+    return code
+
+
+def landing(i: int, program: list[Instruction], index: dict) -> tuple[Op, Instruction]:
+    """Follows the jump at program[i] through the jumps it lands on to the first
+    instruction that does work; returns the op that gets there in one jump and that instruction
+
+    A conditional jump that kept its condition on the stack knows how the
+    next conditional jump it lands on will go: with the same test that one
+    jumps as well, with the opposite test it falls through. Either way the two
+    merge into one jump if some op pops the condition the way both together do.
+    Conditional jumps cannot go backwards, so they stop at a back edge.
+    """
+    jump = program[i]
+    op = jump.op
+    target = jump.target
+    seen = {jump}
+    while target not in seen:
+        seen.add(target)
+        if target.op in GOTO_OPS:
+            merged, destination = op, target.target
+        elif op in BRANCHES and target.op in BRANCHES:
+            when, pops_on_jump, pops_on_fall = BRANCHES[op]
+            if pops_on_jump:
+                break
+            other_when, other_pops_on_jump, other_pops_on_fall = BRANCHES[target.op]
+            if other_when == when:
+                pops, destination = other_pops_on_jump, target.target
+            else:
+                pops, destination = other_pops_on_fall, program[index[target] + 1]
+            merged = BRANCH_OPS.get((when, pops, pops_on_fall))
+            if merged is None:
+                break
+        else:
+            break
+        if merged not in GOTO_OPS and index[destination] <= i:
+            break
+        op, target = merged, destination
+    return op, target
+
+
+def thread_jumps(program: list[Instruction]) -> bool:
+    index = {instruction: i for i, instruction in enumerate(program)}
+    changed = False
+    for i, instruction in enumerate(program):
+        if instruction.target is None:
+            continue
+        op, target = landing(i, program, index)
+        if target is not instruction.target:
+            instruction.op = op
+            instruction.target = target
+            changed = True
+    return changed
+
+
+def sweep(program: list[Instruction]) -> bool:
+    """Removes or merges instructions in one pass over the program; returns True if it changed
+
+    - code after a JUMP or LOOP that nothing jumps to is unreachable
+    - a jump to the next instruction does nothing, or only pops the condition
+    - a side-effect free push followed by POP does nothing
+    - a conditional jump over an unconditional one is the opposite test to its target
+    """
+    targets = {instruction.target for instruction in program if instruction.target is not None}
+    index = {instruction: i for i, instruction in enumerate(program)}
+    kept = list()
+    removed = list()
+    redirect = dict()
+    changed = False
+    # Whether the original code can fall through to the instruction; this
+    # does not depend on what was kept, as removing a jump target with the
+    # instruction before it does not make the code after it dead
+    reachable = True
+
+    def keep(instruction):
+        for gone in removed:
+            redirect[gone] = instruction
+        removed.clear()
+        kept.append(instruction)
+
+    i = 0
+    while i < len(program):
+        instruction = program[i]
+        after = program[i + 1] if i + 1 < len(program) else None
+        when, pops_on_jump, pops_on_fall = BRANCHES.get(instruction.op, (None, None, None))
+
+        if instruction in targets:
+            reachable = True
+
+        if instruction.op is None:
+            keep(instruction)
+        elif not reachable:
+            removed.append(instruction)
+        elif instruction.target is after and (instruction.op in GOTO_OPS or pops_on_jump is pops_on_fall is False):
+            removed.append(instruction)
+        elif instruction.target is after and pops_on_jump and pops_on_fall:
+            instruction.op = Op.POP
+            instruction.target = None
+            instruction.operand = b""
+            keep(instruction)
+            changed = True
+        elif instruction.op in PURE_PUSH_OPS and after.op == Op.POP and after not in targets:
+            removed.extend((instruction, after))
+            i += 1
+        elif (pops_on_jump == pops_on_fall is not None and after.op == Op.JUMP and after not in targets
+              and instruction.target is program[i + 2] and index[after.target] > i):
+            instruction.op = BRANCH_OPS[(not when, pops_on_jump, pops_on_fall)]
+            instruction.target = after.target
+            keep(instruction)
+            removed.append(after)
+            i += 1
+        else:
+            keep(instruction)
+            if instruction.op in GOTO_OPS:
+                reachable = False
+        i += 1
+
+    if len(kept) == len(program):
+        return changed
+
+    for instruction in kept:
+        while instruction.target in redirect:
+            instruction.target = redirect[instruction.target]
+    program[:] = kept
+    return True
+
+
+def optimize(code, lines=None) -> bytearray:
+    """Rewrites code until no peephole rule applies, re-patching all jumps
+
+    lines, the (offset, line) marks of Compiler.lines, is updated in place to
+    the offsets of the rewritten code.
+    """
+    program = decode(code)
+    if lines is not None:
+        marks = iter(lines)
+        mark = next(marks, None)
+        line = None
+        offset = 0
+        for instruction in program:
+            while mark is not None and mark[0] <= offset:
+                line = mark[1]
+                mark = next(marks, None)
+            instruction.line = line
+            offset += instruction.size
+
+    while thread_jumps(program) | sweep(program):
+        pass
+
+    if lines is not None:
+        lines.clear()
+        offset = 0
+        for instruction in program:
+            if instruction.op is not None and (not lines or lines[-1][1] != instruction.line):
+                lines.append((offset, instruction.line))
+            offset += instruction.size
+    return encode(program)
@@ -0,0 +1,133 @@
+import json
+import random
+from bisect import bisect_right
+from collections import Counter
+from time import perf_counter_ns
+
+from .bytecode import Op
+from .vm import TRUE, FALSE
+
+# Ops that leave their result on top of the stack, which is a new value unless it is TRUE or FALSE
+RESULT_OPS = {
+    Op.ADD, Op.SUB, Op.MUL, Op.DIV, Op.NOT, Op.EQUAL, Op.NOT_EQUAL, Op.LESS, Op.LESS_EQUAL, Op.GREATER,
+    Op.GREATER_EQUAL, Op.ADD_LOCAL_CONST, Op.ADD_INT_INT, Op.ADD_STR_STR, Op.SUB_INT_INT, Op.MUL_INT_INT,
+    Op.LESS_INT_INT, Op.LESS_EQUAL_INT_INT, Op.GREATER_INT_INT, Op.GREATER_EQUAL_INT_INT,
+}
+
+
+class Profiler:
+    """Counts and times the instructions a VM runs, by op, by offset and by source line
+
+    Profiler.run runs the VM on run_table's handlers, each wrapped to record
+    itself. With sample=None every instruction is timed; otherwise about one
+    instruction in sample is, picked at random so that a loop does not keep
+    timing the same instructions, and its time counts sample times. Execution
+    counts, and the Int, String and Bool values arithmetic and comparisons
+    make, are always exact.
+    """
+
+    def __init__(self, sample: int | None = None, seed=0):
+        self.sample = sample
+        self.random = random.Random(seed)
+        # Executions and nanoseconds by (offset, op)
+        self.counts = Counter()
+        self.times = Counter()
+        # Values made by arithmetic and comparisons, by class name
+        self.allocations = Counter()
+        # Instructions left until the next timed one, shared by every handler
+        self.countdown = [self.random.randint(1, 2 * sample - 1)] if sample else None
+
+    def run(self, vm):
+        code = vm.code
+        stack = list()
+        handlers = vm.table_handlers(code, stack)
+        vm.run_handlers(code, stack, {op: self.instrument(op, handler, stack)
+                                      for op, handler in handlers.items()})
+
+    def instrument(self, op, handler, stack):
+        """Wraps the run_table handler of op to record each execution"""
+        counts = self.counts
+        times = self.times
+        allocations = self.allocations
+        sample = self.sample
+        randint = self.random.randint
+
+        def allocated():
+            if op == Op.INC_LOCAL:
+                allocations["Int"] += 1
+            elif op in RESULT_OPS:
+                value = stack[-1]
+                if value is not TRUE and value is not FALSE:
+                    allocations[value.__class__.__name__] += 1
+
+        if sample is None:
+            def profiled(ip):
+                start = perf_counter_ns()
+                next_ip = handler(ip)
+                times[ip - 1, op] += perf_counter_ns() - start
+                counts[ip - 1, op] += 1
+                allocated()
+                return next_ip
+            return profiled
+
+        countdown = self.countdown
+
+        def sampled(ip):
+            countdown[0] -= 1
+            if countdown[0]:
+                next_ip = handler(ip)
+            else:
+                countdown[0] = randint(1, 2 * sample - 1)
+                start = perf_counter_ns()
+                next_ip = handler(ip)
+                times[ip - 1, op] += (perf_counter_ns() - start) * sample
+            counts[ip - 1, op] += 1
+            allocated()
+            return next_ip
+        return sampled
+
+    def by_op(self) -> dict:
+        """Executions and seconds of each op, slowest first"""
+        ops = dict()
+        for (offset, op), count in self.counts.items():
+            entry = ops.setdefault(Op(op).name, {"count": 0, "seconds": 0.0})
+            entry["count"] += count
+            entry["seconds"] += self.times[offset, op] / 1e9
+        return dict(sorted(ops.items(), key=lambda item: -item[1]["seconds"]))
+
+    def by_offset(self) -> list[dict]:
+        """Executions and seconds of each instruction, in code order"""
+        return [{"offset": offset, "op": Op(op).name, "count": count, "seconds": self.times[offset, op] / 1e9}
+                for (offset, op), count in sorted(self.counts.items())]
+
+    def by_line(self, line_table) -> list[dict]:
+        """Executions and seconds of the instructions compiled from each source
+        line, in line order; line_table is the Compiler's line_table for the code that ran"""
+        runs = list(line_table.runs())
+        starts = [start for start, _ in runs]
+        lines = dict()
+        for (offset, op), count in self.counts.items():
+            run = bisect_right(starts, offset) - 1
+            line = runs[run][1] if run >= 0 else None
+            entry = lines.setdefault(line, {"line": line, "count": 0, "seconds": 0.0})
+            entry["count"] += count
+            entry["seconds"] += self.times[offset, op] / 1e9
+        return sorted(lines.values(), key=lambda entry: (entry["line"] is None, entry["line"] or 0))
+
+    def to_json(self, line_table=None, **kwargs) -> str:
+        """The profile as JSON, with the by_line entries if line_table is given; kwargs go to json.dumps"""
+        profile = {
+            "sample": self.sample,
+            "ops": self.by_op(),
+            "offsets": self.by_offset(),
+            "allocations": dict(self.allocations),
+        }
+        if line_table is not None:
+            profile["lines"] = self.by_line(line_table)
+        return json.dumps(profile, **kwargs)
+
+    def collapsed(self, weight="time") -> str:
+        """The profile in the collapsed stack format of flame graph tools: one
+        op;offset line per instruction, weighted by nanoseconds or, with weight="count", by executions"""
+        values = self.times if weight == "time" else self.counts
+        return "".join(f"{Op(op).name};{offset} {values[offset, op]}\n" for offset, op in sorted(self.counts))
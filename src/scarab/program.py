@@ -0,0 +1,309 @@
+import hashlib
+import io
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .bytecode import LineTable, read_varint, write_varint
+from .compiler import Compiler
+from .lexer import Lexer
+from .value import Object, Int, String, Bool, Nil
+from .vm import VM
+
+# A .scbc file starts with MAGIC, the format version, the optimize level the
+# code was compiled at and the SHA-256 of the source bytes
+MAGIC = b"SCBC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct(">4sHB32s")
+
+# Where load_file keeps compiled programs, next to their sources
+CACHE_DIRECTORY = "__scarabcache__"
+
+# Tags of the constants in a .scbc file. TAG_FLOAT is defensive: the Compiler does
+# not fold divisions with a non-int result, so only an Int built by hand holds a float
+TAG_INT = 0
+TAG_FLOAT = 1
+TAG_STRING = 2
+TAG_BOOL = 3
+TAG_NIL = 4
+DOUBLE = struct.Struct(">d")
+
+# How many bytes of programs compile_cached keeps
+COMPILE_CACHE_BYTES = 16 * 2 ** 20
+
+
+class CacheError(ValueError):
+    """A .scbc file that is damaged, of another format version, or not compiled from the expected source"""
+
+
+@dataclass(frozen=True)
+class Program:
+    """Everything a VM needs to run a compiled program
+
+    Programs are immutable, so one can be run by any number of VMs, see vm.
+    global_names holds the name of each global slot in slot order.
+    """
+    code: bytes
+    constants: tuple[Object, ...]
+    global_names: tuple[str, ...] = ()
+    max_stack: int = 0
+    line_table: LineTable = LineTable()
+
+    @classmethod
+    def from_compiler(cls, compiler: Compiler) -> "Program":
+        """The program a Compiler has finished compiling"""
+        names = sorted(compiler.global_slots, key=compiler.global_slots.get)
+        return cls(bytes(compiler.code), tuple(compiler.constants), tuple(names), compiler.max_stack,
+                   compiler.line_table)
+
+    @classmethod
+    def compile(cls, source: str, optimize=0) -> "Program":
+        compiler = Compiler(Lexer(source), optimize=optimize)
+        compiler.compile()
+        return cls.from_compiler(compiler)
+
+    @property
+    def size(self) -> int:
+        """About how many bytes the program takes, counting its code, strings and names"""
+        return (len(self.code) + len(self.line_table.data) + sum(map(len, self.global_names))
+                + sum(len(constant.value) if isinstance(constant, String) else 8 for constant in self.constants))
+
+    @property
+    def global_slots(self) -> dict[str, int]:
+        return {name: slot for slot, name in enumerate(self.global_names)}
+
+    def vm(self, **kwargs) -> VM:
+        """A new VM that runs the program; kwargs go to VM
+
+        It gets its own copy of the code, which the adaptive engine rewrites as it runs.
+        """
+        kwargs.setdefault("max_stack", self.max_stack)
+        return VM(bytearray(self.code), list(self.constants), global_slots=self.global_slots, **kwargs)
+
+
+def write_bytes(data: bytearray, value: bytes):
+    write_varint(data, len(value))
+    data += value
+
+
+def read_bytes(data: bytes, at: int) -> tuple[bytes, int]:
+    length, at = read_varint(data, at)
+    if at + length > len(data):
+        raise IndexError("Bytes run past the end of the data")
+    return data[at:at + length], at + length
+
+
+def write_text(data: bytearray, text: str):
+    write_bytes(data, text.encode("utf-8", "surrogatepass"))
+
+
+def read_text(data: bytes, at: int) -> tuple[str, int]:
+    value, at = read_bytes(data, at)
+    return value.decode("utf-8", "surrogatepass"), at
+
+
+def dumps(program: Program, source_hash: bytes, optimize=0) -> bytes:
+    """Serializes program in the .scbc format
+
+    source_hash is the SHA-256 digest of the source bytes the program was
+    compiled from, at the given optimize level, which loads checks.
+    """
+    data = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, optimize, source_hash))
+    write_bytes(data, program.code)
+    write_varint(data, len(program.constants))
+    for constant in program.constants:
+        match constant:
+            case Int(value) if isinstance(value, float):
+                data.append(TAG_FLOAT)
+                data += DOUBLE.pack(value)
+            case Int(value):
+                data.append(TAG_INT)
+                write_varint(data, value * 2 if value >= 0 else -value * 2 - 1)
+            case String(value):
+                data.append(TAG_STRING)
+                write_text(data, value)
+            case Bool(value):
+                data.append(TAG_BOOL)
+                data.append(value)
+            case Nil():
+                data.append(TAG_NIL)
+            case _:
+                raise TypeError(f"Cannot serialize constant {constant!r}")
+    write_varint(data, len(program.global_names))
+    for name in program.global_names:
+        write_text(data, name)
+    write_varint(data, program.max_stack)
+    write_bytes(data, program.line_table.data)
+    return bytes(data)
+
+
+def loads(data: bytes, source_hash: bytes | None = None, optimize: int | None = None) -> Program:
+    """Reads a program serialized by dumps
+
+    Raises CacheError if data is not a whole .scbc file of this FORMAT_VERSION,
+    or if it was compiled from other source or at another optimize level
+    than the ones given.
+    """
+    if len(data) < HEADER.size:
+        raise CacheError("Too short for a header")
+    magic, version, data_optimize, data_hash = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CacheError("Not a .scbc file")
+    if version != FORMAT_VERSION:
+        raise CacheError(f"Format version {version}, expected {FORMAT_VERSION}")
+    if optimize is not None and data_optimize != optimize:
+        raise CacheError(f"Compiled with optimize={data_optimize}, expected {optimize}")
+    if source_hash is not None and data_hash != source_hash:
+        raise CacheError("Compiled from other source")
+
+    try:
+        code, at = read_bytes(data, HEADER.size)
+        constants = list()
+        count, at = read_varint(data, at)
+        for _ in range(count):
+            tag = data[at]
+            at += 1
+            if tag == TAG_FLOAT:
+                constants.append(Int(DOUBLE.unpack_from(data, at)[0]))
+                at += DOUBLE.size
+            elif tag == TAG_INT:
+                zigzag, at = read_varint(data, at)
+                constants.append(Int(zigzag // 2 if zigzag % 2 == 0 else -(zigzag + 1) // 2))
+            elif tag == TAG_STRING:
+                value, at = read_text(data, at)
+                constants.append(String(value))
+            elif tag == TAG_BOOL:
+                constants.append(Bool(bool(data[at])))
+                at += 1
+            elif tag == TAG_NIL:
+                constants.append(Nil())
+            else:
+                raise CacheError(f"Unknown constant tag {tag}")
+        names = list()
+        count, at = read_varint(data, at)
+        for _ in range(count):
+            name, at = read_text(data, at)
+            names.append(name)
+        max_stack, at = read_varint(data, at)
+        lines, at = read_bytes(data, at)
+    except (IndexError, struct.error, UnicodeDecodeError):
+        raise CacheError("Truncated") from None
+    if at != len(data):
+        raise CacheError(f"{len(data) - at} bytes after the program")
+    return Program(code, tuple(constants), tuple(names), max_stack, LineTable(lines))
+
+
+def cache_path(path, optimize=0) -> str:
+    """Where load_file caches the program compiled from the source at path
+
+    Like __pycache__, that is a CACHE_DIRECTORY beside the source, holding
+    <name>.v<FORMAT_VERSION>.opt-<optimize>.scbc for the source file <name>.scarab.
+    """
+    directory, name = os.path.split(os.fspath(path))
+    stem = os.path.splitext(name)[0]
+    return os.path.join(directory, CACHE_DIRECTORY, f"{stem}.v{FORMAT_VERSION}.opt-{optimize}.scbc")
+
+
+def load_file(path, optimize=0, encoding="utf-8", write=True) -> Program:
+    """Loads the program in the source file at path, from its cache_path if that holds it
+
+    On a hit neither Lexer nor Compiler runs. Otherwise the source is
+    compiled and, with write=True, cached; a cache that cannot be written,
+    say in a read-only directory, is skipped.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    source_hash = hashlib.sha256(data).digest()
+    cached = cache_path(path, optimize)
+    try:
+        with open(cached, "rb") as file:
+            return loads(file.read(), source_hash, optimize)
+    except (OSError, CacheError):
+        pass
+
+    # Newlines are translated as Lexer.from_file does
+    program = Program.compile(io.TextIOWrapper(io.BytesIO(data), encoding=encoding).read(), optimize)
+    if write:
+        partial = None
+        try:
+            directory = os.path.dirname(cached)
+            os.makedirs(directory, exist_ok=True)
+            # Written to a file of its own and renamed, so no reader sees half
+            # a file and no other writer, in any thread or process, shares it
+            handle, partial = tempfile.mkstemp(suffix=".tmp", dir=directory)
+            with os.fdopen(handle, "wb") as file:
+                file.write(dumps(program, source_hash, optimize))
+            os.replace(partial, cached)
+        except OSError:
+            if partial is not None and os.path.exists(partial):
+                os.remove(partial)
+    return program
+
+
+class CompileCache:
+    """Programs by source and compiler options, least recently used dropped first
+    once they and their sources take more than max_bytes
+
+    Safe to share between threads. Sources are compiled outside the lock, so a
+    slow compile does not hold up hits; two threads missing on the same source
+    at once both compile it and the first to finish is kept.
+    """
+
+    def __init__(self, max_bytes=COMPILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.programs: OrderedDict[tuple[str, int], Program] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def compile(self, source: str, optimize=0) -> Program:
+        key = (source, optimize)
+        with self.lock:
+            program = self.programs.get(key)
+            if program is not None:
+                self.programs.move_to_end(key)
+                self.hits += 1
+                return program
+            self.misses += 1
+
+        program = Program.compile(source, optimize)
+        size = len(source) + program.size
+        if size > self.max_bytes:
+            return program
+
+        with self.lock:
+            if key in self.programs:
+                return self.programs[key]
+            self.programs[key] = program
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                (evicted_source, _), evicted = self.programs.popitem(last=False)
+                self.bytes -= len(evicted_source) + evicted.size
+                self.evictions += 1
+        return program
+
+    @property
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "programs": len(self.programs), "bytes": self.bytes}
+
+    def clear(self):
+        """Drops every program; the counters keep counting"""
+        with self.lock:
+            self.programs.clear()
+            self.bytes = 0
+
+
+# The cache behind compile_cached
+COMPILE_CACHE = CompileCache()
+
+
+def compile_cached(source: str, optimize=0) -> Program:
+    """Program.compile, memoized in COMPILE_CACHE; the Program returned may be shared, see Program.vm"""
+    return COMPILE_CACHE.compile(source, optimize)
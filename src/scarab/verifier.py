@@ -0,0 +1,107 @@
+from .bytecode import Op, OPERAND_BYTES, BRANCHES, JUMP_OPS, instructions, successors
+
+# Every op code may contain
+OPCODES = frozenset(Op)
+
+# Values each op needs on the stack; ops not listed need none
+STACK_INPUTS = {
+    Op.PRINT: 1,
+    Op.POP: 1,
+    Op.NOT: 1,
+    Op.DEFINE_GLOBAL: 1,
+    Op.DEFINE_GLOBAL_LONG: 1,
+    Op.SET_GLOBAL: 1,
+    Op.SET_GLOBAL_LONG: 1,
+    Op.SET_LOCAL: 1,
+    Op.SET_LOCAL_LONG: 1,
+    **{op: 1 for op in BRANCHES},
+    **{op: 2 for op in (Op.ADD, Op.SUB, Op.MUL, Op.DIV, Op.EQUAL, Op.NOT_EQUAL, Op.LESS, Op.LESS_EQUAL,
+                        Op.GREATER, Op.GREATER_EQUAL, Op.ADD_INT_INT, Op.ADD_STR_STR, Op.SUB_INT_INT,
+                        Op.MUL_INT_INT, Op.LESS_INT_INT, Op.LESS_EQUAL_INT_INT, Op.GREATER_INT_INT,
+                        Op.GREATER_EQUAL_INT_INT)},
+}
+
+# The constant index and the local slots in the operand of each op that has them, as (start, end) byte ranges
+CONSTANT_OPERANDS = {
+    Op.CONSTANT: (0, 1),
+    Op.CONSTANT_LONG: (0, 2),
+    Op.ADD_LOCAL_CONST: (1, 2),
+    Op.LESS_LOCAL_CONST_JUMP_IF_FALSE: (1, 2),
+}
+LOCAL_OPERANDS = {
+    Op.GET_LOCAL: [(0, 1)],
+    Op.GET_LOCAL_LONG: [(0, 2)],
+    Op.ADD_LOCAL_CONST: [(0, 1)],
+    Op.INC_LOCAL: [(0, 1)],
+    Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE: [(0, 1), (1, 2)],
+    Op.LESS_LOCAL_CONST_JUMP_IF_FALSE: [(0, 1)],
+}
+
+
+class VerifyError(ValueError):
+    """Code that verify rejects; offset is where the instruction at fault starts"""
+
+    def __init__(self, offset: int, message: str):
+        super().__init__(f"Offset {offset}: {message}")
+        self.offset = offset
+
+
+def verify(code, constants) -> int:
+    """Checks that code can run without the VM's per-instruction checks and returns its max stack depth
+
+    Every op must be known and have all its operand bytes, every jump must
+    land on an instruction or at the end of the code, and constant indices
+    must be in range. Following every path from the start, no instruction may
+    take more values than the stack holds or read a local slot above the top,
+    and paths that meet must have the same stack depth.
+
+    Raises VerifyError at the offset of the first instruction that breaks a rule.
+    """
+    boundaries = set()
+    for offset, op in instructions(code):
+        if op not in OPCODES:
+            raise VerifyError(offset, f"Unknown opcode {op}")
+        if offset + 1 + OPERAND_BYTES.get(op, 0) > len(code):
+            raise VerifyError(offset, f"{Op(op).name} runs past the end of the code")
+        boundaries.add(offset)
+    boundaries.add(len(code))
+
+    for offset, op in instructions(code):
+        operand = code[offset + 1:offset + 1 + OPERAND_BYTES.get(op, 0)]
+        if op in JUMP_OPS:
+            target = successors(code, offset, 0)[-1][0]
+            if target not in boundaries:
+                raise VerifyError(offset, f"{Op(op).name} jumps to offset {target}, which is not an instruction")
+        if op in CONSTANT_OPERANDS:
+            start, end = CONSTANT_OPERANDS[op]
+            index = int.from_bytes(operand[start:end], "big")
+            if index >= len(constants):
+                raise VerifyError(offset, f"{Op(op).name} reads constant {index} of {len(constants)}")
+
+    depths = {0: 0}
+    pending = [0]
+    while pending:
+        offset = pending.pop()
+        depth = depths[offset]
+        if offset == len(code):
+            continue
+        op = code[offset]
+        operand = code[offset + 1:offset + 1 + OPERAND_BYTES.get(op, 0)]
+        if STACK_INPUTS.get(op, 0) > depth:
+            raise VerifyError(offset, f"{Op(op).name} needs {STACK_INPUTS[op]} values on a stack of {depth}")
+        for start, end in LOCAL_OPERANDS.get(op, ()):
+            slot = int.from_bytes(operand[start:end], "big")
+            if slot >= depth:
+                raise VerifyError(offset, f"{Op(op).name} reads local slot {slot} of a stack of {depth}")
+        if op in (Op.SET_LOCAL, Op.SET_LOCAL_LONG) and int.from_bytes(operand, "big") > depth:
+            raise VerifyError(offset, f"{Op(op).name} sets local slot {int.from_bytes(operand, 'big')}"
+                                      f" of a stack of {depth}")
+
+        for successor, successor_depth in successors(code, offset, depth):
+            if successor not in depths:
+                depths[successor] = successor_depth
+                pending.append(successor)
+            elif depths[successor] != successor_depth:
+                raise VerifyError(successor, f"Stack depth is {depths[successor]} on one path here and"
+                                             f" {successor_depth} coming from offset {offset}")
+    return max(depths.values())
@@ -1,7 +1,11 @@
+import operator
+from dataclasses import dataclass
+from time import perf_counter
 from typing import TypeVar
 
-from scarab.compiler import Op
-from scarab.value import Object, Nil, Bool
+from scarab.bytecode import Op, OPERAND_BYTES, JUMP_OPS, COMPARE_JUMPS, NARROW_OPS, instructions, max_stack_depth
+from scarab.jit import JIT_MAX_TRACE, TraceAborted, translate, compile_trace
+from scarab.value import Object, Nil, Bool, Int, String
 
 
 class TooFarToJump(RuntimeError):
@@ -24,24 +28,36 @@ T = TypeVar('T')
 
 
 class Stack:
+    """The value stack of run_match
+
+    items starts with room for capacity values, the Compiler's max_stack, and
+    grows when a push finds it full. Nothing checks or clears the slots above
+    top; indexing only checks that the slot is live.
+    """
+
     def __init__(self, capacity):
-        self.capacity = capacity
         self.items: list[T] = [None] * capacity
         self.top = -1
 
     def __getitem__(self, item):
-        if item > self.capacity or self.items[item] is None:
+        if item > self.top:
             raise IndexError(item)
         return self.items[item]
 
     def __setitem__(self, index, value):
-        if index > self.capacity:
-            raise IndexError(index)
-
         if index > self.top:
-            self.top = index
+            # Setting the slot above the top pushes, as SET_LOCAL does for x := y := 1
+            if index > self.top + 1:
+                raise IndexError(index)
+            self.push(value)
+        else:
+            self.items[index] = value
+
+    def __len__(self):
+        return self.top + 1
 
-        self.items[index] = value
+    def __iter__(self):
+        return iter(self.items[:self.top + 1])
 
     @property
     def empty(self):
@@ -49,19 +65,17 @@ class Stack:
 
     def push(self, value):
         self.top += 1
-
-        if self.top >= self.capacity:
-            raise StackOverflow
-
-        self[self.top] = value
+        try:
+            self.items[self.top] = value
+        except IndexError:
+            self.items.append(value)
 
     def pop(self):
-        if self.empty:
+        top = self.top
+        if top < 0:
             raise StackUnderflow
-        result = self[self.top]
-        self[self.top] = None
-        self.top -= 1
-        return result
+        self.top = top - 1
+        return self.items[top]
 
     def peek(self, distance=0):
         index = self.top - distance
@@ -70,24 +84,204 @@ class Stack:
         return self.items[index]
 
 
+class UncheckedStack(list):
+    """The value stack of run_match for verified code: a plain list, with no check on pops or slots"""
+    push = list.append
+
+    def __setitem__(self, index, value):
+        if index == len(self):
+            self.append(value)
+        else:
+            super().__setitem__(index, value)
+
+    def peek(self, distance=0):
+        return self[-1 - distance]
+
+
 NIL = Nil()
 TRUE = Bool(True)
 FALSE = Bool(False)
+ONE = Int(1)
+
+# Value of a global slot that has not been defined yet
+UNDEFINED = object()
+
+
+def trace_line(op, stack) -> str:
+    """The line a traced run writes before running op: its name and the values on the stack"""
+    return f"{Op(op).name} {''.join(f'[ {value} ]' for value in stack)}"
+
+
+# Names of the execution engines VM.run can use; engine "x" is VM.run_x
+ENGINES = ("match", "table", "decoded", "adaptive", "closure", "tracing")
+
+# The specialized forms of each generic op, by the classes of its operands
+SPECIALIZATIONS = {
+    Op.ADD: {(Int, Int): Op.ADD_INT_INT, (String, String): Op.ADD_STR_STR},
+    Op.SUB: {(Int, Int): Op.SUB_INT_INT},
+    Op.MUL: {(Int, Int): Op.MUL_INT_INT},
+    Op.LESS: {(Int, Int): Op.LESS_INT_INT},
+    Op.LESS_EQUAL: {(Int, Int): Op.LESS_EQUAL_INT_INT},
+    Op.GREATER: {(Int, Int): Op.GREATER_INT_INT},
+    Op.GREATER_EQUAL: {(Int, Int): Op.GREATER_EQUAL_INT_INT},
+}
+
+# The class of the result of each specialized op and the function that
+# computes its raw value from the raw values of the operands
+FAST_PATHS = {
+    Op.ADD_INT_INT: (Int, operator.add),
+    Op.ADD_STR_STR: (String, operator.add),
+    Op.SUB_INT_INT: (Int, operator.sub),
+    Op.MUL_INT_INT: (Int, operator.mul),
+    Op.LESS_INT_INT: (Bool, operator.lt),
+    Op.LESS_EQUAL_INT_INT: (Bool, operator.le),
+    Op.GREATER_INT_INT: (Bool, operator.gt),
+    Op.GREATER_EQUAL_INT_INT: (Bool, operator.ge),
+}
+
+# The generic op of each specialized op
+GENERIC_OPS = {op: generic for generic, specializations in SPECIALIZATIONS.items() for op in specializations.values()}
+
+# Executions with specializable operands before a generic op is rewritten,
+# and the most a deoptimized one waits before trying again
+ADAPTIVE_WARMUP = 8
+ADAPTIVE_MAX_BACKOFF = 1024
+
+# Times the tracing engine takes a back edge before it compiles the loop
+JIT_THRESHOLD = 50
+
+@dataclass(frozen=True)
+class Decoded:
+    """Bytecode decoded once into one op and one argument per instruction
+
+    Constants are resolved to their values, slots are plain ints and jumps
+    hold the index of the instruction they land on, the end of the code being
+    len(ops). Wide ops become their one-byte forms and LOOP becomes JUMP.
+    offsets holds the bytecode offset each instruction came from.
+    """
+    ops: tuple[int, ...]
+    args: tuple
+    offsets: tuple[int, ...]
+
+
+def predecode(code, constants) -> Decoded:
+    """Decodes code for the decoded engine; the result only depends on code and constants, so it can be kept with them"""
+    offsets = [offset for offset, _ in instructions(code)]
+    index = {offset: i for i, offset in enumerate(offsets)}
+    index[len(code)] = len(offsets)
+
+    ops = list()
+    args = list()
+    for offset in offsets:
+        op = code[offset]
+        size = OPERAND_BYTES.get(op, 0)
+        operand = code[offset + 1:offset + 1 + size]
+        target = None
+        if op in JUMP_OPS:
+            jump = (operand[-2] << 8) | operand[-1]
+            after = offset + 1 + size
+            target = index.get(after - jump if op == Op.LOOP else after + jump)
+            if target is None:
+                raise ValueError(f"Jump at offset {offset} does not land on an instruction")
+
+        match op:
+            case Op.CONSTANT | Op.CONSTANT_LONG:
+                arg = constants[int.from_bytes(operand, "big")]
+            case Op.ADD_LOCAL_CONST:
+                arg = (operand[0], constants[operand[1]])
+            case Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE:
+                arg = (operand[0], operand[1], target)
+            case Op.LESS_LOCAL_CONST_JUMP_IF_FALSE:
+                arg = (operand[0], constants[operand[1]], target)
+            case _ if target is not None:
+                arg = target
+            case _ if size:
+                arg = int.from_bytes(operand, "big")
+            case _:
+                arg = None
+
+        ops.append(Op.JUMP if op == Op.LOOP else NARROW_OPS.get(op, op))
+        args.append(arg)
+    return Decoded(tuple(ops), tuple(args), tuple(offsets))
 
 
 class VM:
-    def __init__(self, code: bytearray, constants: list[Object], *, ir=False, trace=False, capture=False):
+    # The engine used by instances that do not pass one
+    engine = "match"
+    # Whether the tracing engine compiles hot loops, and how hot they have to be
+    jit = True
+    jit_threshold = JIT_THRESHOLD
+
+    def __init__(self, code: bytearray, constants: list[Object], *, global_slots=None, ir=False, trace=False,
+                 capture=False, engine=None, decoded=None, jit=None, jit_threshold=None, max_stack=None,
+                 verified=False):
         self.code = code
         self.constants = constants
+        # Passing a Decoded for code saves the decoded engine from decoding it again
+        self.decoded = decoded
         self.ip = -1
-        self.stack = Stack(256)
-        self.table = dict()
+        # The stack of run_match, sized from max_stack, or from the code when it is None
+        self.max_stack = max_stack
+        self.stack = None
+        # Code that passed scarab.verifier.verify runs on an UncheckedStack
+        self.verified = verified
+
+        # Globals live in a flat list indexed by the slots the Compiler gave
+        # them; global_slots is its name to slot map, used to name them
+        self.global_slots = dict() if global_slots is None else global_slots
+        self.globals = [UNDEFINED] * len(self.global_slots)
 
         self.output_ir = ir
-        self.stack_trace = trace
+        # trace is True to print a line per instruction run, or a callable that takes each line
+        self.stack_trace = bool(trace)
+        self.trace_sink = trace if callable(trace) else print
         self.capture_output = capture
         self.captured = list()
 
+        # Counters of the adaptive engine, indexed by specialized op
+        self.quickenings = [0] * 256
+        self.hits = [0] * 256
+        self.misses = [0] * 256
+
+        # The tracing engine's Python source for each loop, by the offset of
+        # its LOOP, None for loops it could not compile; and its counters
+        self.traces = dict()
+        self.jit_stats = {"compiled": 0, "aborted": 0, "entered": 0, "guard_failures": 0, "seconds": 0.0,
+                          "compile_seconds": 0.0}
+        if jit is not None:
+            self.jit = jit
+        if jit_threshold is not None:
+            self.jit_threshold = jit_threshold
+
+        if engine is not None:
+            if engine not in ENGINES:
+                raise ValueError(f"Unknown engine {engine!r}")
+            self.engine = engine
+
+    @property
+    def table(self):
+        """The defined globals by name, or by slot for those global_slots does not name"""
+        names = {slot: name for name, slot in self.global_slots.items()}
+        return {names.get(slot, slot): value for slot, value in enumerate(self.globals) if value is not UNDEFINED}
+
+    @property
+    def specialization_stats(self):
+        """How often the adaptive engine rewrote an op to each specialized form,
+        ran the fast path of that form and fell back from it to the generic op"""
+        return {Op(op).name: {"quickened": self.quickenings[op], "hits": self.hits[op], "misses": self.misses[op]}
+                for op in FAST_PATHS if self.quickenings[op]}
+
+    def global_name(self, slot):
+        for name, named_slot in self.global_slots.items():
+            if named_slot == slot:
+                return name
+        return f"<global {slot}>"
+
+    def define_global(self, slot, value):
+        if slot >= len(self.globals):
+            self.globals.extend([UNDEFINED] * (slot + 1 - len(self.globals)))
+        self.globals[slot] = value
+
     @property
     def end(self):
         return len(self.code) - 1
@@ -108,6 +302,9 @@ class VM:
         lower = self.read_byte()
         return (upper << 8) | lower
 
+    def read_constant_long(self):
+        return self.constants[self.read_short()]
+
     def debug_ir(self):
         offset = 0
         print("=== code ===")
@@ -119,14 +316,41 @@ class VM:
                     print(f"{str(offset).zfill(3)} {op.name}\t({constant!s})")
                     offset += 2
                 case Op.DEFINE_GLOBAL | Op.GET_GLOBAL | Op.SET_GLOBAL:
-                    constant = self.constants[self.code[offset + 1]]
-                    print(f"{str(offset).zfill(3)} {op.name}\t({constant!s})")
+                    name = self.global_name(self.code[offset + 1])
+                    print(f"{str(offset).zfill(3)} {op.name}\t({name})")
                     offset += 2
-                case Op.GET_LOCAL | Op.SET_LOCAL:
+                case Op.CONSTANT_LONG:
+                    index = (self.code[offset + 1] << 8) | self.code[offset + 2]
+                    constant = self.constants[index]
+                    print(f"{str(offset).zfill(3)} {op.name}\t({constant!s})")
+                    offset += 3
+                case Op.DEFINE_GLOBAL_LONG | Op.GET_GLOBAL_LONG | Op.SET_GLOBAL_LONG:
+                    name = self.global_name((self.code[offset + 1] << 8) | self.code[offset + 2])
+                    print(f"{str(offset).zfill(3)} {op.name}\t({name})")
+                    offset += 3
+                case Op.GET_LOCAL | Op.SET_LOCAL | Op.INC_LOCAL:
                     local = self.code[offset + 1]
                     print(f"{str(offset).zfill(3)} {op.name}\t({local})")
                     offset += 2
-                case Op.JUMP_IF_FALSE | Op.JUMP | Op.LOOP:
+                case Op.GET_LOCAL_LONG | Op.SET_LOCAL_LONG:
+                    local = (self.code[offset + 1] << 8) | self.code[offset + 2]
+                    print(f"{str(offset).zfill(3)} {op.name}\t({local})")
+                    offset += 3
+                case Op.ADD_LOCAL_CONST:
+                    local = self.code[offset + 1]
+                    constant = self.constants[self.code[offset + 2]]
+                    print(f"{str(offset).zfill(3)} {op.name}\t({local}, {constant!s})")
+                    offset += 3
+                case Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE | Op.LESS_LOCAL_CONST_JUMP_IF_FALSE:
+                    local = self.code[offset + 1]
+                    other = self.code[offset + 2]
+                    if op == Op.LESS_LOCAL_CONST_JUMP_IF_FALSE:
+                        other = self.constants[other]
+                    operand = (self.code[offset + 3] << 8) | self.code[offset + 4]
+                    print(f"{str(offset).zfill(3)} {op.name}\t({local}, {other!s}) ({operand})")
+                    offset += 5
+                case (Op.JUMP_IF_FALSE | Op.JUMP_IF_TRUE | Op.JUMP | Op.LOOP | Op.POP_JUMP_IF_FALSE | Op.POP_JUMP_IF_TRUE
+                      | Op.JUMP_IF_FALSE_OR_POP | Op.JUMP_IF_TRUE_OR_POP):
                     upper = self.code[offset + 1]
                     lower = self.code[offset + 2]
                     operand = (upper << 8) | lower
@@ -147,11 +371,28 @@ class VM:
             self.debug_ir()
             print()
 
-        while self.ip < self.end:
-            op = self.read_byte()
+        getattr(self, f"run_{self.engine}")()
 
-            if self.stack_trace:
-                print(Op(op).name, "".join(list(map(lambda x: f"[ {x} ]", self.stack))))
+    def run_match(self):
+        """Decodes and dispatches each instruction with a match statement"""
+        if self.verified:
+            self.stack = UncheckedStack()
+        else:
+            if self.max_stack is None:
+                self.max_stack = max_stack_depth(self.code)
+            self.stack = Stack(self.max_stack)
+        if self.stack_trace:
+            sink = self.trace_sink
+            while self.ip < self.end:
+                sink(trace_line(self.code[self.ip + 1], self.stack))
+                self.match_instructions(-1)
+        elif self.ip < self.end:
+            self.match_instructions(self.end)
+
+    def match_instructions(self, end):
+        """Runs instructions with the match statement until self.ip reaches end, always at least one"""
+        while True:
+            op = self.read_byte()
 
             match op:
                 case Op.POP:
@@ -159,15 +400,40 @@ class VM:
                 case Op.JUMP:
                     offset = self.read_short()
                     self.ip += offset
-                case Op.JUMP_IF_FALSE:
+                case Op.POP_JUMP_IF_FALSE:
                     offset = self.read_short()
-                    if not self.stack.peek():
+                    if not self.stack.pop():
+                        self.ip += offset
+                case Op.POP_JUMP_IF_TRUE:
+                    offset = self.read_short()
+                    if self.stack.pop():
                         self.ip += offset
                 case Op.LOOP:
                     offset = self.read_short()
                     self.ip -= offset
+                case Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE:
+                    a = self.stack[self.read_byte()]
+                    b = self.stack[self.read_byte()]
+                    offset = self.read_short()
+                    if not a < b:
+                        self.ip += offset
+                case Op.LESS_LOCAL_CONST_JUMP_IF_FALSE:
+                    a = self.stack[self.read_byte()]
+                    b = self.read_constant()
+                    offset = self.read_short()
+                    if not a < b:
+                        self.ip += offset
+                case Op.ADD_LOCAL_CONST:
+                    a = self.stack[self.read_byte()]
+                    b = self.read_constant()
+                    self.stack.push(a + b)
+                case Op.INC_LOCAL:
+                    slot = self.read_byte()
+                    self.stack[slot] = self.stack[slot] + ONE
                 case Op.CONSTANT:
                     self.stack.push(self.read_constant())
+                case Op.CONSTANT_LONG:
+                    self.stack.push(self.read_constant_long())
                 case Op.TRUE:
                     self.stack.push(TRUE)
                 case Op.FALSE:
@@ -190,6 +456,8 @@ class VM:
                     b = self.stack.pop()
                     a = self.stack.pop()
                     self.stack.push(a / b)
+                case Op.NOT:
+                    self.stack.push(Bool(not self.stack.pop()))
                 case Op.EQUAL:
                     b = self.stack.pop()
                     a = self.stack.pop()
@@ -215,24 +483,945 @@ class VM:
                     a = self.stack.pop()
                     self.stack.push(Bool(a >= b))
                 case Op.DEFINE_GLOBAL:
-                    name = self.read_constant()
-                    self.table[name] = self.stack.peek()
+                    self.define_global(self.read_byte(), self.stack.peek())
                 case Op.SET_GLOBAL:
-                    name = self.read_constant()
-                    if name not in self.table:
-                        raise NameError(name)
-                    self.table[name] = self.stack.peek()
+                    slot = self.read_byte()
+                    if slot >= len(self.globals) or self.globals[slot] is UNDEFINED:
+                        raise NameError(self.global_name(slot))
+                    self.globals[slot] = self.stack.peek()
                 case Op.GET_GLOBAL:
-                    name = self.read_constant()
-                    if name in self.table:
-                        self.stack.push(self.table[name])
-                    else:
-                        raise NameError(name)
+                    slot = self.read_byte()
+                    value = self.globals[slot] if slot < len(self.globals) else UNDEFINED
+                    if value is UNDEFINED:
+                        raise NameError(self.global_name(slot))
+                    self.stack.push(value)
+                case Op.DEFINE_GLOBAL_LONG:
+                    self.define_global(self.read_short(), self.stack.peek())
+                case Op.SET_GLOBAL_LONG:
+                    slot = self.read_short()
+                    if slot >= len(self.globals) or self.globals[slot] is UNDEFINED:
+                        raise NameError(self.global_name(slot))
+                    self.globals[slot] = self.stack.peek()
+                case Op.GET_GLOBAL_LONG:
+                    slot = self.read_short()
+                    value = self.globals[slot] if slot < len(self.globals) else UNDEFINED
+                    if value is UNDEFINED:
+                        raise NameError(self.global_name(slot))
+                    self.stack.push(value)
                 case Op.SET_LOCAL:
                     slot = self.read_byte()
                     self.stack[slot] = self.stack.peek()
                 case Op.GET_LOCAL:
                     slot = self.read_byte()
                     self.stack.push(self.stack[slot])
+                case Op.SET_LOCAL_LONG:
+                    slot = self.read_short()
+                    self.stack[slot] = self.stack.peek()
+                case Op.GET_LOCAL_LONG:
+                    slot = self.read_short()
+                    self.stack.push(self.stack[slot])
+                case Op.JUMP_IF_FALSE_OR_POP:
+                    offset = self.read_short()
+                    if not self.stack.peek():
+                        self.ip += offset
+                    else:
+                        self.stack.pop()
+                case Op.JUMP_IF_TRUE_OR_POP:
+                    offset = self.read_short()
+                    if self.stack.peek():
+                        self.ip += offset
+                    else:
+                        self.stack.pop()
+                case Op.JUMP_IF_FALSE:
+                    offset = self.read_short()
+                    if not self.stack.peek():
+                        self.ip += offset
+                case Op.JUMP_IF_TRUE:
+                    offset = self.read_short()
+                    if self.stack.peek():
+                        self.ip += offset
                 case _:
                     raise UnknownOpCode(op)
+
+            if self.ip >= end:
+                break
+
+    def run_table(self):
+        """Dispatches through a list of handlers indexed by opcode
+
+        Each handler takes the offset just past its opcode, decodes its own
+        operands and returns the offset of the next instruction. The code,
+        constants, globals and a plain list for the stack are local variables
+        of the handlers, so the loop itself does nothing but index and call.
+        """
+        stack = list()
+        self.run_handlers(self.code, stack, self.table_handlers(self.code, stack))
+
+    def table_handlers(self, code, stack) -> dict:
+        """Builds the run_table handler of every op, working on code and stack"""
+        constants = self.constants
+        globals = self.globals
+        global_name = self.global_name
+        define_global = self.define_global
+        output = self.print
+        push = stack.append
+        pop = stack.pop
+
+        def pop_handler(ip):
+            pop()
+            return ip
+
+        def constant(ip):
+            push(constants[code[ip]])
+            return ip + 1
+
+        def constant_long(ip):
+            push(constants[(code[ip] << 8) | code[ip + 1]])
+            return ip + 2
+
+        def true(ip):
+            push(TRUE)
+            return ip
+
+        def false(ip):
+            push(FALSE)
+            return ip
+
+        def print_handler(ip):
+            output(pop())
+            return ip
+
+        def add(ip):
+            b = pop()
+            stack[-1] = stack[-1] + b
+            return ip
+
+        def sub(ip):
+            b = pop()
+            stack[-1] = stack[-1] - b
+            return ip
+
+        def mul(ip):
+            b = pop()
+            stack[-1] = stack[-1] * b
+            return ip
+
+        def div(ip):
+            b = pop()
+            stack[-1] = stack[-1] / b
+            return ip
+
+        def not_handler(ip):
+            stack[-1] = FALSE if stack[-1] else TRUE
+            return ip
+
+        def equal(ip):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] == b else FALSE
+            return ip
+
+        def not_equal(ip):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] != b else FALSE
+            return ip
+
+        def less(ip):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] < b else FALSE
+            return ip
+
+        def less_equal(ip):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] <= b else FALSE
+            return ip
+
+        def greater(ip):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] > b else FALSE
+            return ip
+
+        def greater_equal(ip):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] >= b else FALSE
+            return ip
+
+        def define(slot):
+            define_global(slot, stack[-1])
+
+        def assign(slot):
+            if slot >= len(globals) or globals[slot] is UNDEFINED:
+                raise NameError(global_name(slot))
+            globals[slot] = stack[-1]
+
+        def load(slot):
+            value = globals[slot] if slot < len(globals) else UNDEFINED
+            if value is UNDEFINED:
+                raise NameError(global_name(slot))
+            push(value)
+
+        def define_global_handler(ip):
+            define(code[ip])
+            return ip + 1
+
+        def set_global(ip):
+            assign(code[ip])
+            return ip + 1
+
+        def get_global(ip):
+            load(code[ip])
+            return ip + 1
+
+        def define_global_long(ip):
+            define((code[ip] << 8) | code[ip + 1])
+            return ip + 2
+
+        def set_global_long(ip):
+            assign((code[ip] << 8) | code[ip + 1])
+            return ip + 2
+
+        def get_global_long(ip):
+            load((code[ip] << 8) | code[ip + 1])
+            return ip + 2
+
+        def store_local(slot):
+            # x := y := 1 declares y in the slot of the value and x in the one above it
+            if slot < len(stack):
+                stack[slot] = stack[-1]
+            else:
+                push(stack[-1])
+
+        def set_local(ip):
+            store_local(code[ip])
+            return ip + 1
+
+        def get_local(ip):
+            push(stack[code[ip]])
+            return ip + 1
+
+        def set_local_long(ip):
+            store_local((code[ip] << 8) | code[ip + 1])
+            return ip + 2
+
+        def get_local_long(ip):
+            push(stack[(code[ip] << 8) | code[ip + 1]])
+            return ip + 2
+
+        def jump(ip):
+            return ip + 2 + ((code[ip] << 8) | code[ip + 1])
+
+        def loop(ip):
+            return ip + 2 - ((code[ip] << 8) | code[ip + 1])
+
+        def jump_if_false(ip):
+            if stack[-1]:
+                return ip + 2
+            return ip + 2 + ((code[ip] << 8) | code[ip + 1])
+
+        def jump_if_true(ip):
+            if stack[-1]:
+                return ip + 2 + ((code[ip] << 8) | code[ip + 1])
+            return ip + 2
+
+        def pop_jump_if_false(ip):
+            if pop():
+                return ip + 2
+            return ip + 2 + ((code[ip] << 8) | code[ip + 1])
+
+        def pop_jump_if_true(ip):
+            if pop():
+                return ip + 2 + ((code[ip] << 8) | code[ip + 1])
+            return ip + 2
+
+        def jump_if_false_or_pop(ip):
+            if stack[-1]:
+                pop()
+                return ip + 2
+            return ip + 2 + ((code[ip] << 8) | code[ip + 1])
+
+        def jump_if_true_or_pop(ip):
+            if stack[-1]:
+                return ip + 2 + ((code[ip] << 8) | code[ip + 1])
+            pop()
+            return ip + 2
+
+        def add_local_const(ip):
+            push(stack[code[ip]] + constants[code[ip + 1]])
+            return ip + 2
+
+        def inc_local(ip):
+            slot = code[ip]
+            stack[slot] = stack[slot] + ONE
+            return ip + 1
+
+        def less_local_local_jump_if_false(ip):
+            if stack[code[ip]] < stack[code[ip + 1]]:
+                return ip + 4
+            return ip + 4 + ((code[ip + 2] << 8) | code[ip + 3])
+
+        def less_local_const_jump_if_false(ip):
+            if stack[code[ip]] < constants[code[ip + 1]]:
+                return ip + 4
+            return ip + 4 + ((code[ip + 2] << 8) | code[ip + 3])
+
+        return {
+            Op.CONSTANT: constant,
+            Op.TRUE: true,
+            Op.FALSE: false,
+            Op.PRINT: print_handler,
+            Op.POP: pop_handler,
+            Op.ADD: add,
+            Op.SUB: sub,
+            Op.MUL: mul,
+            Op.DIV: div,
+            Op.NOT: not_handler,
+            Op.EQUAL: equal,
+            Op.NOT_EQUAL: not_equal,
+            Op.LESS: less,
+            Op.LESS_EQUAL: less_equal,
+            Op.GREATER: greater,
+            Op.GREATER_EQUAL: greater_equal,
+            Op.DEFINE_GLOBAL: define_global_handler,
+            Op.SET_GLOBAL: set_global,
+            Op.GET_GLOBAL: get_global,
+            Op.SET_LOCAL: set_local,
+            Op.GET_LOCAL: get_local,
+            Op.JUMP_IF_FALSE: jump_if_false,
+            Op.JUMP: jump,
+            Op.LOOP: loop,
+            Op.CONSTANT_LONG: constant_long,
+            Op.DEFINE_GLOBAL_LONG: define_global_long,
+            Op.SET_GLOBAL_LONG: set_global_long,
+            Op.GET_GLOBAL_LONG: get_global_long,
+            Op.JUMP_IF_TRUE: jump_if_true,
+            Op.POP_JUMP_IF_FALSE: pop_jump_if_false,
+            Op.POP_JUMP_IF_TRUE: pop_jump_if_true,
+            Op.JUMP_IF_FALSE_OR_POP: jump_if_false_or_pop,
+            Op.JUMP_IF_TRUE_OR_POP: jump_if_true_or_pop,
+            Op.ADD_LOCAL_CONST: add_local_const,
+            Op.INC_LOCAL: inc_local,
+            Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE: less_local_local_jump_if_false,
+            Op.LESS_LOCAL_CONST_JUMP_IF_FALSE: less_local_const_jump_if_false,
+            Op.GET_LOCAL_LONG: get_local_long,
+            Op.SET_LOCAL_LONG: set_local_long,
+        }
+
+    def run_adaptive(self):
+        """run_table on a private copy of the code that quickens itself
+
+        A generic op that keeps seeing operands of classes it has a
+        specialized form for is rewritten in place to that form, which checks
+        the classes and computes on the raw values without going through the
+        Value dunders. On other operands the specialized form deoptimizes: it
+        rewrites the op back and waits twice as long before specializing again.
+        """
+        code = bytearray(self.code)
+        stack = list()
+        handlers = self.table_handlers(code, stack)
+        quickenings = self.quickenings
+        hits = self.hits
+        misses = self.misses
+        pop = stack.pop
+        # Executions left before each offset is specialized, and its current wait
+        warmups = dict()
+        backoffs = dict()
+
+        def adaptive(op, generic, specializations):
+            def handler(ip):
+                specialized = specializations.get((stack[-2].__class__, stack[-1].__class__))
+                if specialized is None:
+                    warmups[ip - 1] = backoffs.get(ip - 1, ADAPTIVE_WARMUP)
+                    return generic(ip)
+
+                warmup = warmups.get(ip - 1, ADAPTIVE_WARMUP) - 1
+                if warmup > 0:
+                    warmups[ip - 1] = warmup
+                    return generic(ip)
+
+                code[ip - 1] = specialized
+                quickenings[specialized] += 1
+                return handlers[specialized](ip)
+            return handler
+
+        def deoptimize(op, generic, ip):
+            misses[op] += 1
+            code[ip - 1] = generic
+            backoff = min(backoffs.get(ip - 1, ADAPTIVE_WARMUP) * 2, ADAPTIVE_MAX_BACKOFF)
+            backoffs[ip - 1] = warmups[ip - 1] = backoff
+            return handlers[generic](ip)
+
+        def specialized(op, generic, left, right, result, function):
+            if result is Bool:
+                def handler(ip):
+                    b = stack[-1]
+                    a = stack[-2]
+                    if a.__class__ is not left or b.__class__ is not right:
+                        return deoptimize(op, generic, ip)
+                    hits[op] += 1
+                    pop()
+                    stack[-1] = TRUE if function(a.value, b.value) else FALSE
+                    return ip
+            else:
+                def handler(ip):
+                    b = stack[-1]
+                    a = stack[-2]
+                    if a.__class__ is not left or b.__class__ is not right:
+                        return deoptimize(op, generic, ip)
+                    hits[op] += 1
+                    pop()
+                    stack[-1] = result(function(a.value, b.value))
+                    return ip
+            return handler
+
+        for generic, specializations in SPECIALIZATIONS.items():
+            for (left, right), op in specializations.items():
+                handlers[op] = specialized(op, generic, left, right, *FAST_PATHS[op])
+            handlers[generic] = adaptive(generic, handlers[generic], specializations)
+
+        self.run_handlers(code, stack, handlers)
+
+    def run_tracing(self):
+        """run_table, compiling the loops it keeps running to Python with scarab.jit
+
+        LOOP counts how often each back edge is taken. The jit_threshold-th
+        time it records the instructions one more iteration runs, translates
+        them and compiles the result. From then on the back edge runs the
+        compiled loop, which returns the offset the interpreter continues at
+        when the loop ends or takes a path it was not compiled for.
+        """
+        code = self.code
+        stack = list()
+        handlers = self.table_handlers(code, stack)
+        if self.jit and not self.stack_trace:
+            handlers[Op.LOOP] = self.tracing_loop(code, stack, handlers)
+        self.run_handlers(code, stack, handlers)
+
+    def tracing_loop(self, code, stack, handlers: dict):
+        """Builds the LOOP handler of run_tracing around the run_table handlers"""
+        globals = self.globals
+        output = self.print
+        traces = self.traces
+        stats = self.jit_stats
+        loop = handlers[Op.LOOP]
+        compiled = dict()
+        counts = dict()
+
+        def enter(trace, head):
+            start = perf_counter()
+            try:
+                exit = trace(stack, globals)
+            finally:
+                stats["seconds"] += perf_counter() - start
+            if exit is None:
+                stats["guard_failures"] += 1
+                return head
+            stats["entered"] += 1
+            return exit
+
+        def record(ip, head):
+            """Runs one iteration from head, compiling it if it comes back to the LOOP at ip - 1"""
+            stack_classes = [value.__class__ for value in stack]
+            global_classes = [value.__class__ for value in globals]
+            path = list()
+            offset = head
+            while len(path) < JIT_MAX_TRACE:
+                handler = handlers.get(code[offset])
+                if handler is None:
+                    break
+                next_offset = loop(offset + 1) if offset == ip - 1 else handler(offset + 1)
+                path.append((offset, next_offset))
+                if offset == ip - 1:
+                    start = perf_counter()
+                    try:
+                        source = translate(code, self.constants, path, stack_classes, global_classes)
+                    except TraceAborted:
+                        offset = next_offset
+                        break
+                    traces[ip - 1] = source
+                    compiled[ip] = compile_trace(source, head, output)
+                    stats["compiled"] += 1
+                    stats["compile_seconds"] += perf_counter() - start
+                    return enter(compiled[ip], head)
+                # Leaving the loop or running another one ends the recording
+                offset = next_offset
+                if not head <= offset < ip + 2 or code[path[-1][0]] == Op.LOOP:
+                    break
+            traces[ip - 1] = None
+            stats["aborted"] += 1
+            return offset
+
+        def tracing_loop(ip):
+            trace = compiled.get(ip)
+            if trace is not None:
+                return enter(trace, loop(ip))
+            head = loop(ip)
+            if ip - 1 in traces:
+                return head
+            count = counts.get(ip, 0) + 1
+            counts[ip] = count
+            if count < self.jit_threshold:
+                return head
+            return record(ip, head)
+        return tracing_loop
+
+    def run_handlers(self, code, stack, handlers: dict):
+        """Runs code with a handler per op as built by table_handlers"""
+        def unknown(ip):
+            raise UnknownOpCode(code[ip - 1])
+
+        if self.stack_trace:
+            sink = self.trace_sink
+
+            def traced(handler):
+                def trace(ip):
+                    sink(trace_line(code[ip - 1], stack))
+                    return handler(ip)
+                return trace
+
+            handlers = {op: traced(handler) for op, handler in handlers.items()}
+
+        table = [unknown] * 256
+        for op, handler in handlers.items():
+            table[op] = handler
+
+        ip = self.ip + 1
+        end = len(code)
+        try:
+            while ip < end:
+                ip = table[code[ip]](ip + 1)
+        except IndexError:
+            if not stack:
+                raise StackUnderflow
+            raise
+        finally:
+            self.ip = ip - 1
+
+    def run_decoded(self):
+        """Dispatches a Decoded instruction stream through a list of handlers
+
+        Like run_table, but operands were decoded ahead of time: each handler
+        gets its argument and the index of the next instruction and returns
+        the index to continue at.
+        """
+        if self.decoded is None:
+            self.decoded = predecode(self.code, self.constants)
+        decoded = self.decoded
+        globals = self.globals
+        global_name = self.global_name
+        define_global = self.define_global
+        output = self.print
+        stack = list()
+        push = stack.append
+        pop = stack.pop
+
+        def pop_handler(arg, i):
+            pop()
+            return i
+
+        def constant(value, i):
+            push(value)
+            return i
+
+        def print_handler(arg, i):
+            output(pop())
+            return i
+
+        def add(arg, i):
+            b = pop()
+            stack[-1] = stack[-1] + b
+            return i
+
+        def sub(arg, i):
+            b = pop()
+            stack[-1] = stack[-1] - b
+            return i
+
+        def mul(arg, i):
+            b = pop()
+            stack[-1] = stack[-1] * b
+            return i
+
+        def div(arg, i):
+            b = pop()
+            stack[-1] = stack[-1] / b
+            return i
+
+        def not_handler(arg, i):
+            stack[-1] = FALSE if stack[-1] else TRUE
+            return i
+
+        def equal(arg, i):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] == b else FALSE
+            return i
+
+        def not_equal(arg, i):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] != b else FALSE
+            return i
+
+        def less(arg, i):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] < b else FALSE
+            return i
+
+        def less_equal(arg, i):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] <= b else FALSE
+            return i
+
+        def greater(arg, i):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] > b else FALSE
+            return i
+
+        def greater_equal(arg, i):
+            b = pop()
+            stack[-1] = TRUE if stack[-1] >= b else FALSE
+            return i
+
+        def define_global_handler(slot, i):
+            define_global(slot, stack[-1])
+            return i
+
+        def set_global(slot, i):
+            if slot >= len(globals) or globals[slot] is UNDEFINED:
+                raise NameError(global_name(slot))
+            globals[slot] = stack[-1]
+            return i
+
+        def get_global(slot, i):
+            value = globals[slot] if slot < len(globals) else UNDEFINED
+            if value is UNDEFINED:
+                raise NameError(global_name(slot))
+            push(value)
+            return i
+
+        def set_local(slot, i):
+            if slot < len(stack):
+                stack[slot] = stack[-1]
+            else:
+                # x := y := 1 declares y in the slot of the value and x in the one above it
+                push(stack[-1])
+            return i
+
+        def get_local(slot, i):
+            push(stack[slot])
+            return i
+
+        def jump(target, i):
+            return target
+
+        def jump_if_false(target, i):
+            return i if stack[-1] else target
+
+        def jump_if_true(target, i):
+            return target if stack[-1] else i
+
+        def pop_jump_if_false(target, i):
+            return i if pop() else target
+
+        def pop_jump_if_true(target, i):
+            return target if pop() else i
+
+        def jump_if_false_or_pop(target, i):
+            if stack[-1]:
+                pop()
+                return i
+            return target
+
+        def jump_if_true_or_pop(target, i):
+            if stack[-1]:
+                return target
+            pop()
+            return i
+
+        def add_local_const(arg, i):
+            slot, value = arg
+            push(stack[slot] + value)
+            return i
+
+        def inc_local(slot, i):
+            stack[slot] = stack[slot] + ONE
+            return i
+
+        def less_local_local_jump_if_false(arg, i):
+            a, b, target = arg
+            return i if stack[a] < stack[b] else target
+
+        def less_local_const_jump_if_false(arg, i):
+            a, value, target = arg
+            return i if stack[a] < value else target
+
+        handlers = {
+            Op.CONSTANT: constant,
+            Op.TRUE: lambda arg, i: constant(TRUE, i),
+            Op.FALSE: lambda arg, i: constant(FALSE, i),
+            Op.PRINT: print_handler,
+            Op.POP: pop_handler,
+            Op.ADD: add,
+            Op.SUB: sub,
+            Op.MUL: mul,
+            Op.DIV: div,
+            Op.NOT: not_handler,
+            Op.EQUAL: equal,
+            Op.NOT_EQUAL: not_equal,
+            Op.LESS: less,
+            Op.LESS_EQUAL: less_equal,
+            Op.GREATER: greater,
+            Op.GREATER_EQUAL: greater_equal,
+            Op.DEFINE_GLOBAL: define_global_handler,
+            Op.SET_GLOBAL: set_global,
+            Op.GET_GLOBAL: get_global,
+            Op.SET_LOCAL: set_local,
+            Op.GET_LOCAL: get_local,
+            Op.JUMP_IF_FALSE: jump_if_false,
+            Op.JUMP: jump,
+            Op.JUMP_IF_TRUE: jump_if_true,
+            Op.POP_JUMP_IF_FALSE: pop_jump_if_false,
+            Op.POP_JUMP_IF_TRUE: pop_jump_if_true,
+            Op.JUMP_IF_FALSE_OR_POP: jump_if_false_or_pop,
+            Op.JUMP_IF_TRUE_OR_POP: jump_if_true_or_pop,
+            Op.ADD_LOCAL_CONST: add_local_const,
+            Op.INC_LOCAL: inc_local,
+            Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE: less_local_local_jump_if_false,
+            Op.LESS_LOCAL_CONST_JUMP_IF_FALSE: less_local_const_jump_if_false,
+        }
+
+        if self.stack_trace:
+            sink = self.trace_sink
+
+            def traced(op, handler):
+                def trace(arg, i):
+                    sink(trace_line(op, stack))
+                    return handler(arg, i)
+                return trace
+
+            handlers = {op: traced(op, handler) for op, handler in handlers.items()}
+
+        try:
+            calls = [handlers[op] for op in decoded.ops]
+        except KeyError as error:
+            raise UnknownOpCode(error.args[0])
+        args = decoded.args
+
+        i = 0
+        end = len(calls)
+        try:
+            while i < end:
+                i = calls[i](args[i], i + 1)
+        except IndexError:
+            if not stack:
+                raise StackUnderflow
+            raise
+        finally:
+            self.ip = decoded.offsets[i] if i < end else len(self.code) - 1
+
+    def run_closure(self):
+        """Compiles the code into Python closures with compile_closures and runs them"""
+        stack = list()
+        blocks = self.compile_closures(stack)
+        i = 0 if blocks else None
+        try:
+            while i is not None:
+                i = blocks[i]()
+        except IndexError:
+            if not stack:
+                raise StackUnderflow
+            raise
+        self.ip = len(self.code) - 1
+
+    def compile_closures(self, stack) -> list:
+        """Turns the code into one closure per basic block, working on stack
+
+        Every instruction becomes a closure with its operands bound, and a
+        block runs the closures of its straight-line instructions and returns
+        the index of the block to run next, or None at the end of the code.
+        Nothing is decoded or dispatched on an op while the blocks run.
+        """
+        decoded = predecode(self.code, self.constants) if self.decoded is None else self.decoded
+        globals = self.globals
+        global_name = self.global_name
+        define_global = self.define_global
+        output = self.print
+        push = stack.append
+        pop = stack.pop
+
+        def binary(function):
+            def step():
+                b = pop()
+                stack[-1] = function(stack[-1], b)
+            return step
+
+        def comparison(function):
+            def step():
+                b = pop()
+                stack[-1] = TRUE if function(stack[-1], b) else FALSE
+            return step
+
+        def instruction(op, arg):
+            """The closure for a non-jumping instruction"""
+            match op:
+                case Op.CONSTANT | Op.TRUE | Op.FALSE:
+                    value = {Op.TRUE: TRUE, Op.FALSE: FALSE}.get(op, arg)
+                    return lambda: push(value)
+                case Op.POP:
+                    return pop
+                case Op.PRINT:
+                    return lambda: output(pop())
+                case Op.ADD:
+                    return binary(operator.add)
+                case Op.SUB:
+                    return binary(operator.sub)
+                case Op.MUL:
+                    return binary(operator.mul)
+                case Op.DIV:
+                    return binary(operator.truediv)
+                case Op.NOT:
+                    def step():
+                        stack[-1] = FALSE if stack[-1] else TRUE
+                    return step
+                case Op.EQUAL:
+                    return comparison(operator.eq)
+                case Op.NOT_EQUAL:
+                    return comparison(operator.ne)
+                case Op.LESS:
+                    return comparison(operator.lt)
+                case Op.LESS_EQUAL:
+                    return comparison(operator.le)
+                case Op.GREATER:
+                    return comparison(operator.gt)
+                case Op.GREATER_EQUAL:
+                    return comparison(operator.ge)
+                case Op.DEFINE_GLOBAL:
+                    return lambda: define_global(arg, stack[-1])
+                case Op.SET_GLOBAL:
+                    def step():
+                        if arg >= len(globals) or globals[arg] is UNDEFINED:
+                            raise NameError(global_name(arg))
+                        globals[arg] = stack[-1]
+                    return step
+                case Op.GET_GLOBAL:
+                    def step():
+                        value = globals[arg] if arg < len(globals) else UNDEFINED
+                        if value is UNDEFINED:
+                            raise NameError(global_name(arg))
+                        push(value)
+                    return step
+                case Op.SET_LOCAL:
+                    def step():
+                        if arg < len(stack):
+                            stack[arg] = stack[-1]
+                        else:
+                            # x := y := 1 declares y in the slot of the value and x in the one above it
+                            push(stack[-1])
+                    return step
+                case Op.GET_LOCAL:
+                    return lambda: push(stack[arg])
+                case Op.ADD_LOCAL_CONST:
+                    slot, value = arg
+                    return lambda: push(stack[slot] + value)
+                case Op.INC_LOCAL:
+                    def step():
+                        stack[arg] = stack[arg] + ONE
+                    return step
+                case _:
+                    def step():
+                        raise UnknownOpCode(op)
+                    return step
+
+        def terminator(op, arg, fall):
+            """The closure that ends a block: a jump, or falling through to block fall"""
+            match op:
+                case Op.JUMP:
+                    return lambda: arg
+                case Op.JUMP_IF_FALSE:
+                    return lambda: fall if stack[-1] else arg
+                case Op.JUMP_IF_TRUE:
+                    return lambda: arg if stack[-1] else fall
+                case Op.POP_JUMP_IF_FALSE:
+                    return lambda: fall if pop() else arg
+                case Op.POP_JUMP_IF_TRUE:
+                    return lambda: arg if pop() else fall
+                case Op.JUMP_IF_FALSE_OR_POP:
+                    def step():
+                        if stack[-1]:
+                            pop()
+                            return fall
+                        return arg
+                    return step
+                case Op.JUMP_IF_TRUE_OR_POP:
+                    def step():
+                        if stack[-1]:
+                            return arg
+                        pop()
+                        return fall
+                    return step
+                case Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE:
+                    a, b, target = arg
+                    return lambda: fall if stack[a] < stack[b] else target
+                case Op.LESS_LOCAL_CONST_JUMP_IF_FALSE:
+                    a, value, target = arg
+                    return lambda: fall if stack[a] < value else target
+                case _:
+                    return lambda: fall
+
+        def traced(op, step):
+            sink = self.trace_sink
+
+            def trace():
+                sink(trace_line(op, stack))
+                return step()
+            return trace
+
+        def block(steps, end, offsets, end_offset):
+            """Runs steps, which start at offsets, and end, which starts at end_offset;
+            if one raises, it leaves ip at the offset of its instruction like run_decoded"""
+            located = tuple(zip(offsets, steps))
+
+            def run():
+                try:
+                    for offset, step in located:
+                        step()
+                    offset = end_offset
+                    return end()
+                except BaseException:
+                    self.ip = offset
+                    raise
+            return run
+
+        ops = [GENERIC_OPS.get(op, op) for op in decoded.ops]
+        args = decoded.args
+        count = len(ops)
+        leaders = {0}
+        for i, op in enumerate(ops):
+            if op in JUMP_OPS:
+                leaders.add(i + 1)
+                leaders.add(args[i] if op not in COMPARE_JUMPS else args[i][2])
+        starts = sorted(leader for leader in leaders if leader < count)
+        # Blocks are numbered by position, so jump targets become block numbers
+        number = {start: n for n, start in enumerate(starts)}
+        number[count] = None
+
+        blocks = list()
+        for n, start in enumerate(starts):
+            stop = starts[n + 1] if n + 1 < len(starts) else count
+            last = ops[stop - 1]
+            straight = stop - 1 if last in JUMP_OPS else stop
+            steps = [instruction(ops[i], args[i]) for i in range(start, straight)]
+            if straight < stop:
+                arg = args[stop - 1]
+                if last in COMPARE_JUMPS:
+                    arg = (*arg[:2], number[arg[2]])
+                else:
+                    arg = number[arg]
+                end = terminator(last, arg, number[stop])
+            else:
+                end = terminator(None, None, number[stop])
+
+            if self.stack_trace:
+                steps = [traced(ops[i], step) for i, step in zip(range(start, straight), steps)]
+                if straight < stop:
+                    end = traced(last, end)
+            offsets = decoded.offsets
+            blocks.append(block(steps, end, offsets[start:straight], offsets[stop - 1]))
+        return blocks
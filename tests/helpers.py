@@ -0,0 +1,22 @@
+"""Compiling and running helpers shared by the test modules"""
+
+from scarab import Parser, Compiler, VM
+
+
+def compile_source(source, optimize=0):
+    compiler = Compiler(Parser(source), optimize=optimize)
+    compiler.compile()
+    return compiler
+
+
+def run(code, constants):
+    """What the code prints"""
+    vm = VM(code, constants, capture=True)
+    vm.run()
+    return vm.captured
+
+
+def run_source(source, optimize=0):
+    """What the source prints once compiled at optimize"""
+    compiler = compile_source(source, optimize)
+    return run(compiler.code, compiler.constants)
@@ -1,7 +1,9 @@
 import pytest
 
-from scarab import Parser
+from scarab import Parser, VM
+from scarab.bytecode import LineTable, instructions
 from scarab.compiler import Compiler, Op
+from scarab.value import Int, String
 
 
 def test_int():
@@ -55,11 +57,11 @@ def test_scope():
     compiler.compile()
     assert compiler.code == bytearray([
         Op.CONSTANT, 0,
-        Op.DEFINE_GLOBAL, 1,
+        Op.DEFINE_GLOBAL, 0,
         Op.POP,
-        Op.GET_GLOBAL, 2,
+        Op.GET_GLOBAL, 0,
         Op.SET_LOCAL, 0,
-        Op.CONSTANT, 3,
+        Op.CONSTANT, 1,
         Op.SET_LOCAL, 1,
         Op.GET_LOCAL, 0,
         Op.GET_LOCAL, 1,
@@ -68,6 +70,7 @@ def test_scope():
         Op.POP,
         Op.POP,
     ])
+    assert compiler.global_slots == {"a": 0}
 
 
 @pytest.mark.parametrize("test_input", [
@@ -79,3 +82,170 @@ def test_scope():
 def test_compiles(test_input):
     compiler = Compiler(Parser(test_input))
     compiler.compile()
+
+
+def test_constants_are_shared():
+    compiler = Compiler(Parser('x := 1 print x + 1 print "x" + "x"'))
+    compiler.compile()
+    assert compiler.constants == [Int(1), String("x")]
+    assert compiler.global_slots == {"x": 0}
+
+
+def test_wide_constants():
+    compiler = Compiler(Parser(" ".join(f"print {i}" for i in range(300))))
+    compiler.compile()
+    assert len(compiler.constants) == 300
+    assert compiler.code[-4:] == bytearray([Op.CONSTANT_LONG, 299 >> 8, 299 & 0xff, Op.PRINT])
+
+
+def test_while_pops_condition_in_branch():
+    compiler = Compiler(Parser("while a print a"))
+    compiler.compile()
+    assert compiler.code == bytearray([
+        Op.GET_GLOBAL, 0,
+        Op.POP_JUMP_IF_FALSE, 0, 6,
+        Op.GET_GLOBAL, 0,
+        Op.PRINT,
+        Op.LOOP, 0, 11,
+    ])
+
+
+# Branches and loops followed by expression statements whose value is discarded
+BRANCH_LAYOUT_PROGRAMS = [
+    "x := 0 if x print 1 else do 4 print 5 end",
+    "x := 1 if x print 1 else print 2 3 print 4",
+    "x := 0 if x print 1 0 x print 2",
+    "x := 0 if x < 1 do 1 print 2 end else do 3 print 4 end 5 print 6",
+    "x := 1 while x < 3 do x = x + 1 end 0 print 2",
+    "x := 1 while x < 3 do 7 x = x + 1 end x print x",
+    "a := 0 i := 0 while i < 3 do i = i + 1 end 0 if a < 5 print 1 else print 2",
+    "do i := 0 while i < 3 do i = i + 1 i end i 0 print i end",
+]
+
+
+@pytest.mark.parametrize("optimize", [1, 2, 3])
+@pytest.mark.parametrize("source", BRANCH_LAYOUT_PROGRAMS)
+def test_branch_layout_same_output(source, optimize):
+    outputs = list()
+    for level in (0, optimize):
+        compiler = Compiler(Parser(source), optimize=level)
+        compiler.compile()
+        vm = VM(compiler.code, compiler.constants, capture=True)
+        vm.run()
+        outputs.append(vm.captured)
+    assert outputs[1] == outputs[0]
+    assert outputs[0]
+
+
+def test_and_or_keep_deciding_operand():
+    compiler = Compiler(Parser("print a and b or c"))
+    compiler.compile()
+    assert compiler.code == bytearray([
+        Op.GET_GLOBAL, 0,
+        Op.JUMP_IF_FALSE_OR_POP, 0, 2,
+        Op.GET_GLOBAL, 1,
+        Op.JUMP_IF_TRUE_OR_POP, 0, 2,
+        Op.GET_GLOBAL, 2,
+        Op.PRINT,
+    ])
+
+
+def test_superinstructions():
+    compiler = Compiler(Parser("do i := 0 n := 9 while i < n do i = i + 1 print i + 2 end end"), optimize=3)
+    compiler.compile()
+    assert compiler.code == bytearray([
+        Op.CONSTANT, 0,
+        Op.SET_LOCAL, 0,
+        Op.CONSTANT, 1,
+        Op.SET_LOCAL, 1,
+        Op.LESS_LOCAL_LOCAL_JUMP_IF_FALSE, 0, 1, 0, 9,
+        Op.INC_LOCAL, 0,
+        Op.ADD_LOCAL_CONST, 0, 3,
+        Op.PRINT,
+        Op.LOOP, 0, 14,
+        Op.POP,
+        Op.POP,
+    ])
+
+
+def test_shadowed_locals():
+    compiler = Compiler(Parser("do a := 1 do a := 2 a end a end"))
+    compiler.compile()
+    assert compiler.code == bytearray([
+        Op.CONSTANT, 0,
+        Op.SET_LOCAL, 0,
+        Op.CONSTANT, 1,
+        Op.SET_LOCAL, 1,
+        Op.GET_LOCAL, 1,
+        Op.POP,
+        Op.POP,
+        Op.GET_LOCAL, 0,
+        Op.POP,
+        Op.POP,
+    ])
+    assert compiler.slots == {}
+
+
+def test_wide_locals():
+    names = [f"v{i}" for i in range(300)]
+    source = "do " + " ".join(f"{name} := 0" for name in names) + f" {names[-1]} = {names[0]} end"
+    compiler = Compiler(Parser(source))
+    compiler.compile()
+    assert compiler.code[-306:-300] == bytearray([
+        Op.GET_LOCAL, 0,
+        Op.SET_LOCAL_LONG, 0x01, 0x2b,
+        Op.POP,
+    ])
+
+
+@pytest.mark.parametrize("test_input, expected", [
+    ("", 0),
+    ("print 1 + 2 * 3", 3),
+    ("print a and b or c", 1),
+    ("do x := y := 2 print x + y end", 4),
+    ("i := 0 while i < 3 do do a := 1 print a + i * 2 end i = i + 1 end", 4),
+])
+def test_max_stack(test_input, expected):
+    compiler = Compiler(Parser(test_input))
+    compiler.compile()
+    assert compiler.max_stack == expected
+
+
+LINES_SOURCE = '''do
+  i := 0
+  while i < 3 do
+    i = i + 1
+  end
+  if 1 < 0
+    print 5
+  else
+    print 6
+  print i
+end
+'''
+
+
+def test_line_table_round_trip():
+    runs = [(0, 1), (5, 3), (300, 2), (70000, 900)]
+    table = LineTable.from_runs(runs)
+    assert list(table.runs()) == runs
+    assert len(table.data) == 12
+    assert table.line_at(4) == 1
+    assert table.line_at(299) == 3
+    assert table.line_at(10 ** 6) == 900
+    assert LineTable().line_at(0) is None
+
+
+@pytest.mark.parametrize("optimize", [0, 1, 2, 3])
+def test_line_table(optimize):
+    compiler = Compiler(Parser(LINES_SOURCE), optimize=optimize)
+    compiler.compile()
+    table = compiler.line_table
+    lines = {Op(op).name: table.line_at(offset) for offset, op in instructions(compiler.code)}
+    # The jump back belongs to the while, the POP of i to the end of the block
+    assert lines["LOOP"] == 3
+    assert lines["POP"] == 11
+    assert [line for offset, line in table.runs()][:3] == [2, 3, 4]
+    # Folding drops the then branch, and with it line 7
+    assert (7 in {line for _, line in table.runs()}) == (optimize == 0)
+    assert all(offset < len(compiler.code) for offset, _ in table.runs())
@@ -0,0 +1,109 @@
+import pytest
+
+from scarab import Int, String, Bool
+from scarab.compiler import Op
+
+from .helpers import compile_source, run_source
+
+
+@pytest.mark.parametrize("source", [
+    "print 1 + 2 * 3",
+    "print (1 + 2) * 3 - 4",
+    'print "a" + "b" + "c"',
+    "print 7 == 7",
+    "print 7 != 7",
+    'print "a" == 1',
+    "print 1 < 2",
+    "print 2 <= 1",
+    '"b" > "a"',
+    "print not 0",
+    "print not not 5",
+    'print not ""',
+    "print 6 / 3",
+    "print 0 and 1",
+    "print 2 and 3",
+    "print 0 or 3",
+    '"x" or 3',
+    "x := 4 print x * 1 print x + 0 print 0 + x print 1 * x",
+    "x := 4 y := 2 print (x - y) * 1 print 1 * (x * y) print (x / y) + 0 print (x - y) - 0",
+    'x := "s" print x + ""',
+    "if 1 print 1 else print 2",
+    "if 0 print 1 else print 2",
+    "if 1 < 0 print 1",
+    "x := 0 while 0 do x = x + 1 end print x",
+    "x := 0 while x < 3 do x = x + 1 end print x",
+    "do a := 1 if 0 do b := 2 end print a end",
+])
+def test_same_output(source):
+    assert run_source(source, optimize=1) == run_source(source, optimize=0)
+
+
+@pytest.mark.parametrize("source,error", [
+    ('print 1 + "a"', TypeError),
+    ('print "a" - "b"', TypeError),
+    ("print 1 < \"a\"", TypeError),
+    ("print 1 / 0", ZeroDivisionError),
+    ('x := "s" print x * 1', TypeError),
+    ('x := "s" print x + 0', TypeError),
+    ('x := "s" print 1 * x', TypeError),
+    ('x := "s" y := "t" print (x + y) * 1', TypeError),
+])
+def test_same_errors(source, error):
+    with pytest.raises(error):
+        run_source(source, optimize=0)
+    with pytest.raises(error):
+        run_source(source, optimize=1)
+
+
+def test_fold_arithmetic():
+    compiler = compile_source("print 1 + 2 * 3", optimize=1)
+    assert compiler.code == bytearray([Op.CONSTANT, compiler.constants.index(Int(7)), Op.PRINT])
+
+
+def test_fold_string():
+    compiler = compile_source('print "a" + "b"', optimize=1)
+    assert compiler.code == bytearray([Op.CONSTANT, compiler.constants.index(String("ab")), Op.PRINT])
+
+
+@pytest.mark.parametrize("source,op", [
+    ("print 1 < 2", Op.TRUE),
+    ("print not 1", Op.FALSE),
+    ('print "a" == "a"', Op.TRUE),
+])
+def test_fold_to_bool(source, op):
+    compiler = compile_source(source, optimize=1)
+    assert compiler.code == bytearray([op, Op.PRINT])
+    assert run_source(source, optimize=1) == [Bool(op == Op.TRUE)]
+
+
+@pytest.mark.parametrize("source", [
+    'print 1 + "a"',
+    "print 6 / 3",
+    "print 1 / 0",
+])
+def test_no_fold(source):
+    assert compile_source(source, optimize=1).code == compile_source(source, optimize=0).code
+
+
+def test_identity():
+    compiler = compile_source("print (x - y) * 1", optimize=1)
+    assert compiler.code == bytearray([Op.GET_GLOBAL, 0, Op.GET_GLOBAL, 1, Op.SUB, Op.PRINT])
+
+
+def test_identity_needs_int():
+    compiler = compile_source("print x * 1", optimize=1)
+    assert compiler.code[-2:] == bytearray([Op.MUL, Op.PRINT])
+
+
+def test_prune_if():
+    compiler = compile_source('if 0 print "yes" else print "no"', optimize=1)
+    assert compiler.code == bytearray([Op.CONSTANT, compiler.constants.index(String("no")), Op.PRINT])
+
+
+def test_prune_while():
+    assert compile_source("while 0 do print 1 end", optimize=1).code == bytearray()
+
+
+def test_infinite_while():
+    compiler = compile_source("while 1 print 2", optimize=1)
+    assert compiler.code == bytearray([Op.CONSTANT, 1, Op.PRINT, Op.LOOP, 0, 6])
@@ -0,0 +1,103 @@
+import pytest
+
+from scarab import TokenBuffer, Int
+from scarab.incremental import IncrementalCompiler
+
+from .helpers import compile_source, run
+
+SOURCE = '''x := 1
+print x
+do
+  y := x + 2
+  print y
+end
+s := "two
+lines"
+while x < 3 do x = x + 1 end
+print s + "!"
+'''
+
+
+def assert_matches_full_compile(incremental):
+    compiler = compile_source(incremental.source)
+    assert run(incremental.code, incremental.constants) == run(compiler.code, compiler.constants)
+    assert incremental.tokens.columns == TokenBuffer(incremental.source).columns
+
+
+def test_initial_compile():
+    incremental = IncrementalCompiler(SOURCE)
+    compiler = compile_source(SOURCE)
+    assert incremental.code == compiler.code
+    assert incremental.constants == compiler.constants
+
+
+@pytest.mark.parametrize("old,new", [
+    ("x + 2", "x + 40"),
+    ("print x", "print x * 10"),
+    ("print x", "print x\nprint 5"),
+    ("print x\n", ""),
+    ("two\nlines", "one line"),
+    ('print s + "!"', 'print s + "!"\nprint x'),
+    ("end\n", "end\nz := 4 print z\n"),
+    ("\nend", "\nprint 7\nend"),
+    ("x := 1", "x := 12"),
+    ("x := 1", "xy := 1 x := 2"),
+    ("do", "* 10\ndo"),
+])
+def test_edit(old, new):
+    incremental = IncrementalCompiler(SOURCE)
+    incremental.edit(SOURCE.index(old), len(old), new)
+    assert incremental.source == SOURCE.replace(old, new, 1)
+    assert_matches_full_compile(incremental)
+
+
+def test_edit_reuses_untouched_statements():
+    incremental = IncrementalCompiler(SOURCE)
+    before = list(incremental.statements)
+    incremental.edit(SOURCE.index("x + 2") + 4, 1, "40")
+    after = incremental.statements
+    assert len(after) == len(before)
+    assert [a is b for a, b in zip(before, after)] == [True, False, False, True, True, True]
+
+
+def test_edit_merges_statements():
+    incremental = IncrementalCompiler(SOURCE)
+    # Removing "end" pulls every later statement into the block
+    incremental.edit(SOURCE.index("end"), 3, "")
+    incremental.edit(len(incremental.source), 0, "end\n")
+    assert_matches_full_compile(incremental)
+
+
+def test_syntax_error_recovers():
+    incremental = IncrementalCompiler(SOURCE)
+    with pytest.raises(SyntaxError):
+        incremental.edit(SOURCE.index("x + 2"), 5, "x + +")
+    incremental.edit(SOURCE.index("x + 2"), 5, "x + 3")
+    assert_matches_full_compile(incremental)
+
+
+def test_failed_edit_keeps_last_compile():
+    incremental = IncrementalCompiler("x := 1\nprint x\n")
+    code = incremental.code
+    with pytest.raises(SyntaxError):
+        incremental.edit(0, 0, "((")
+    assert incremental.stale
+    assert incremental.code == code
+    assert run(incremental.code, incremental.constants) == [Int(1)]
+    assert incremental.tokens.columns == TokenBuffer("x := 1\nprint x\n").columns
+
+    incremental.edit(0, 2, "")
+    assert not incremental.stale
+    assert_matches_full_compile(incremental)
+
+
+def test_sequence_of_keystrokes():
+    incremental = IncrementalCompiler(SOURCE)
+    offset = len(SOURCE)
+    for char in 'print x + 100\n':
+        try:
+            incremental.edit(offset, 0, char)
+        except SyntaxError:
+            pass
+        offset += 1
+    assert_matches_full_compile(incremental)
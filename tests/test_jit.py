@@ -0,0 +1,89 @@
+import pytest
+
+from scarab import VM, Int, String
+from scarab.jit import TraceAborted, translate
+
+from .helpers import compile_source
+
+PROGRAMS = [
+    "i := 0 while i < 20 do i = i + 1 end print i",
+    "i := 0 t := 0 while i < 20 do if i == 7 print t t = t + i * 2 i = i + 1 end print t",
+    'i := 0 s := "" while i < 20 do if i < 3 s = s + "a" i = i + 1 end print s',
+    "i := 0 while i < 20 do i = i + 1 if i and i > 15 or i == 3 print i end",
+    "do i := 0 t := 1 while i < 20 do i = i + 1 t = t * 2 end print t end",
+    "do i := 0 while not (i >= 20) do do j := i + 1 i = j end end print i end",
+    "i := 0 while i < 20 do i = i + 1 print i / 4 end",
+]
+
+
+@pytest.mark.parametrize("optimize", [0, 2, 3])
+@pytest.mark.parametrize("source", PROGRAMS)
+def test_same_output(source, optimize):
+    compiler = compile_source(source, optimize)
+    interpreted = VM(compiler.code, compiler.constants, capture=True)
+    interpreted.run()
+    vm = VM(compiler.code, compiler.constants, capture=True, engine="tracing", jit_threshold=2)
+    vm.run()
+    assert vm.captured == interpreted.captured
+    assert vm.globals == interpreted.globals
+    assert vm.jit_stats["compiled"] == 1
+    assert vm.jit_stats["entered"] >= 1
+
+
+def test_guard_fails_on_other_classes():
+    compiler = compile_source('''
+    x := 1
+    r := 0
+    while r < 2 do
+      i := 0
+      while i < 5 do x = x + x i = i + 1 end
+      print x
+      x = "a"
+      r = r + 1
+    end
+    ''')
+    vm = VM(compiler.code, compiler.constants, capture=True, engine="tracing", jit_threshold=2)
+    vm.run()
+    assert vm.captured == [Int(32), String("a" * 32)]
+    assert vm.jit_stats["guard_failures"] > 0
+    # The outer loop runs another loop, which a trace cannot
+    assert vm.jit_stats["aborted"] == 1
+    assert list(vm.traces.values()).count(None) == 1
+
+
+def test_disabled():
+    compiler = compile_source(PROGRAMS[0])
+    vm = VM(compiler.code, compiler.constants, capture=True, engine="tracing", jit=False, jit_threshold=1)
+    vm.run()
+    assert vm.captured == [Int(20)]
+    assert vm.traces == {}
+    assert vm.jit_stats["compiled"] == 0
+
+
+def test_translate():
+    compiler = compile_source("do i := 0 while i < 3 i = i + 1 end")
+    code = compiler.code
+    # GET_LOCAL, CONSTANT, LESS, POP_JUMP_IF_FALSE, GET_LOCAL, CONSTANT, ADD, SET_LOCAL, POP, LOOP
+    path = [(4, 6), (6, 8), (8, 9), (9, 12), (12, 14), (14, 16), (16, 17), (17, 19), (19, 20), (20, 4)]
+    source = translate(code, compiler.constants, path, [Int], [])
+    assert "    if len(stack) != 1 or stack[0].__class__ is not Int:" in source
+    assert "            return 23" in source
+
+    with pytest.raises(TraceAborted):
+        translate(code, compiler.constants, path, [String], [])
+
+
+@pytest.mark.parametrize("optimize", [0, 2, 3])
+def test_raise_in_trace_leaves_interpreter_state(optimize):
+    compiler = compile_source("x := 0 i := 10 while 1 < 2 do x = x + 1 i = i - 1 print 10 / i end", optimize)
+    interpreted = VM(compiler.code, compiler.constants, capture=True, engine="table")
+    with pytest.raises(ZeroDivisionError):
+        interpreted.run()
+    vm = VM(compiler.code, compiler.constants, capture=True, engine="tracing", jit_threshold=2)
+    with pytest.raises(ZeroDivisionError):
+        vm.run()
+    assert vm.jit_stats["compiled"] == 1
+    assert vm.globals == interpreted.globals == [Int(10), Int(0)]
+    assert vm.captured == interpreted.captured
+    assert vm.ip == interpreted.ip
+    assert vm.jit_stats["seconds"] > 0
@@ -0,0 +1,156 @@
+import pytest
+
+from scarab import Parser, Compiler, VM, Int
+from scarab import lexer as lexer_module
+from scarab.lexer import Lexer, Kind, TokenBuffer, scan, make_token, split_points, lex_parallel
+from scarab.parser import TError, TStr, TIdent, Keyword
+
+
+@pytest.mark.parametrize("source", [
+    "543",
+    '"Hello, World"',
+    "1 + 2 * 3",
+    "'",
+    "`",
+    '   x = 5     \n  \n   y=\n6 \n ',
+    'x := "multi\nline" y := 2\nprint y',
+    "do a := b := 1 while a <= 10 do a = a + 1 end end",
+    "if 0 or 1 print \"True\" else print \"False\"",
+    "Print PRINT print_ x1 12ab ½",
+    "",
+    "   \n\n ",
+])
+def test_same_tokens_as_parser(source):
+    expected = list(Parser(source))
+    assert list(Lexer(source)) == expected
+    assert [make_token(source, *span) for span in scan(source)] == expected
+    assert list(TokenBuffer(source)) == expected
+
+
+SOURCE = '''
+total := 0
+name := "a string that is long enough to cross a chunk boundary
+and a line too"
+while total < 10 do total = total + 1 end
+print name + "é" print total>=10
+'''
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 20])
+def test_from_chunks(chunk_size):
+    chunks = [SOURCE[i:i + chunk_size] for i in range(0, len(SOURCE), chunk_size)]
+    assert list(Lexer.from_chunks(chunks)) == list(Parser(SOURCE))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 20])
+def test_from_file(tmp_path, chunk_size):
+    path = tmp_path / "script.scarab"
+    path.write_text(SOURCE, encoding="utf-8")
+    assert list(Lexer.from_file(path, chunk_size=chunk_size)) == list(Parser(SOURCE))
+
+
+def test_from_empty_file(tmp_path):
+    path = tmp_path / "empty.scarab"
+    path.write_text("")
+    assert list(Lexer.from_file(path)) == []
+
+
+def test_unclosed_string_in_chunks():
+    with pytest.raises(SyntaxError):
+        list(Lexer.from_chunks(["x ", '"ab', "c\nd"]))
+
+
+def test_unclosed_string():
+    lexer = Lexer('x "abc')
+    assert isinstance(next(lexer), TIdent)
+    with pytest.raises(SyntaxError):
+        next(lexer)
+
+
+def test_unknown_symbol():
+    assert isinstance(next(Lexer("'")), TError)
+
+
+def test_string_spans_quotes():
+    assert list(scan('a "b\nc" d')) == [
+        (Kind.IDENT, 0, 1, 1),
+        (Kind.STR, 2, 7, 1),
+        (Kind.IDENT, 8, 9, 2),
+    ]
+    assert next(Lexer('"b\nc"')) == TStr("b\nc", 1, "b\nc")
+
+
+def test_keywords():
+    kinds = [kind for kind, *_ in scan("while whiles do")]
+    assert kinds == [Kind.KEYWORD, Kind.IDENT, Kind.KEYWORD]
+
+
+def test_compiles():
+    compiler = Compiler(Lexer("x := 2 print x * 21"))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    vm.run()
+    assert vm.captured[0] == Int(42)
+
+
+def test_token_buffer_columns():
+    buffer = TokenBuffer('x := "a\nb"\nwhile 12')
+    assert len(buffer) == 5
+    assert list(buffer.kinds) == [Kind.IDENT, Kind.OP, Kind.STR, Kind.KEYWORD, Kind.INT]
+    assert list(buffer.starts) == [0, 2, 5, 11, 17]
+    assert list(buffer.lengths) == [1, 2, 5, 5, 2]
+    assert list(buffer.lines) == [1, 1, 1, 3, 3]
+    assert buffer.text(2) == '"a\nb"'
+    assert buffer.value(2) == "a\nb"
+    assert buffer.value(3) is Keyword.WHILE
+    assert buffer.value(4) == 12
+    assert buffer[-1] == next(Lexer("\n\n12"))
+    assert buffer.nbytes == 5 * (1 + 3 * buffer.starts.itemsize)
+
+
+def test_token_buffer_compiles():
+    compiler = Compiler(TokenBuffer("x := 2 print x * 21"))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    vm.run()
+    assert vm.captured[0] == Int(42)
+
+
+def test_token_buffer_compiles_without_tokens(monkeypatch):
+    source = 'x := 1\ndo y := "a" while x < 3 x = x + 1 print y end\nif not (x == 3 or x) and 1 print x - 2 else print x\n'
+    expected = Compiler(Parser(source), optimize=2)
+    expected.compile()
+    buffer = TokenBuffer(source)
+
+    def make_token(*args):
+        raise AssertionError("Compiler built a Token")
+
+    monkeypatch.setattr(lexer_module, "make_token", make_token)
+    compiler = Compiler(buffer, optimize=2)
+    compiler.compile()
+    assert compiler.code == expected.code
+    assert compiler.constants == expected.constants
+    assert compiler.line_table == expected.line_table
+
+    with pytest.raises(SyntaxError, match="`"):
+        Compiler(TokenBuffer("print 1 `")).compile()
+
+
+def test_chunks_without_newlines():
+    source = 'x:=1 y := 22 zz "a b" q'
+    chunks = [source[i:i + 4] for i in range(0, len(source), 4)]
+    assert list(Lexer.from_chunks(chunks)) == list(Parser(source))
+
+
+def test_split_points_skip_strings():
+    source = 'a\n"b\nc\nd"\ne\nf\n'
+    assert split_points(source, 1) == [0, 2, 10, 12, 14]
+    assert split_points(source, 100) == [0, len(source)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 16, 1 << 20])
+def test_lex_parallel(chunk_size):
+    source = SOURCE * 20
+    buffer = lex_parallel(source, processes=2, chunk_size=chunk_size)
+    assert buffer.columns == TokenBuffer(source).columns
+    assert list(buffer) == list(Parser(source))
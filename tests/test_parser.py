@@ -41,3 +41,20 @@ def test_whitespace():
     parser = Parser('   x = 5     \n  \n   y=\n6 \n ')
     assert list(iter(parser)) == [TIdent("x", 1, "x"), TOp("=", 1, "="), TInt("5", 1, 5),
                                   TIdent("y", 3, "y"), TOp("=", 3, "="), TInt("6", 4, 6)]
+
+
+def test_multiline_string():
+    parser = Parser('"a\nb" c')
+    assert list(iter(parser)) == [TStr("a\nb", 1, "a\nb"), TIdent("c", 2, "c")]
+
+
+def test_keyword_case():
+    parser = Parser("Print")
+    assert next(parser) == TIdent("Print", 1, "Print")
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / "script.scarab"
+    path.write_bytes('x := "é\r\nb"\r\nprint x\n'.encode())
+    tokens = list(Parser.from_file(path, chunk_size=3))
+    assert tokens == list(Parser('x := "é\nb"\nprint x\n'))
@@ -0,0 +1,149 @@
+import pytest
+
+from scarab import VM
+from scarab.compiler import Op, instructions
+from scarab.peephole import optimize, decode, encode
+from scarab.verifier import verify
+
+from .helpers import compile_source, run
+
+PROGRAMS = [
+    "print 0 or 2",
+    "x := 0 print x or 3 print 4 or x",
+    "x := 1 y := 0 print x and y or 5",
+    "x := 0 while x < 5 do if x == 2 print x x = x + 1 end",
+    "x := 0 while x < 5 do if x == 2 print x else print 0 - x x = x + 1 end",
+    "x := 0 while x < 5 do x = x + 1 if x print x end",
+    "do a := 1 b := 2 a b print a + b end",
+    "x := 3 while x do x = x - 1 end print x",
+    'if "" print 1 else if 0 print 2 else print 3',
+]
+
+
+# A jump target removed with the instruction after it must not make the code after the pair look dead
+DEAD_CODE_PROGRAMS = [
+    "x := 0 if x print 1 else do 4 print 5 end",
+    "x := 1 while x < 3 do x = x + 1 end 0 print 2",
+    "a := 0 i := 0 while i < 3 do i = i + 1 end 0 if a < 5 print 1 else print 2",
+    "x := 0 if x do 1 end else do 4 b or 2 end",
+]
+
+
+def outcome(compiler):
+    """What running the code prints, or the class of the exception it raises"""
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    try:
+        vm.run()
+    except Exception as e:
+        return e.__class__
+    return vm.captured
+
+
+@pytest.mark.parametrize("optimize", [2, 3])
+@pytest.mark.parametrize("source", DEAD_CODE_PROGRAMS)
+def test_removed_target_keeps_code_live(source, optimize):
+    after = compile_source(source, optimize)
+    verify(after.code, after.constants)
+    assert outcome(after) == outcome(compile_source(source, optimize=0))
+
+
+@pytest.mark.parametrize("source", PROGRAMS)
+def test_same_output(source):
+    before = compile_source(source, optimize=0)
+    after = compile_source(source, optimize=2)
+    assert run(after.code, after.constants) == run(before.code, before.constants)
+    assert len(decode(after.code)) <= len(decode(before.code))
+
+
+@pytest.mark.parametrize("source", PROGRAMS)
+def test_round_trip(source):
+    code = compile_source(source, optimize=0).code
+    assert encode(decode(code)) == code
+
+
+def test_negate_jump_over_jump():
+    code = bytearray([
+        Op.GET_GLOBAL, 0,
+        Op.POP_JUMP_IF_FALSE, 0, 3,
+        Op.JUMP, 0, 2,
+        Op.TRUE,
+        Op.PRINT,
+        Op.FALSE,
+        Op.PRINT,
+    ])
+    assert optimize(code) == bytearray([
+        Op.GET_GLOBAL, 0,
+        Op.POP_JUMP_IF_TRUE, 0, 2,
+        Op.TRUE,
+        Op.PRINT,
+        Op.FALSE,
+        Op.PRINT,
+    ])
+
+
+def test_merge_short_circuit_into_branch():
+    code = compile_source("if a and b print 1 else print 2", optimize=2).code
+    assert code == bytearray([
+        Op.GET_GLOBAL, 0,
+        Op.POP_JUMP_IF_FALSE, 0, 11,
+        Op.GET_GLOBAL, 1,
+        Op.POP_JUMP_IF_FALSE, 0, 6,
+        Op.CONSTANT, 0,
+        Op.PRINT,
+        Op.JUMP, 0, 3,
+        Op.CONSTANT, 1,
+        Op.PRINT,
+    ])
+
+
+def test_jump_to_next_pops():
+    code = bytearray([Op.GET_GLOBAL, 0, Op.POP_JUMP_IF_FALSE, 0, 0, Op.FALSE, Op.PRINT])
+    assert optimize(code) == bytearray([Op.GET_GLOBAL, 0, Op.POP, Op.FALSE, Op.PRINT])
+
+
+def test_thread_jump_to_loop():
+    code = compile_source("while a do if b print 1 else print 2 end", optimize=2).code
+    ops = [Op(code[offset]) for offset, op in instructions(code)]
+    # The if's jump past its else lands on the loop's back edge, so it
+    # becomes a back edge itself
+    assert ops.count(Op.LOOP) == 2
+
+
+def test_thread_chained_conditionals():
+    code = bytearray([
+        Op.GET_GLOBAL, 0,
+        Op.JUMP_IF_FALSE, 0, 1,
+        Op.POP,
+        Op.JUMP_IF_FALSE, 0, 1,
+        Op.POP,
+        Op.PRINT,
+    ])
+    assert optimize(code) == bytearray([
+        Op.GET_GLOBAL, 0,
+        Op.JUMP_IF_FALSE, 0, 5,
+        Op.POP,
+        Op.JUMP_IF_FALSE, 0, 1,
+        Op.POP,
+        Op.PRINT,
+    ])
+
+
+def test_remove_dead_code():
+    code = bytearray([
+        Op.JUMP, 0, 3,
+        Op.CONSTANT, 0,
+        Op.PRINT,
+        Op.TRUE,
+        Op.PRINT,
+    ])
+    assert optimize(code) == bytearray([Op.TRUE, Op.PRINT])
+
+
+def test_remove_pure_expression_statement():
+    assert compile_source("do a := 1 a 2 print a end", optimize=2).code == bytearray([
+        Op.CONSTANT, 0,
+        Op.SET_LOCAL, 0,
+        Op.GET_LOCAL, 0,
+        Op.PRINT,
+        Op.POP,
+    ])
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from scarab import Parser, Compiler, VM, Int, String
+from scarab.profiler import Profiler
+
+SOURCE = 'i := 0 s := "" while i < 10 do i = i + 1 if i < 3 s = s + "a" end print i print s'
+
+
+def profile(sample=None):
+    compiler = Compiler(Parser(SOURCE))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    profiler = Profiler(sample)
+    profiler.run(vm)
+    return vm, profiler
+
+
+@pytest.mark.parametrize("sample", [None, 3])
+def test_counts(sample):
+    vm, profiler = profile(sample)
+    assert vm.captured == [Int(10), String("aa")]
+    ops = profiler.by_op()
+    assert ops["LOOP"]["count"] == 10
+    assert ops["PRINT"]["count"] == 2
+    assert ops["LESS"]["count"] == 21
+    # Ten i + 1, two s + "a"; comparisons leave TRUE or FALSE
+    assert profiler.allocations == {"Int": 10, "String": 2}
+    assert sum(entry["count"] for entry in profiler.by_offset()) == sum(profiler.counts.values())
+
+
+def test_exact_times_every_instruction():
+    _, profiler = profile()
+    assert all(profiler.times[key] > 0 for key in profiler.counts)
+
+
+def test_export():
+    _, profiler = profile(sample=2)
+    exported = json.loads(profiler.to_json())
+    assert exported["sample"] == 2
+    assert exported["allocations"] == {"Int": 10, "String": 2}
+    assert exported["ops"]["LOOP"]["count"] == 10
+
+    lines = profiler.collapsed(weight="count").splitlines()
+    assert len(lines) == len(profiler.counts)
+    assert [line.split(" ")[1] for line in lines if line.startswith("LOOP;")] == ["10"]
+
+
+def test_by_line():
+    compiler = Compiler(Parser('i := 0\nwhile i < 10 do\n  i = i + 1\nend\nprint i\n'))
+    compiler.compile()
+    profiler = Profiler()
+    profiler.run(VM(compiler.code, compiler.constants, capture=True))
+    lines = profiler.by_line(compiler.line_table)
+    assert [entry["line"] for entry in lines] == [1, 2, 3, 5]
+    # Condition and jump back run 11 and 10 times; the body's 5 instructions run 10 times
+    assert lines[2]["count"] == 50
+    assert sum(entry["count"] for entry in lines) == sum(profiler.counts.values())
+    assert json.loads(profiler.to_json(compiler.line_table))["lines"] == lines
@@ -0,0 +1,207 @@
+import hashlib
+import os
+import threading
+
+import pytest
+
+from scarab import Parser, Compiler, Int, String, Bool, Nil
+from scarab.bytecode import Op
+from scarab import program as program_module
+from scarab.program import (Program, CacheError, CompileCache, dumps, loads, cache_path, load_file,
+                            compile_cached)
+
+SOURCE = '''x := 7 / 2
+s := "café"
+do
+  i := 0
+  while i < 3 do i = i + 1 end
+  print i - 10
+end
+print x
+print s + "!"
+'''
+
+
+def run(program, **kwargs):
+    vm = program.vm(capture=True, **kwargs)
+    vm.run()
+    return vm.captured
+
+
+@pytest.mark.parametrize("optimize", [0, 1, 2, 3])
+def test_round_trip(optimize):
+    program = Program.compile(SOURCE, optimize)
+    source_hash = hashlib.sha256(SOURCE.encode()).digest()
+    loaded = loads(dumps(program, source_hash, optimize), source_hash, optimize)
+    assert loaded == program
+    assert run(loaded) == [Int(-7), Int(3.5), String("café!")]
+
+
+def test_constant_tags():
+    constants = (Int(0), Int(-5), Int(2 ** 70), Int(0.5), String(""), Bool(True), Bool(False), Nil())
+    program = Program(b"", constants)
+    assert loads(dumps(program, bytes(32))).constants == constants
+
+
+def test_float_constant():
+    # Built by hand: folding never makes an Int that holds a float
+    program = Program(bytes([Op.CONSTANT, 0, Op.CONSTANT, 1, Op.ADD, Op.PRINT]), (Int(2.5), Int(0.25)), max_stack=2)
+    loaded = loads(dumps(program, bytes(32)))
+    assert loaded == program
+    assert run(loaded) == [Int(2.75)]
+
+
+def test_compile_uses_lexer(monkeypatch):
+    expected = Compiler(Parser(SOURCE), optimize=2)
+    expected.compile()
+
+    def parse(self):
+        raise AssertionError("Parser was used")
+
+    monkeypatch.setattr(Parser, "__next__", parse)
+    program = Program.compile(SOURCE, optimize=2)
+    assert program.code == expected.code
+    assert program.constants == tuple(expected.constants)
+
+
+def test_header_checks():
+    program = Program.compile(SOURCE)
+    data = dumps(program, bytes(32), 2)
+    with pytest.raises(CacheError, match="Not a .scbc file"):
+        loads(b"XXXX" + data[4:])
+    with pytest.raises(CacheError, match="Format version"):
+        loads(data[:4] + b"\x00\x63" + data[6:])
+    with pytest.raises(CacheError, match="optimize"):
+        loads(data, optimize=0)
+    with pytest.raises(CacheError, match="other source"):
+        loads(data, b"\x01" * 32)
+    with pytest.raises(CacheError, match="Truncated"):
+        loads(data[:-3])
+    with pytest.raises(CacheError, match="after the program"):
+        loads(data + b"\x00")
+
+
+def test_shared_program():
+    program = Program.compile("i := 0 while i < 10 i = i + 1 print i", optimize=2)
+    code = program.code
+    assert run(program, engine="adaptive") == [Int(10)]
+    assert run(program, engine="adaptive") == [Int(10)]
+    assert program.code == code
+
+
+def test_load_file(tmp_path, monkeypatch):
+    path = tmp_path / "script.scarab"
+    path.write_text(SOURCE)
+    program = load_file(path, optimize=2)
+    cached = tmp_path / "__scarabcache__" / "script.v1.opt-2.scbc"
+    assert cache_path(path, 2) == str(cached)
+    assert cached.exists()
+
+    # A hit neither parses nor compiles
+    monkeypatch.setattr(program_module, "Compiler", None)
+    assert load_file(path, optimize=2) == program
+    monkeypatch.undo()
+
+    path.write_text(SOURCE.replace("7 / 2", "8 / 2"))
+    assert run(load_file(path, optimize=2))[1] == Int(4.0)
+    # Another optimize level has its own file
+    load_file(path)
+    assert (tmp_path / "__scarabcache__" / "script.v1.opt-0.scbc").exists()
+
+
+def test_load_damaged_cache(tmp_path):
+    path = tmp_path / "script.scarab"
+    path.write_text("print 1")
+    load_file(path)
+    with open(cache_path(path), "r+b") as file:
+        file.truncate(10)
+    assert run(load_file(path, write=False)) == [Int(1)]
+    assert len(open(cache_path(path), "rb").read()) == 10
+
+
+def test_load_file_threads(tmp_path):
+    path = tmp_path / "script.scarab"
+    path.write_text(SOURCE)
+    programs = list()
+    threads = [threading.Thread(target=lambda: programs.append(load_file(path))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(programs) == 8 and all(program == programs[0] for program in programs)
+    assert os.listdir(tmp_path / "__scarabcache__") == ["script.v1.opt-0.scbc"]
+    assert load_file(path, write=False) == programs[0]
+
+
+def test_load_file_removes_partial_cache(tmp_path, monkeypatch):
+    path = tmp_path / "script.scarab"
+    path.write_text("print 1")
+
+    def replace(source, destination):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(os, "replace", replace)
+    assert run(load_file(path)) == [Int(1)]
+    assert os.listdir(tmp_path / "__scarabcache__") == []
+
+
+def test_from_compiler():
+    compiler = Compiler(Parser("a := 1 b := a print b"))
+    compiler.compile()
+    program = Program.from_compiler(compiler)
+    assert program.global_names == ("a", "b")
+    assert program.global_slots == compiler.global_slots
+    assert program.line_table == compiler.line_table
+
+
+def test_compile_cache():
+    cache = CompileCache()
+    first = cache.compile("print 1 + 2", optimize=1)
+    assert cache.compile("print 1 + 2", optimize=1) is first
+    assert cache.compile("print 1 + 2") is not first
+    assert cache.stats == {"hits": 1, "misses": 2, "evictions": 0, "programs": 2,
+                           "bytes": 2 * len("print 1 + 2") + first.size + cache.compile("print 1 + 2").size}
+    assert run(first) == run(cache.compile("print 1 + 2")) == [Int(3)]
+
+
+def test_compile_cache_evicts_least_recently_used():
+    sources = [f"print {i}" for i in range(4)]
+    size = len(sources[0]) + Program.compile(sources[0]).size
+    cache = CompileCache(max_bytes=3 * size)
+    for source in sources[:3]:
+        cache.compile(source)
+    cache.compile(sources[0])
+    cache.compile(sources[3])
+    assert [source for source, _ in cache.programs] == [sources[2], sources[0], sources[3]]
+    assert cache.stats["evictions"] == 1
+    assert cache.stats["bytes"] == 3 * size
+
+    # A program bigger than the whole cache is compiled but not kept
+    cache.compile("print " + "1 + " * 100 + "1")
+    assert len(cache.programs) == 3
+
+
+def test_compile_cache_threads():
+    cache = CompileCache()
+    sources = [f"i := 0 while i < {n} i = i + 1 print i" for n in range(10)]
+    results = list()
+
+    def work():
+        for _ in range(20):
+            for n, source in enumerate(sources):
+                results.append(run(cache.compile(source, optimize=2)) == [Int(n)])
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(results) and len(results) == 800
+    stats = cache.stats
+    assert stats["programs"] == 10
+    assert stats["hits"] + stats["misses"] == 800
+    assert stats["misses"] >= 10
+
+
+def test_compile_cached():
+    assert compile_cached("print 5", optimize=3) is compile_cached("print 5", optimize=3)
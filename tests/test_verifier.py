@@ -0,0 +1,55 @@
+import pytest
+
+from scarab import Parser, Compiler, VM, Int
+from scarab.compiler import Op
+from scarab.verifier import VerifyError, verify
+
+PROGRAMS = [
+    "print 1 + 2 * 3",
+    "x := 0 while x < 5 do if x == 2 print x else print 0 - x x = x + 1 end",
+    "a := 1 b := 0 c := 2 print a and b or c",
+    "do x := y := 2 print x + y end",
+    "do i := 0 n := 9 while i < n do i = i + 1 print i + 2 end end",
+]
+
+
+@pytest.mark.parametrize("optimize", [0, 2, 3])
+@pytest.mark.parametrize("source", PROGRAMS)
+def test_compiled_code_verifies(source, optimize):
+    compiler = Compiler(Parser(source), optimize=optimize)
+    compiler.compile()
+    assert verify(compiler.code, compiler.constants) == compiler.max_stack
+
+
+@pytest.mark.parametrize("code, constants, offset, message", [
+    ([Op.TRUE, 0xff], [], 1, "Unknown opcode 255"),
+    ([Op.TRUE, Op.JUMP, 0], [], 1, "JUMP runs past the end"),
+    ([Op.JUMP, 0, 1, Op.CONSTANT, 0], [Int(1)], 0, "JUMP jumps to offset 4"),
+    ([Op.LOOP, 0, 4], [], 0, "LOOP jumps to offset -1"),
+    ([Op.CONSTANT, 1], [Int(1)], 0, "CONSTANT reads constant 1 of 1"),
+    ([Op.TRUE, Op.ADD], [], 1, "ADD needs 2 values on a stack of 1"),
+    ([Op.TRUE, Op.GET_LOCAL, 1], [], 1, "GET_LOCAL reads local slot 1 of a stack of 1"),
+    ([Op.TRUE, Op.SET_LOCAL, 2], [], 1, "SET_LOCAL sets local slot 2 of a stack of 1"),
+    ([Op.TRUE, Op.JUMP_IF_FALSE, 0, 1, Op.TRUE, Op.PRINT], [], 5, "Stack depth is"),
+])
+def test_errors(code, constants, offset, message):
+    with pytest.raises(VerifyError, match=message) as error:
+        verify(bytearray(code), constants)
+    assert error.value.offset == offset
+
+
+def test_unreachable_code_keeps_static_checks():
+    with pytest.raises(VerifyError, match="CONSTANT reads constant 0 of 0"):
+        verify(bytearray([Op.JUMP, 0, 2, Op.CONSTANT, 0]), [])
+    assert verify(bytearray([Op.JUMP, 0, 1, Op.POP]), []) == 0
+
+
+@pytest.mark.parametrize("source", PROGRAMS)
+def test_run_verified(source):
+    compiler = Compiler(Parser(source))
+    compiler.compile()
+    checked = VM(compiler.code, compiler.constants, capture=True)
+    checked.run()
+    vm = VM(compiler.code, compiler.constants, capture=True, verified=True)
+    vm.run()
+    assert vm.captured == checked.captured
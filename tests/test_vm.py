@@ -1,9 +1,18 @@
 import pytest
 
 from scarab import Parser, Compiler, VM, Int, String, Bool
+from scarab.compiler import Op, instructions
+from scarab.vm import ENGINES, Stack, StackUnderflow, predecode
 
 
-def test_add():
+@pytest.fixture(params=ENGINES)
+def engine(request, monkeypatch):
+    """Runs a test on each execution engine; tests that run programs ask for it"""
+    monkeypatch.setattr(VM, "engine", request.param)
+    return request.param
+
+
+def test_add(engine):
     compiler = Compiler(Parser("print 1 + 2"))
     compiler.compile()
     vm = VM(compiler.code, compiler.constants, capture=True)
@@ -11,7 +20,7 @@ def test_add():
     assert vm.captured[0] == Int(3)
 
 
-def test_order_operations():
+def test_order_operations(engine):
     compiler = Compiler(Parser("print 1 + 2 * 3"))
     compiler.compile()
     vm = VM(compiler.code, compiler.constants, capture=True)
@@ -19,7 +28,7 @@ def test_order_operations():
     assert vm.captured[0] == Int(7)
 
 
-def test_grouping():
+def test_grouping(engine):
     compiler = Compiler(Parser("print (1 + 2) * 3"))
     compiler.compile()
     vm = VM(compiler.code, compiler.constants, capture=True)
@@ -27,7 +36,7 @@ def test_grouping():
     assert vm.captured[0] == Int(9)
 
 
-def test_global_variables():
+def test_global_variables(engine):
     compiler = Compiler(Parser('''
     breakfast := "eggs"
     beverage := "coffee"
@@ -41,7 +50,7 @@ def test_global_variables():
     assert vm.captured[0] == String("eggs with coffee")
 
 
-def test_local_variables():
+def test_local_variables(engine):
     compiler = Compiler(Parser('''
     x := 5
     do
@@ -57,7 +66,7 @@ def test_local_variables():
     assert vm.captured[1] == Int(5)
 
 
-def test_out_of_scope():
+def test_out_of_scope(engine):
     with pytest.raises(NameError):
         compiler = Compiler(Parser('''
         do
@@ -70,7 +79,7 @@ def test_out_of_scope():
         vm.run()
 
 
-def test_unknown_local():
+def test_unknown_local(engine):
     with pytest.raises(NameError):
         compiler = Compiler(Parser('''
         do print x end
@@ -88,7 +97,7 @@ def test_unknown_local():
     'print 6 >= 6',
     'print 6 >= 5',
 ])
-def test_truthy(test_input):
+def test_truthy(engine, test_input):
     compiler = Compiler(Parser(test_input))
     compiler.compile()
     vm = VM(compiler.code, compiler.constants, capture=True)
@@ -96,7 +105,7 @@ def test_truthy(test_input):
     assert vm.captured[0] == Bool(True)
 
 
-def test_if_else():
+def test_if_else(engine):
     compiler = Compiler(Parser('''
     if 1 print "Yes"
     else print "No"
@@ -122,7 +131,7 @@ def test_if_else():
     ('print "yes" or ""', String("yes")),
     ('print "yes" and ""', String("")),
 ])
-def test_and_or(test_input, expected):
+def test_and_or(engine, test_input, expected):
     compiler = Compiler(Parser(test_input))
     compiler.compile()
     vm = VM(compiler.code, compiler.constants, capture=True)
@@ -130,7 +139,7 @@ def test_and_or(test_input, expected):
     assert vm.captured[0] == expected
 
 
-def test_multi_declare():
+def test_multi_declare(engine):
     compiler = Compiler(Parser('''
     x := y := 5
     print x
@@ -143,7 +152,7 @@ def test_multi_declare():
     assert vm.captured[1] == Int(5)
 
 
-def test_multi_assign():
+def test_multi_assign(engine):
     compiler = Compiler(Parser('''
     x := y := 5
     x = y = 100
@@ -157,7 +166,7 @@ def test_multi_assign():
     assert vm.captured[1] == Int(100)
 
 
-def test_multi_declare_local():
+def test_multi_declare_local(engine):
     compiler = Compiler(Parser('''
     do
       x := y := 2
@@ -173,7 +182,7 @@ def test_multi_declare_local():
     assert vm.captured[1] == Int(3)
 
 
-def test_while_loop():
+def test_while_loop(engine):
     compiler = Compiler(Parser('''
     x := 0
     while x < 10 do
@@ -186,3 +195,217 @@ def test_while_loop():
     vm.run()
     for i in range(10):
         assert vm.captured[i] == Int(i)
+
+
+def test_assign_after_expression(engine):
+    compiler = Compiler(Parser('''
+    x := 0
+    while x < 3 do x = x + 1 end
+    print x + 0
+    y := x
+    print y
+    '''))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    vm.run()
+    assert vm.captured == [Int(3), Int(3)]
+
+
+def test_wide_globals(engine):
+    names = [f"v{i}" for i in range(300)]
+    source = "\n".join(f"{name} := {i}" for i, name in enumerate(names))
+    source += f"\n{names[-1]} = {names[-1]} + {names[-2]}\nprint {names[-1]}"
+    compiler = Compiler(Parser(source))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    vm.run()
+    assert vm.captured[0] == Int(299 + 298)
+
+
+@pytest.mark.parametrize("source,expected", [
+    ("do i := 0 n := 5 while i < n do i = i + 1 end print i end", [Int(5)]),
+    ("do i := 0 while i < 3 do print i + 10 i = i + 1 end end", [Int(10), Int(11), Int(12)]),
+    ('do s := "a" while s < "aaa" do s = s + "a" end print s end', [String("aaa")]),
+    ("do i := 2 if i < 1 print 1 else print 0 end", [Int(0)]),
+])
+def test_superinstructions(engine, source, expected):
+    compiler = Compiler(Parser(source), optimize=3)
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    vm.run()
+    assert vm.captured == expected
+
+
+@pytest.mark.parametrize("source", [
+    'do s := "a" s = s + 1 end',
+    'do s := "a" print s + 1 end',
+    'do s := "a" if s < 1 print s end',
+])
+def test_superinstruction_errors(engine, source):
+    compiler = Compiler(Parser(source), optimize=3)
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    with pytest.raises(TypeError):
+        vm.run()
+
+
+def test_wide_locals(engine):
+    names = [f"v{i}" for i in range(300)]
+    source = "do " + " ".join(f"{name} := {i}" for i, name in enumerate(names))
+    source += f" {names[-1]} = {names[-1]} + {names[1]} print {names[-1]} end"
+    compiler = Compiler(Parser(source))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    vm.run()
+    assert vm.captured[0] == Int(299 + 1)
+
+
+def test_stack_grows(engine):
+    stack = Stack(1)
+    for i in range(3):
+        stack.push(i)
+    stack[3] = 3
+    assert list(stack) == [0, 1, 2, 3]
+    assert [stack.pop() for _ in range(4)] == [3, 2, 1, 0]
+    with pytest.raises(StackUnderflow):
+        stack.pop()
+
+    compiler = Compiler(Parser("do x := y := 2 print x + y * 3 end"))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True, max_stack=0)
+    vm.run()
+    assert vm.captured == [Int(8)]
+
+
+def test_global_slots(engine):
+    compiler = Compiler(Parser("a := 1 b := a + 1 a = b * 3"))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, global_slots=compiler.global_slots)
+    vm.run()
+    assert vm.table == {"a": Int(6), "b": Int(2)}
+
+
+def test_undefined_global_name(engine):
+    compiler = Compiler(Parser("a := 1 print a + b"))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, global_slots=compiler.global_slots, capture=True)
+    with pytest.raises(NameError, match="b"):
+        vm.run()
+    assert vm.table == {"a": Int(1)}
+
+
+@pytest.mark.parametrize("source", ["", "1", "do end", "(1 or 2)"])
+def test_empty_program(engine, source):
+    compiler = Compiler(Parser(source), optimize=2)
+    compiler.compile()
+    assert compiler.code == bytearray()
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    vm.run()
+    assert vm.captured == []
+
+
+def test_closure_ip_at_failing_instruction():
+    compiler = Compiler(Parser("x := 0 i := 3 while 1 < 2 do x = x + 1 i = i - 1 print 10 / i end"))
+    compiler.compile()
+    ips = list()
+    for engine in ("decoded", "closure"):
+        vm = VM(compiler.code, compiler.constants, capture=True, engine=engine)
+        with pytest.raises(ZeroDivisionError):
+            vm.run()
+        ips.append(vm.ip)
+    assert ips[0] == ips[1]
+    assert compiler.code[ips[1]] == Op.DIV
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        VM(bytearray(), [], engine="nope")
+
+
+def test_trace(engine, capsys):
+    compiler = Compiler(Parser("print 1 + 2"))
+    compiler.compile()
+    VM(compiler.code, compiler.constants, trace=True, capture=True).run()
+    assert capsys.readouterr().out.splitlines() == [
+        "CONSTANT ",
+        "CONSTANT [ 1 ]",
+        "ADD [ 1 ][ 2 ]",
+        "PRINT [ 3 ]",
+    ]
+
+
+def test_trace_sink(engine, capsys):
+    compiler = Compiler(Parser("x := 0 while x < 2 x = x + 1"), optimize=2)
+    compiler.compile()
+    lines = list()
+    VM(compiler.code, compiler.constants, trace=lines.append, capture=True).run()
+    assert capsys.readouterr().out == ""
+    assert lines[:3] == ["CONSTANT ", "DEFINE_GLOBAL [ 0 ]", "POP [ 0 ]"]
+    match_lines = list()
+    VM(compiler.code, compiler.constants, trace=match_lines.append, capture=True, engine="match").run()
+    assert len(lines) == len(match_lines)
+
+
+def test_predecode():
+    compiler = Compiler(Parser("x := 0 while x < 3 x = x + 1"), optimize=2)
+    compiler.compile()
+    decoded = predecode(compiler.code, compiler.constants)
+    assert decoded.ops == (
+        Op.CONSTANT, Op.DEFINE_GLOBAL, Op.POP,
+        Op.GET_GLOBAL, Op.CONSTANT, Op.LESS, Op.POP_JUMP_IF_FALSE,
+        Op.GET_GLOBAL, Op.CONSTANT, Op.ADD, Op.SET_GLOBAL, Op.POP, Op.JUMP,
+    )
+    assert decoded.args == (Int(0), 0, None, 0, Int(3), None, 13, 0, Int(1), None, 0, None, 3)
+    assert decoded.offsets[:4] == (0, 2, 4, 5)
+
+
+def test_predecode_wide_constants():
+    compiler = Compiler(Parser(" ".join(f"print {i}" for i in range(300))))
+    compiler.compile()
+    decoded = predecode(compiler.code, compiler.constants)
+    assert decoded.ops[-2:] == (Op.CONSTANT, Op.PRINT)
+    assert decoded.args[-2] == Int(299)
+
+
+def test_reuse_decoded():
+    compiler = Compiler(Parser("print 1 + 2"))
+    compiler.compile()
+    decoded = predecode(compiler.code, compiler.constants)
+    for _ in range(2):
+        vm = VM(compiler.code, compiler.constants, capture=True, engine="decoded", decoded=decoded)
+        vm.run()
+        assert vm.captured == [Int(3)]
+
+
+def test_closure_blocks():
+    compiler = Compiler(Parser("i := 0 while i < 3 i = i + 1 print i"))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True)
+    # Before the loop, its condition, its body and the print after it
+    assert len(vm.compile_closures(list())) == 4
+    vm.run_closure()
+    assert vm.captured == [Int(3)]
+
+
+def test_specialize_and_deoptimize():
+    compiler = Compiler(Parser('''
+    i := 0
+    a := 1
+    while i < 40 do
+      if i == 10 a = "x"
+      print a + a
+      i = i + 1
+    end
+    '''))
+    compiler.compile()
+    vm = VM(compiler.code, compiler.constants, capture=True, engine="adaptive")
+    vm.run()
+    assert vm.captured == [Int(2)] * 10 + [String("xx")] * 30
+    stats = vm.specialization_stats
+    assert stats["LESS_INT_INT"]["misses"] == 0
+    assert stats["ADD_INT_INT"]["quickened"] == 2
+    assert stats["ADD_INT_INT"]["misses"] == 1
+    assert stats["ADD_STR_STR"]["quickened"] == 1
+    assert stats["ADD_STR_STR"]["hits"] > 0
+    # The caller's code is never rewritten
+    assert all(op < Op.ADD_INT_INT for _, op in instructions(vm.code))